@@ -1,38 +1,88 @@
+import asyncio
+import time
 import bcrypt
 import jwt
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone, timedelta
-from fastapi import HTTPException, Depends
+from typing import Dict, Optional
+from fastapi import HTTPException, Depends, Query
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from database import db
-from config import JWT_SECRET, JWT_ALGORITHM, JWT_EXPIRATION_HOURS
+from config import (
+    JWT_SECRET, JWT_ALGORITHM, JWT_EXPIRATION_HOURS, BCRYPT_ROUNDS, AUTH_CACHE_TTL_SECONDS,
+    PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE_DEPTH, PASSWORD_HASH_RETRY_AFTER_SECONDS,
+)
+from services.cache_service import user_cache, role_cache
 
 security = HTTPBearer()
 
+# bcrypt releases the GIL, so these threads hash in parallel without blocking the event loop
+_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+_hash_in_flight = 0
 
-def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
 
+def _hash(password: str) -> str:
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode('utf-8')
 
-def verify_password(password: str, hashed: str) -> bool:
+
+def _check(password: str, hashed: str) -> bool:
     return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
 
 
-def create_token(user_id: str, email: str, role_id: str = None) -> str:
+async def _run_bcrypt(fn, *args):
+    """Run `fn` on the hashing threads; 503 when the workers and the queue are full"""
+    global _hash_in_flight
+    if _hash_in_flight >= PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE_DEPTH:
+        raise HTTPException(status_code=503, detail="Hay demasiados inicios de sesión en proceso, intente de nuevo en unos segundos",
+                            headers={"Retry-After": str(PASSWORD_HASH_RETRY_AFTER_SECONDS)})
+    _hash_in_flight += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_hash_executor, fn, *args)
+    finally:
+        _hash_in_flight -= 1
+
+
+async def hash_password(password: str) -> str:
+    return await _run_bcrypt(_hash, password)
+
+
+async def verify_password(password: str, hashed: str) -> bool:
+    return await _run_bcrypt(_check, password, hashed)
+
+
+def needs_rehash(hashed: str) -> bool:
+    """Whether `hashed` was made with another work factor than BCRYPT_ROUNDS"""
+    try:
+        return int(hashed.split("$")[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+
+def create_token(user_id: str, email: str, role_id: str = None, company_id: str = None,
+                 role: Optional[dict] = None) -> str:
+    """`role`, when given, is embedded so authorization needs no role lookup while it is current"""
     payload = {
         "user_id": user_id,
         "email": email,
         "role_id": role_id,
+        "company_id": company_id,
         "exp": datetime.now(timezone.utc) + timedelta(hours=JWT_EXPIRATION_HOURS)
     }
+    if role:
+        payload.update(role_name=role.get("name"), permissions=role.get("permissions", []),
+                       role_version=role.get("version", 0))
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+async def user_from_token(token: str) -> dict:
     try:
-        payload = jwt.decode(credentials.credentials, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        user = await db.users.find_one({"id": payload["user_id"]}, {"_id": 0})
+        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        user = await get_user(payload["user_id"])
         if not user:
             raise HTTPException(status_code=401, detail="Usuario no encontrado")
+        if "permissions" in payload:
+            user["token_role"] = {"id": payload["role_id"], "name": payload["role_name"],
+                                  "permissions": payload["permissions"], "version": payload["role_version"]}
         return user
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expirado")
@@ -40,9 +90,80 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         raise HTTPException(status_code=401, detail="Token inválido")
 
 
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    return await user_from_token(credentials.credentials)
+
+
+async def get_stream_user(token: str = Query(...)):
+    """For EventSource clients, which cannot send an Authorization header"""
+    return await user_from_token(token)
+
+
+async def get_user(user_id: str):
+    """User document by id, served from the in-process cache when fresh"""
+    user = user_cache.get(user_id)
+    if user is None:
+        user = await db.users.find_one({"id": user_id}, {"_id": 0, "password": 0})
+        if user:
+            user_cache.set(user_id, user)
+    return user
+
+
+async def get_role(role_id: str):
+    """Role document by id, served from the in-process cache when fresh"""
+    if not role_id:
+        return None
+    role = role_cache.get(role_id)
+    if role is None:
+        role = await db.roles.find_one({"id": role_id}, {"_id": 0})
+        if role:
+            role_cache.set(role_id, role)
+    return role
+
+
+# ==================== ROLE CLAIMS ====================
+
+_role_versions: Dict[str, int] = {}
+_role_versions_expire = 0.0
+
+
+async def role_version(role_id: str) -> Optional[int]:
+    """Current version of a role; the versions of every role are reloaded in one query once per TTL"""
+    global _role_versions, _role_versions_expire
+    if time.monotonic() >= _role_versions_expire:
+        _role_versions = {role["id"]: role.get("version", 0)
+                          async for role in db.roles.find({}, {"_id": 0, "id": 1, "version": 1})}
+        _role_versions_expire = time.monotonic() + AUTH_CACHE_TTL_SECONDS
+    return _role_versions.get(role_id)
+
+
+def invalidate_role_versions():
+    global _role_versions_expire
+    _role_versions_expire = 0.0
+
+
+async def get_user_role(user: dict) -> Optional[dict]:
+    """The user's role: the token claims while the user keeps that role and it is unchanged, else the role document"""
+    claims = user.get("token_role")
+    if claims and claims["id"] and claims["id"] == user.get("role_id") \
+            and await role_version(claims["id"]) == claims["version"]:
+        return claims
+    return await get_role(user.get("role_id"))
+
+
+async def has_permission(user: dict, permission: str) -> bool:
+    role = await get_user_role(user)
+    permissions = role.get("permissions", []) if role else []
+    return permission in permissions or "admin" in permissions
+
+
+async def is_solicitante(user: dict) -> bool:
+    """Solicitantes only see the tickets they created"""
+    role = await get_user_role(user)
+    return bool(role) and role.get("name") == "Solicitante"
+
+
 async def check_permission(user: dict, permission: str):
-    if user.get("role_id"):
-        role = await db.roles.find_one({"id": user["role_id"]}, {"_id": 0})
-        if role and (permission in role.get("permissions", []) or "admin" in role.get("permissions", [])):
-            return True
+    if await has_permission(user, permission):
+        return True
     raise HTTPException(status_code=403, detail="No tiene permisos para esta acción")
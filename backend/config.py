@@ -1,4 +1,6 @@
+import json
 import os
+import tempfile
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -8,10 +10,38 @@ load_dotenv(ROOT_DIR / '.env')
 MONGO_URL = os.environ['MONGO_URL']
 DB_NAME = os.environ['DB_NAME']
 
+# Connection pool per process (multiply by the uvicorn worker count for the server-side total);
+# MONGO_MIN_POOL_SIZE connections are opened at startup and kept open
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', '100'))
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', '5'))
+MONGO_MAX_IDLE_TIME_MS = int(os.environ.get('MONGO_MAX_IDLE_TIME_MS', '300000'))
+# Timeouts in milliseconds; 0 disables the socket and pool wait limits
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000'))
+MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', '10000'))
+MONGO_SOCKET_TIMEOUT_MS = int(os.environ.get('MONGO_SOCKET_TIMEOUT_MS', '0'))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', '0'))
+# Wire compressors in order of preference; zstd and snappy are skipped when
+# the zstandard / python-snappy packages are not installed
+MONGO_COMPRESSORS = [name.strip() for name in os.environ.get('MONGO_COMPRESSORS', 'zstd,snappy,zlib').split(',') if name.strip()]
+MONGO_APP_NAME = os.environ.get('MONGO_APP_NAME', 'inventario-ti-api')
+# Read preference of reports, the advanced dashboard and the scheduled notifications
+# (primary, primaryPreferred, secondary, secondaryPreferred, nearest), and how far behind the
+# primary a secondary may be to serve them (at least 90; -1: no limit). Ignored for `primary`.
+MONGO_REPORT_READ_PREFERENCE = os.environ.get('MONGO_REPORT_READ_PREFERENCE', 'secondaryPreferred')
+MONGO_REPORT_MAX_STALENESS_SECONDS = int(os.environ.get('MONGO_REPORT_MAX_STALENESS_SECONDS', '90'))
+
 JWT_SECRET = os.environ.get('JWT_SECRET', 'inventario-ti-secret-key-2024')
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION_HOURS = 24
 
+# bcrypt work factor (4-31, each step doubles the cost); older hashes are upgraded at login.
+# Hashing runs on PASSWORD_HASH_WORKERS threads with PASSWORD_HASH_QUEUE_DEPTH more waiting;
+# further logins get a 503 with Retry-After
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', '12'))
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', '2'))
+PASSWORD_HASH_QUEUE_DEPTH = int(os.environ.get('PASSWORD_HASH_QUEUE_DEPTH', '32'))
+PASSWORD_HASH_RETRY_AFTER_SECONDS = int(os.environ.get('PASSWORD_HASH_RETRY_AFTER_SECONDS', '2'))
+
 RESEND_API_KEY = os.environ.get('RESEND_API_KEY', '')
 SENDER_EMAIL = os.environ.get('SENDER_EMAIL', 'onboarding@resend.dev')
 
@@ -21,3 +51,56 @@ PAC_API_SECRET = os.environ.get('PAC_API_SECRET', '')
 PAC_SANDBOX = os.environ.get('PAC_SANDBOX', 'true').lower() == 'true'
 
 CORS_ORIGINS = os.environ.get('CORS_ORIGINS', '*').split(',')
+
+# In-process cache for users/roles looked up on every authenticated request
+AUTH_CACHE_TTL_SECONDS = float(os.environ.get('AUTH_CACHE_TTL_SECONDS', '30'))
+AUTH_CACHE_MAX_ENTRIES = int(os.environ.get('AUTH_CACHE_MAX_ENTRIES', '1024'))
+
+# PDF rendering worker processes and how many report requests may wait for one
+REPORT_WORKERS = int(os.environ.get('REPORT_WORKERS', '2'))
+REPORT_QUEUE_DEPTH = int(os.environ.get('REPORT_QUEUE_DEPTH', '8'))
+REPORT_RETRY_AFTER_SECONDS = int(os.environ.get('REPORT_RETRY_AFTER_SECONDS', '10'))
+
+# Company logos printed in PDF headers, shared on disk by the report workers
+LOGO_CACHE_DIR = os.environ.get('LOGO_CACHE_DIR', str(Path(tempfile.gettempdir()) / 'inventario_logos'))
+LOGO_CACHE_TTL_SECONDS = float(os.environ.get('LOGO_CACHE_TTL_SECONDS', '3600'))
+LOGO_NEGATIVE_TTL_SECONDS = float(os.environ.get('LOGO_NEGATIVE_TTL_SECONDS', '300'))
+LOGO_FETCH_TIMEOUT_SECONDS = float(os.environ.get('LOGO_FETCH_TIMEOUT_SECONDS', '5'))
+
+# Notification email outbox: background senders per worker process, provider quota (shared by
+# all worker processes) and retries
+EMAIL_WORKERS = int(os.environ.get('EMAIL_WORKERS', '4'))
+EMAIL_RATE_PER_SECOND = float(os.environ.get('EMAIL_RATE_PER_SECOND', '2'))
+EMAIL_MAX_ATTEMPTS = int(os.environ.get('EMAIL_MAX_ATTEMPTS', '5'))
+EMAIL_RETRY_BASE_SECONDS = float(os.environ.get('EMAIL_RETRY_BASE_SECONDS', '30'))
+# Messages per call to the Resend batch API (the provider accepts at most 100)
+EMAIL_BATCH_SIZE = int(os.environ.get('EMAIL_BATCH_SIZE', '100'))
+
+# Companies whose scheduled notifications are prepared at the same time
+NOTIFICATION_CONCURRENCY = int(os.environ.get('NOTIFICATION_CONCURRENCY', '8'))
+
+# Conditional GETs (ETag / 304) on polled endpoints, see services/http_cache_service.py
+CACHE_VERSION_SYNC_SECONDS = float(os.environ.get('CACHE_VERSION_SYNC_SECONDS', '2'))
+CACHE_ETAG_SALT = os.environ.get('CACHE_ETAG_SALT', '')
+CACHE_PUBLIC_MAX_AGE_SECONDS = int(os.environ.get('CACHE_PUBLIC_MAX_AGE_SECONDS', '60'))
+# Seconds a tenant's browser may reuse a response without revalidating (0: always revalidate),
+# with per-company overrides as JSON, e.g. {"<company_id>": 30}
+CACHE_PRIVATE_MAX_AGE_SECONDS = int(os.environ.get('CACHE_PRIVATE_MAX_AGE_SECONDS', '0'))
+CACHE_MAX_AGE_BY_COMPANY = json.loads(os.environ.get('CACHE_MAX_AGE_BY_COMPANY', '{}'))
+
+# Alert stream (/notifications/stream): how often it re-reads the feed for changes made by other workers
+ALERT_STREAM_POLL_SECONDS = float(os.environ.get('ALERT_STREAM_POLL_SECONDS', '15'))
+
+# Event stream (/events/stream): comment line sent after this much silence to keep proxies from closing it
+EVENT_STREAM_KEEPALIVE_SECONDS = float(os.environ.get('EVENT_STREAM_KEEPALIVE_SECONDS', '15'))
+# How long an EventSource waits before reconnecting
+EVENT_STREAM_RETRY_MS = int(os.environ.get('EVENT_STREAM_RETRY_MS', '5000'))
+# How events reach the streams of every worker: `mongo` (capped `server_events` collection
+# tailed by each worker) or `local` (this process only, for a single worker)
+EVENT_TRANSPORT = os.environ.get('EVENT_TRANSPORT', 'mongo')
+EVENT_LOG_SIZE_BYTES = int(os.environ.get('EVENT_LOG_SIZE_BYTES', str(16 * 1024 * 1024)))
+
+# Only the worker holding the scheduler lease runs scheduled jobs; it renews the lease every
+# SCHEDULER_LEASE_RENEW_SECONDS, and another worker takes over once it is this old
+SCHEDULER_LEASE_TTL_SECONDS = float(os.environ.get('SCHEDULER_LEASE_TTL_SECONDS', '30'))
+SCHEDULER_LEASE_RENEW_SECONDS = float(os.environ.get('SCHEDULER_LEASE_RENEW_SECONDS', '10'))
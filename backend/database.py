@@ -1,5 +1,269 @@
+import asyncio
+import importlib.util
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, Iterable, List, Optional
+from pymongo import ReadPreference, monitoring
+from pymongo.read_preferences import make_read_preference, read_pref_mode_from_name
 from motor.motor_asyncio import AsyncIOMotorClient
-from config import MONGO_URL, DB_NAME
+from config import (
+    MONGO_URL, DB_NAME, MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE, MONGO_MAX_IDLE_TIME_MS,
+    MONGO_SERVER_SELECTION_TIMEOUT_MS, MONGO_CONNECT_TIMEOUT_MS, MONGO_SOCKET_TIMEOUT_MS,
+    MONGO_WAIT_QUEUE_TIMEOUT_MS, MONGO_COMPRESSORS, MONGO_APP_NAME, MONGO_REPORT_READ_PREFERENCE,
+    MONGO_REPORT_MAX_STALENESS_SECONDS,
+)
 
-client = AsyncIOMotorClient(MONGO_URL)
+
+# Follow-up batches of an already counted query, not new queries
+_CURSOR_COMMANDS = {"getMore", "killCursors", "endSessions"}
+
+
+class QueryCounter:
+    """Mutable per-request counter of commands sent to MongoDB"""
+
+    def __init__(self):
+        self.count = 0
+        self.by_command = {}
+
+    def record(self, command_name: str):
+        self.by_command[command_name] = self.by_command.get(command_name, 0) + 1
+        if command_name not in _CURSOR_COMMANDS:
+            self.count += 1
+
+
+# Motor copies the current context into its executor threads, so the listener
+# below sees the counter that the request middleware installed.
+query_counter: ContextVar[Optional[QueryCounter]] = ContextVar("query_counter", default=None)
+
+
+class _QueryCountListener(monitoring.CommandListener):
+    def started(self, event):
+        counter = query_counter.get()
+        if counter is not None:
+            counter.record(event.command_name)
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+# Commands that modify documents; each one bumps the version of its collection
+_WRITE_COMMANDS = {"insert", "update", "delete", "findAndModify"}
+
+
+class CollectionVersions:
+    """Write counters per collection, used as HTTP cache validators.
+
+    `shared` holds the counters last read from the `cache_versions` collection, `pending` the
+    writes this process made since; services/http_cache_service.py publishes and reloads them.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.shared: Dict[str, int] = {}
+        self.pending: Dict[str, int] = {}
+
+    def bump(self, collection: str):
+        with self._lock:
+            self.pending[collection] = self.pending.get(collection, 0) + 1
+
+    def tags(self, collections: Iterable[str], process_id: str) -> List[str]:
+        """One tag per collection; unpublished writes make the tag specific to this process"""
+        tags = []
+        with self._lock:
+            for name in collections:
+                tag = f"{name}:{self.shared.get(name, 0)}"
+                if name in self.pending:
+                    tag += f"+{process_id}.{self.pending[name]}"
+                tags.append(tag)
+        return tags
+
+    def take_pending(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.pending)
+
+    def synced(self, shared: Dict[str, int], published: Dict[str, int]):
+        """Install the shared counters read after `published` writes were added to them"""
+        with self._lock:
+            self.shared = shared
+            for name, count in published.items():
+                left = self.pending.get(name, 0) - count
+                if left > 0:
+                    self.pending[name] = left
+                else:
+                    self.pending.pop(name, None)
+
+
+collection_versions = CollectionVersions()
+
+
+class _WriteListener(monitoring.CommandListener):
+    """Bump the collection version once a write finished (a failed one may have applied partially)"""
+
+    def __init__(self):
+        self._writes = {}
+
+    def started(self, event):
+        if event.command_name in _WRITE_COMMANDS:
+            self._writes[event.request_id] = event.command.get(event.command_name)
+
+    def succeeded(self, event):
+        self._finished(event)
+
+    def failed(self, event):
+        self._finished(event)
+
+    def _finished(self, event):
+        collection = self._writes.pop(event.request_id, None)
+        if collection:
+            collection_versions.bump(collection)
+
+
+# Checkouts run on the driver's executor threads; start times are keyed by thread
+_checkout_started: Dict[int, float] = {}
+
+
+class _PoolListener(monitoring.ConnectionPoolListener):
+    """Connection counts and checkout waits per server, for /diagnostics/pool"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._servers: Dict[str, dict] = {}
+
+    def _server(self, address) -> dict:
+        name = f"{address[0]}:{address[1]}"
+        if name not in self._servers:
+            self._servers[name] = {"open": 0, "in_use": 0, "checkouts": 0, "checkout_failures": 0,
+                                   "wait_ms_total": 0.0, "wait_ms_max": 0.0, "cleared": 0}
+        return self._servers[name]
+
+    def _count(self, address, **deltas):
+        with self._lock:
+            server = self._server(address)
+            for key, delta in deltas.items():
+                server[key] += delta
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._count(event.address, cleared=1)
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._count(event.address, open=1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._count(event.address, open=-1)
+
+    def connection_check_out_started(self, event):
+        _checkout_started[threading.get_ident()] = time.monotonic()
+
+    def connection_check_out_failed(self, event):
+        _checkout_started.pop(threading.get_ident(), None)
+        self._count(event.address, checkout_failures=1)
+
+    def connection_checked_out(self, event):
+        started = _checkout_started.pop(threading.get_ident(), None)
+        waited = (time.monotonic() - started) * 1000 if started is not None else 0.0
+        with self._lock:
+            server = self._server(event.address)
+            server["in_use"] += 1
+            server["checkouts"] += 1
+            server["wait_ms_total"] += waited
+            server["wait_ms_max"] = max(server["wait_ms_max"], waited)
+
+    def connection_checked_in(self, event):
+        self._count(event.address, in_use=-1)
+
+    def stats(self) -> List[dict]:
+        with self._lock:
+            servers = [(name, dict(server)) for name, server in sorted(self._servers.items())]
+        result = []
+        for name, server in servers:
+            checkouts = server.pop("checkouts")
+            wait_total = server.pop("wait_ms_total")
+            result.append({
+                "address": name,
+                **server,
+                "idle": server["open"] - server["in_use"],
+                "checkouts": checkouts,
+                "wait_ms_avg": round(wait_total / checkouts, 3) if checkouts else 0.0,
+                "wait_ms_max": round(server["wait_ms_max"], 3),
+            })
+        return result
+
+
+pool_listener = _PoolListener()
+
+# Python packages the optional wire compressors need (zlib is always available)
+_COMPRESSOR_MODULES = {"zstd": "zstandard", "snappy": "snappy"}
+
+
+def available_compressors(names: Iterable[str]) -> List[str]:
+    return [name for name in names
+            if name not in _COMPRESSOR_MODULES or importlib.util.find_spec(_COMPRESSOR_MODULES[name]) is not None]
+
+
+def client_options() -> dict:
+    """Keyword arguments of the Motor client, from the MONGO_* settings in config.py"""
+    options = {
+        "appname": MONGO_APP_NAME,
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": MONGO_MAX_IDLE_TIME_MS,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "connectTimeoutMS": MONGO_CONNECT_TIMEOUT_MS,
+    }
+    if MONGO_SOCKET_TIMEOUT_MS:
+        options["socketTimeoutMS"] = MONGO_SOCKET_TIMEOUT_MS
+    if MONGO_WAIT_QUEUE_TIMEOUT_MS:
+        options["waitQueueTimeoutMS"] = MONGO_WAIT_QUEUE_TIMEOUT_MS
+    compressors = available_compressors(MONGO_COMPRESSORS)
+    if compressors:
+        options["compressors"] = ",".join(compressors)
+    return options
+
+
+client = AsyncIOMotorClient(MONGO_URL, event_listeners=[_QueryCountListener(), _WriteListener(), pool_listener],
+                            **client_options())
 db = client[DB_NAME]
+
+
+def reporting_read_preference():
+    mode = read_pref_mode_from_name(MONGO_REPORT_READ_PREFERENCE)
+    if mode == ReadPreference.PRIMARY.mode:
+        return ReadPreference.PRIMARY
+    return make_read_preference(mode, None, MONGO_REPORT_MAX_STALENESS_SECONDS)
+
+
+# Long scans and aggregations (reports, advanced dashboard, scheduled notifications) that can
+# read slightly stale data; with a replica set they run on secondaries and leave the primary
+# to the writes. Anything read back right after a write belongs on `db`.
+reporting_db = client.get_database(DB_NAME, read_preference=reporting_read_preference())
+
+
+async def warm_up_pool():
+    """Open MONGO_MIN_POOL_SIZE connections now rather than on the first requests"""
+    await asyncio.gather(*(client.admin.command("ping") for _ in range(max(MONGO_MIN_POOL_SIZE, 1))))
+
+
+def pool_stats() -> dict:
+    return {
+        "max_pool_size": MONGO_MAX_POOL_SIZE,
+        "min_pool_size": MONGO_MIN_POOL_SIZE,
+        "compressors": available_compressors(MONGO_COMPRESSORS),
+        "reporting_read_preference": reporting_db.read_preference.document,
+        "servers": pool_listener.stats(),
+    }
@@ -1,5 +1,7 @@
 import uuid
-from datetime import datetime, timezone
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Optional, Type
+from pydantic import BaseModel
 
 
 def generate_id() -> str:
@@ -10,6 +12,44 @@ def now_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
 
 
+def as_utc(value: datetime) -> datetime:
+    """Mongo returns naive datetimes, which are UTC"""
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+
+def parse_iso(value) -> Optional[datetime]:
+    """UTC datetime from ISO 8601 text (a date alone is its midnight); None if blank or invalid"""
+    if isinstance(value, datetime):
+        return as_utc(value)
+    try:
+        return as_utc(datetime.fromisoformat(value.replace("Z", "+00:00")))
+    except (AttributeError, ValueError):
+        return None
+
+
+def iso(value) -> str:
+    """ISO 8601 text of a stored date; text stored before dates were BSON passes through"""
+    if isinstance(value, datetime):
+        return as_utc(value).isoformat()
+    return value or ""
+
+
+def days_window(day: date, days: int) -> dict:
+    """Mongo range over BSON dates from the start of `day` to the end of `day + days`"""
+    start = datetime.combine(day, time.min, tzinfo=timezone.utc)
+    return {"$gte": start, "$lt": start + timedelta(days=days + 1)}
+
+
+def days_until(value: datetime, day: date) -> int:
+    """Calendar days (UTC) from `day` to `value`"""
+    return (as_utc(value).date() - day).days
+
+
+def projection(model: Type[BaseModel], *extra: str) -> dict:
+    """Mongo projection of the fields `model` returns, plus `extra` fields read by joins and checks"""
+    return {"_id": 0, **{field: 1 for field in model.model_fields}, **{field: 1 for field in extra}}
+
+
 def sanitize_text(text: str) -> str:
     """Sanitize text for PDF - replace special Unicode characters"""
     if not text:
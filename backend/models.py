@@ -1,5 +1,16 @@
-from pydantic import BaseModel, Field, EmailStr, ConfigDict
-from typing import List, Optional, Dict, Any
+from datetime import datetime
+from pydantic import BaseModel, Field, EmailStr, ConfigDict, BeforeValidator, AfterValidator, PlainSerializer
+from typing import List, Optional, Dict, Any, Generic, TypeVar, Annotated
+from helpers import as_utc
+
+
+# Stored as a BSON date (UTC) and returned as ISO 8601 text; blank input means no date
+IsoDatetime = Annotated[
+    Optional[datetime],
+    BeforeValidator(lambda value: value or None),
+    AfterValidator(lambda value: as_utc(value) if value else None),
+    PlainSerializer(lambda value: value.isoformat() if value else None, return_type=Optional[str], when_used="json"),
+]
 
 
 # ==================== AUTH MODELS ====================
@@ -357,7 +368,7 @@ class ExternalServiceCreate(BaseModel):
     description: Optional[str] = None
     cost: Optional[float] = None
     start_date: str
-    renewal_date: Optional[str] = None
+    renewal_date: IsoDatetime = None
     payment_frequency: Optional[str] = None
     credentials_info: Optional[str] = None
     custom_fields: Optional[Dict[str, Any]] = None
@@ -372,7 +383,7 @@ class ExternalServiceResponse(BaseModel):
     description: Optional[str] = None
     cost: Optional[float] = None
     start_date: str
-    renewal_date: Optional[str] = None
+    renewal_date: IsoDatetime = None
     payment_frequency: Optional[str] = None
     credentials_info: Optional[str] = None
     custom_fields: Optional[Dict[str, Any]] = None
@@ -429,6 +440,7 @@ class QuotationCreate(BaseModel):
     valid_days: int = 30
     uso_cfdi: Optional[str] = None
     custom_fields: Optional[Dict[str, Any]] = None
+    quotation_number: Optional[str] = None  # previously reserved number (batch imports)
 
 class QuotationResponse(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -466,6 +478,7 @@ class InvoiceCreate(BaseModel):
     client_regimen_fiscal: Optional[str] = None
     client_codigo_postal: Optional[str] = None
     serie: Optional[str] = None
+    folio: Optional[str] = None  # previously reserved folio (batch imports)
     uso_cfdi: str = "G03"
     metodo_pago: str = "PUE"
     forma_pago: str = "03"
@@ -514,6 +527,14 @@ class InvoiceResponse(BaseModel):
     custom_fields: Optional[Dict[str, Any]] = None
     created_at: str
 
+class NumberReservation(BaseModel):
+    company_id: str
+    serie: Optional[str] = None
+    count: int = Field(ge=1, le=1000)
+
+class NumberReservationResponse(BaseModel):
+    numbers: List[str]
+
 
 # ==================== NOTIFICATION REQUEST MODELS ====================
 
@@ -582,3 +603,12 @@ class TicketCommentResponse(BaseModel):
     author_id: Optional[str] = None
     author_name: Optional[str] = None
     created_at: str
+
+
+# ==================== PAGINATION MODELS ====================
+
+T = TypeVar("T")
+
+class Page(BaseModel, Generic[T]):
+    items: List[T]
+    next_cursor: Optional[str] = None
@@ -9,6 +9,8 @@ from .config_routes import router as config_router
 from .report_routes import router as report_router
 from .notification_routes import router as notification_router
 from .ticket_routes import router as ticket_router
+from .diagnostics_routes import router as diagnostics_router
+from .events_routes import router as events_router
 
 api_router = APIRouter(prefix="/api")
 
@@ -22,3 +24,5 @@ api_router.include_router(config_router)
 api_router.include_router(report_router)
 api_router.include_router(notification_router)
 api_router.include_router(ticket_router)
+api_router.include_router(diagnostics_router)
+api_router.include_router(events_router)
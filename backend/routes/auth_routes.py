@@ -1,67 +1,68 @@
 from fastapi import APIRouter, HTTPException, Depends
 from typing import List
+from pymongo.errors import DuplicateKeyError
 from database import db
-from auth import get_current_user, hash_password, verify_password, create_token, check_permission
+from auth import (
+    get_current_user, hash_password, verify_password, needs_rehash, create_token, check_permission, get_role,
+    invalidate_role_versions,
+)
 from models import (
     UserCreate, UserLogin, UserResponse, TokenResponse,
     RoleCreate, RoleResponse
 )
 from helpers import generate_id, now_iso
+from services.resolver_service import Ref, resolve_refs
+from services.cache_service import user_cache, role_cache
 
 router = APIRouter()
 
+USER_REFS = (
+    Ref("role_id", "roles", {"role_name": "name"}),
+    Ref("company_id", "companies", {"company_name": "name"}),
+)
+
+
+def _user_response(user: dict) -> UserResponse:
+    return UserResponse(
+        id=user["id"], email=user["email"], name=user["name"],
+        role_id=user.get("role_id"), role_name=user.get("role_name"),
+        company_id=user.get("company_id"), company_name=user.get("company_name"),
+        assigned_equipment_ids=user.get("assigned_equipment_ids", []),
+        is_active=user.get("is_active", True), created_at=user["created_at"]
+    )
+
+
+async def _rehash_password(user: dict, password: str):
+    """Upgrade a hash made with another BCRYPT_ROUNDS; skipped when hashing is saturated"""
+    try:
+        new_hash = await hash_password(password)
+    except HTTPException:
+        return
+    # Matching on the old hash leaves a password changed meanwhile untouched
+    await db.users.update_one({"id": user["id"], "password": user["password"]}, {"$set": {"password": new_hash}})
+
 
 @router.post("/auth/login", response_model=TokenResponse)
 async def login(credentials: UserLogin):
     user = await db.users.find_one({"email": credentials.email}, {"_id": 0})
-    if not user or not verify_password(credentials.password, user["password"]):
+    if not user or not await verify_password(credentials.password, user["password"]):
         raise HTTPException(status_code=401, detail="Credenciales inválidas")
     if not user.get("is_active", True):
         raise HTTPException(status_code=401, detail="Usuario desactivado")
+    if needs_rehash(user["password"]):
+        await _rehash_password(user, credentials.password)
 
-    role_name = None
-    if user.get("role_id"):
-        role = await db.roles.find_one({"id": user["role_id"]}, {"_id": 0})
-        role_name = role["name"] if role else None
-
-    company_name = None
-    if user.get("company_id"):
-        company = await db.companies.find_one({"id": user["company_id"]}, {"_id": 0})
-        company_name = company["name"] if company else None
-
-    token = create_token(user["id"], user["email"], user.get("role_id"))
-
-    return TokenResponse(
-        access_token=token,
-        user=UserResponse(
-            id=user["id"], email=user["email"], name=user["name"],
-            role_id=user.get("role_id"), role_name=role_name,
-            company_id=user.get("company_id"), company_name=company_name,
-            assigned_equipment_ids=user.get("assigned_equipment_ids", []),
-            is_active=user.get("is_active", True), created_at=user["created_at"]
-        )
-    )
+    await resolve_refs([user], *USER_REFS)
+    token = create_token(user["id"], user["email"], user.get("role_id"), user.get("company_id"),
+                         role=await get_role(user.get("role_id")))
+    return TokenResponse(access_token=token, user=_user_response(user))
 
 
 @router.get("/auth/me", response_model=UserResponse)
 async def get_me(current_user: dict = Depends(get_current_user)):
-    role_name = None
-    if current_user.get("role_id"):
-        role = await db.roles.find_one({"id": current_user["role_id"]}, {"_id": 0})
-        role_name = role["name"] if role else None
-
-    company_name = None
-    if current_user.get("company_id"):
-        company = await db.companies.find_one({"id": current_user["company_id"]}, {"_id": 0})
-        company_name = company["name"] if company else None
-
-    return UserResponse(
-        id=current_user["id"], email=current_user["email"], name=current_user["name"],
-        role_id=current_user.get("role_id"), role_name=role_name,
-        company_id=current_user.get("company_id"), company_name=company_name,
-        assigned_equipment_ids=current_user.get("assigned_equipment_ids", []),
-        is_active=current_user.get("is_active", True), created_at=current_user["created_at"]
-    )
+    user = dict(current_user)
+    await resolve_refs([user], *USER_REFS)
+    return _user_response(user)
 
 
 # ==================== USERS ====================
@@ -70,60 +71,27 @@ async def get_me(current_user: dict = Depends(get_current_user)):
 async def get_users(current_user: dict = Depends(get_current_user)):
     await check_permission(current_user, "users.read")
     users = await db.users.find({}, {"_id": 0, "password": 0}).to_list(1000)
-
-    result = []
-    for user in users:
-        role_name = None
-        if user.get("role_id"):
-            role = await db.roles.find_one({"id": user["role_id"]}, {"_id": 0})
-            role_name = role["name"] if role else None
-        company_name = None
-        if user.get("company_id"):
-            company = await db.companies.find_one({"id": user["company_id"]}, {"_id": 0})
-            company_name = company["name"] if company else None
-        result.append(UserResponse(
-            id=user["id"], email=user["email"], name=user["name"],
-            role_id=user.get("role_id"), role_name=role_name,
-            company_id=user.get("company_id"), company_name=company_name,
-            assigned_equipment_ids=user.get("assigned_equipment_ids", []),
-            is_active=user.get("is_active", True), created_at=user["created_at"]
-        ))
-    return result
+    await resolve_refs(users, *USER_REFS)
+    return [_user_response(user) for user in users]
 
 
 @router.post("/users", response_model=UserResponse)
 async def create_user(user_data: UserCreate, current_user: dict = Depends(get_current_user)):
     await check_permission(current_user, "users.write")
 
-    existing = await db.users.find_one({"email": user_data.email})
-    if existing:
-        raise HTTPException(status_code=400, detail="El email ya está registrado")
-
     user = {
         "id": generate_id(), "email": user_data.email,
-        "password": hash_password(user_data.password), "name": user_data.name,
+        "password": await hash_password(user_data.password), "name": user_data.name,
         "role_id": user_data.role_id, "company_id": user_data.company_id,
         "assigned_equipment_ids": user_data.assigned_equipment_ids or [],
         "is_active": True, "created_at": now_iso()
     }
-    await db.users.insert_one(user)
-
-    role_name = None
-    if user_data.role_id:
-        role = await db.roles.find_one({"id": user_data.role_id}, {"_id": 0})
-        role_name = role["name"] if role else None
-    company_name = None
-    if user_data.company_id:
-        company = await db.companies.find_one({"id": user_data.company_id}, {"_id": 0})
-        company_name = company["name"] if company else None
-
-    return UserResponse(
-        id=user["id"], email=user["email"], name=user["name"],
-        role_id=user.get("role_id"), role_name=role_name,
-        company_id=user.get("company_id"), company_name=company_name,
-        assigned_equipment_ids=user.get("assigned_equipment_ids", []),
-        is_active=True, created_at=user["created_at"]
-    )
+    try:
+        await db.users.insert_one(user)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="El email ya está registrado")
+    await resolve_refs([user], *USER_REFS)
+    return _user_response(user)
 
 
 @router.put("/users/{user_id}", response_model=UserResponse)
@@ -134,29 +102,19 @@ async def update_user(user_id: str, user_data: UserCreate, current_user: dict =
                    "role_id": user_data.role_id, "company_id": user_data.company_id,
                    "assigned_equipment_ids": user_data.assigned_equipment_ids or []}
     if user_data.password:
-        update_data["password"] = hash_password(user_data.password)
+        update_data["password"] = await hash_password(user_data.password)
 
-    result = await db.users.update_one({"id": user_id}, {"$set": update_data})
+    try:
+        result = await db.users.update_one({"id": user_id}, {"$set": update_data})
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="El email ya está registrado")
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    user_cache.invalidate(user_id)
 
     user = await db.users.find_one({"id": user_id}, {"_id": 0, "password": 0})
-    role_name = None
-    if user.get("role_id"):
-        role = await db.roles.find_one({"id": user["role_id"]}, {"_id": 0})
-        role_name = role["name"] if role else None
-    company_name = None
-    if user.get("company_id"):
-        company = await db.companies.find_one({"id": user["company_id"]}, {"_id": 0})
-        company_name = company["name"] if company else None
-
-    return UserResponse(
-        id=user["id"], email=user["email"], name=user["name"],
-        role_id=user.get("role_id"), role_name=role_name,
-        company_id=user.get("company_id"), company_name=company_name,
-        assigned_equipment_ids=user.get("assigned_equipment_ids", []),
-        is_active=user.get("is_active", True), created_at=user["created_at"]
-    )
+    await resolve_refs([user], *USER_REFS)
+    return _user_response(user)
 
 
 @router.delete("/users/{user_id}")
@@ -165,6 +123,7 @@ async def delete_user(user_id: str, current_user: dict = Depends(get_current_use
     result = await db.users.update_one({"id": user_id}, {"$set": {"is_active": False}})
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    user_cache.invalidate(user_id)
     return {"message": "Usuario desactivado"}
 
 
@@ -176,6 +135,7 @@ async def delete_user_permanently(user_id: str, current_user: dict = Depends(get
     result = await db.users.delete_one({"id": user_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    user_cache.invalidate(user_id)
     return {"message": "Usuario eliminado permanentemente"}
 
 
@@ -203,6 +163,9 @@ async def update_role(role_id: str, role_data: RoleCreate, current_user: dict =
     if not existing:
         raise HTTPException(status_code=404, detail="Rol no encontrado")
     update_data = {"name": role_data.name, "permissions": role_data.permissions, "description": role_data.description}
-    await db.roles.update_one({"id": role_id}, {"$set": update_data})
+    # The new version makes tokens issued with the old permissions fall back to the role document
+    await db.roles.update_one({"id": role_id}, {"$set": update_data, "$inc": {"version": 1}})
+    role_cache.invalidate(role_id)
+    invalidate_role_versions()
     role = await db.roles.find_one({"id": role_id}, {"_id": 0})
     return RoleResponse(**role)
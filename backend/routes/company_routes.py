@@ -7,10 +7,23 @@ from models import (
     BranchCreate, BranchResponse,
     EmployeeCreate, EmployeeResponse
 )
-from helpers import generate_id, now_iso
+from helpers import generate_id, now_iso, projection
+from services.resolver_service import Ref, resolve_refs
+from services.alert_service import refresh_alerts
 
 router = APIRouter()
 
+BRANCH_REFS = (
+    Ref("company_id", "companies", {"company_name": "name"}),
+)
+EMPLOYEE_REFS = (
+    Ref("company_id", "companies", {"company_name": "name"}),
+    Ref("branch_id", "branches", {"branch_name": "name"}),
+)
+COMPANY_PROJECTION = projection(CompanyResponse)
+BRANCH_PROJECTION = projection(BranchResponse)
+EMPLOYEE_PROJECTION = projection(EmployeeResponse)
+
 
 # ==================== COMPANIES ====================
 
@@ -19,7 +32,7 @@ async def get_companies(current_user: dict = Depends(get_current_user)):
     query = {"is_active": {"$ne": False}}
     if current_user.get("company_id"):
         query["id"] = current_user["company_id"]
-    companies = await db.companies.find(query, {"_id": 0}).to_list(1000)
+    companies = await db.companies.find(query, COMPANY_PROJECTION).to_list(1000)
     return [CompanyResponse(**c) for c in companies]
 
 
@@ -43,7 +56,9 @@ async def update_company(company_id: str, company_data: CompanyCreate, current_u
     result = await db.companies.update_one({"id": company_id}, {"$set": update_data})
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Empresa no encontrada")
-    company = await db.companies.find_one({"id": company_id}, {"_id": 0})
+    # Expiring services show the company name
+    await refresh_alerts(company_id)
+    company = await db.companies.find_one({"id": company_id}, COMPANY_PROJECTION)
     return CompanyResponse(**company)
 
 
@@ -65,13 +80,9 @@ async def get_branches(company_id: Optional[str] = None, current_user: dict = De
         query["company_id"] = company_id
     elif current_user.get("company_id"):
         query["company_id"] = current_user["company_id"]
-    branches = await db.branches.find(query, {"_id": 0}).to_list(1000)
-    result = []
-    for branch in branches:
-        company = await db.companies.find_one({"id": branch["company_id"]}, {"_id": 0})
-        branch["company_name"] = company["name"] if company else None
-        result.append(BranchResponse(**branch))
-    return result
+    branches = await db.branches.find(query, BRANCH_PROJECTION).to_list(1000)
+    await resolve_refs(branches, *BRANCH_REFS)
+    return [BranchResponse(**branch) for branch in branches]
 
 
 @router.post("/branches", response_model=BranchResponse)
@@ -83,8 +94,7 @@ async def create_branch(branch_data: BranchCreate, current_user: dict = Depends(
         "custom_fields": branch_data.custom_fields, "is_active": True
     }
     await db.branches.insert_one(branch)
-    company = await db.companies.find_one({"id": branch_data.company_id}, {"_id": 0})
-    branch["company_name"] = company["name"] if company else None
+    await resolve_refs([branch], *BRANCH_REFS)
     return BranchResponse(**branch)
 
 
@@ -95,9 +105,8 @@ async def update_branch(branch_id: str, branch_data: BranchCreate, current_user:
     result = await db.branches.update_one({"id": branch_id}, {"$set": update_data})
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Sucursal no encontrada")
-    branch = await db.branches.find_one({"id": branch_id}, {"_id": 0})
-    company = await db.companies.find_one({"id": branch["company_id"]}, {"_id": 0})
-    branch["company_name"] = company["name"] if company else None
+    branch = await db.branches.find_one({"id": branch_id}, BRANCH_PROJECTION)
+    await resolve_refs([branch], *BRANCH_REFS)
     return BranchResponse(**branch)
 
 
@@ -121,14 +130,10 @@ async def get_employees(company_id: Optional[str] = None, branch_id: Optional[st
         query["company_id"] = current_user["company_id"]
     if branch_id:
         query["branch_id"] = branch_id
-    employees = await db.employees.find(query, {"_id": 0}).to_list(1000)
+    employees = await db.employees.find(query, EMPLOYEE_PROJECTION).to_list(1000)
+    await resolve_refs(employees, *EMPLOYEE_REFS)
     result = []
     for emp in employees:
-        company = await db.companies.find_one({"id": emp["company_id"]}, {"_id": 0})
-        emp["company_name"] = company["name"] if company else None
-        if emp.get("branch_id"):
-            branch = await db.branches.find_one({"id": emp["branch_id"]}, {"_id": 0})
-            emp["branch_name"] = branch["name"] if branch else None
         emp["full_name"] = f"{emp['first_name']} {emp['last_name']}"
         result.append(EmployeeResponse(**emp))
     return result
@@ -144,12 +149,8 @@ async def create_employee(emp_data: EmployeeCreate, current_user: dict = Depends
         "custom_fields": emp_data.custom_fields, "is_active": True, "created_at": now_iso()
     }
     await db.employees.insert_one(employee)
-    company = await db.companies.find_one({"id": emp_data.company_id}, {"_id": 0})
-    employee["company_name"] = company["name"] if company else None
+    await resolve_refs([employee], *EMPLOYEE_REFS)
     employee["full_name"] = f"{emp_data.first_name} {emp_data.last_name}"
-    if emp_data.branch_id:
-        branch = await db.branches.find_one({"id": emp_data.branch_id}, {"_id": 0})
-        employee["branch_name"] = branch["name"] if branch else None
     return EmployeeResponse(**employee)
 
 
@@ -160,13 +161,9 @@ async def update_employee(employee_id: str, emp_data: EmployeeCreate, current_us
     result = await db.employees.update_one({"id": employee_id}, {"$set": update_data})
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Empleado no encontrado")
-    employee = await db.employees.find_one({"id": employee_id}, {"_id": 0})
-    company = await db.companies.find_one({"id": employee["company_id"]}, {"_id": 0})
-    employee["company_name"] = company["name"] if company else None
+    employee = await db.employees.find_one({"id": employee_id}, EMPLOYEE_PROJECTION)
+    await resolve_refs([employee], *EMPLOYEE_REFS)
     employee["full_name"] = f"{employee['first_name']} {employee['last_name']}"
-    if employee.get("branch_id"):
-        branch = await db.branches.find_one({"id": employee["branch_id"]}, {"_id": 0})
-        employee["branch_name"] = branch["name"] if branch else None
     return EmployeeResponse(**employee)
 
 
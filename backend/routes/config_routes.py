@@ -1,10 +1,12 @@
+import asyncio
 from fastapi import APIRouter, HTTPException, Depends
 from typing import List, Optional
 from datetime import datetime, timezone, timedelta
-from database import db
-from auth import get_current_user, check_permission
+from database import db, reporting_db
+from auth import get_current_user, check_permission, has_permission
 from models import CustomFieldCreate, CustomFieldResponse, SystemSettings
-from helpers import generate_id
+from helpers import generate_id, days_window
+from services.rollup_service import rebuild_rollups, decode_key
 
 router = APIRouter()
 
@@ -72,59 +74,197 @@ async def delete_custom_field(field_id: str, current_user: dict = Depends(get_cu
 
 # ==================== DASHBOARD ====================
 
+# Equipment status -> key in the dashboard "equipment" block
+EQUIPMENT_STATUS_KEYS = {
+    "Disponible": "available", "Asignado": "assigned",
+    "En Mantenimiento": "in_maintenance", "De Baja": "decommissioned",
+}
+
+
+def _count_pipeline(label: str, match: dict) -> list:
+    return [{"$match": match}, {"$project": {"_id": 0, "k": {"$literal": label}}}]
+
+
+async def _equipment_summary(company_filter: dict) -> dict:
+    """Total, per-status and per-type equipment counts in one aggregation"""
+    pipeline = [
+        {"$match": company_filter},
+        {"$facet": {
+            "by_status": [{"$group": {"_id": "$status", "count": {"$sum": 1}}}],
+            "by_type": [{"$group": {"_id": "$equipment_type", "count": {"$sum": 1}}},
+                        {"$sort": {"count": -1}}, {"$limit": 20}],
+        }},
+    ]
+    result = await db.equipment.aggregate(pipeline).to_list(1)
+    return result[0] if result else {"by_status": [], "by_type": []}
+
+
+async def _collection_counts(company_filter: dict) -> dict:
+    """Counts from the other collections, chained with $unionWith into one aggregation"""
+    pipeline = _count_pipeline("companies", {"is_active": {"$ne": False}})
+    for collection, label, match in (
+        ("employees", "employees", {**company_filter, "is_active": {"$ne": False}}),
+        ("maintenance_logs", "pending_maintenance", {"status": {"$in": ["Pendiente", "En Proceso"]}}),
+        ("quotations", "pending_quotations", {**company_filter, "status": "Pendiente"}),
+        ("invoices", "pending_invoices", {**company_filter, "status": "Pendiente"}),
+    ):
+        pipeline.append({"$unionWith": {"coll": collection, "pipeline": _count_pipeline(label, match)}})
+    pipeline.append({"$group": {"_id": "$k", "count": {"$sum": 1}}})
+    return {r["_id"]: r["count"] for r in await db.companies.aggregate(pipeline).to_list(None)}
+
+
+async def _recent_activity() -> list:
+    pipeline = [
+        {"$sort": {"created_at": -1}},
+        {"$limit": 10},
+        {"$lookup": {"from": "equipment", "localField": "equipment_id", "foreignField": "id", "as": "eq"}},
+        {"$addFields": {"equipment_code": {"$ifNull": [{"$arrayElemAt": ["$eq.inventory_code", 0]}, "N/A"]}}},
+        {"$project": {"_id": 0, "eq": 0}},
+    ]
+    return await db.equipment_logs.aggregate(pipeline).to_list(10)
+
+
 @router.get("/dashboard/stats")
 async def get_dashboard_stats(current_user: dict = Depends(get_current_user)):
     company_filter = {}
     if current_user.get("company_id"):
         company_filter["company_id"] = current_user["company_id"]
 
-    total_equipment = await db.equipment.count_documents(company_filter)
-    available_equipment = await db.equipment.count_documents({**company_filter, "status": "Disponible"})
-    assigned_equipment = await db.equipment.count_documents({**company_filter, "status": "Asignado"})
-    maintenance_equipment = await db.equipment.count_documents({**company_filter, "status": "En Mantenimiento"})
-    decommissioned_equipment = await db.equipment.count_documents({**company_filter, "status": "De Baja"})
-    total_companies = await db.companies.count_documents({"is_active": {"$ne": False}})
-    total_employees = await db.employees.count_documents({**company_filter, "is_active": {"$ne": False}})
-    pending_maintenance = await db.maintenance_logs.count_documents({"status": {"$in": ["Pendiente", "En Proceso"]}})
-    pending_quotations = await db.quotations.count_documents({**company_filter, "status": "Pendiente"})
-    pending_invoices = await db.invoices.count_documents({**company_filter, "status": "Pendiente"})
-
-    pipeline = [{"$match": company_filter} if company_filter else {"$match": {}},
-                {"$group": {"_id": "$equipment_type", "count": {"$sum": 1}}}, {"$sort": {"count": -1}}]
-    equipment_by_type = await db.equipment.aggregate(pipeline).to_list(20)
-    recent_logs = await db.equipment_logs.find({}, {"_id": 0}).sort("created_at", -1).to_list(10)
-    for log in recent_logs:
-        eq = await db.equipment.find_one({"id": log["equipment_id"]}, {"_id": 0})
-        log["equipment_code"] = eq.get("inventory_code") if eq else "N/A"
+    equipment, counts, recent_logs = await asyncio.gather(
+        _equipment_summary(company_filter), _collection_counts(company_filter), _recent_activity()
+    )
+
+    equipment_counts = {key: 0 for key in EQUIPMENT_STATUS_KEYS.values()}
+    total_equipment = 0
+    for row in equipment["by_status"]:
+        total_equipment += row["count"]
+        if row["_id"] in EQUIPMENT_STATUS_KEYS:
+            equipment_counts[EQUIPMENT_STATUS_KEYS[row["_id"]]] = row["count"]
 
     return {
-        "equipment": {"total": total_equipment, "available": available_equipment, "assigned": assigned_equipment,
-                      "in_maintenance": maintenance_equipment, "decommissioned": decommissioned_equipment},
-        "companies": total_companies, "employees": total_employees, "pending_maintenance": pending_maintenance,
-        "pending_quotations": pending_quotations, "pending_invoices": pending_invoices,
-        "equipment_by_type": [{"type": e["_id"] or "Sin tipo", "count": e["count"]} for e in equipment_by_type],
+        "equipment": {"total": total_equipment, **equipment_counts},
+        "companies": counts.get("companies", 0), "employees": counts.get("employees", 0),
+        "pending_maintenance": counts.get("pending_maintenance", 0),
+        "pending_quotations": counts.get("pending_quotations", 0),
+        "pending_invoices": counts.get("pending_invoices", 0),
+        "equipment_by_type": [{"type": e["_id"] or "Sin tipo", "count": e["count"]} for e in equipment["by_type"]],
         "recent_activity": recent_logs
     }
 
 
+def _months_back(now: datetime, days: int = 180) -> str:
+    return (now - timedelta(days=days)).isoformat()[:7]
+
+
+async def _expiring_services_count(company_filter: dict, now: datetime) -> int:
+    return await reporting_db.external_services.count_documents(
+        {**company_filter, "is_active": {"$ne": False}, "renewal_date": days_window(now.date(), 30)}
+    )
+
+
+def _add_counts(target: dict, counts: Optional[dict]):
+    for key, value in (counts or {}).items():
+        key = decode_key(key)
+        target[key] = target.get(key, 0) + value
+
+
+def _sorted_counts(counts: dict, label: str) -> list:
+    rows = [{label: key, "count": int(value)} for key, value in counts.items() if value > 0]
+    return sorted(rows, key=lambda r: (-r["count"], str(r[label])))
+
+
+async def _rollup_advanced_stats(company_filter: dict, now: datetime) -> dict:
+    """Advanced stats from dashboard_rollups: one aggregation, plus the date-based services count"""
+    pipeline = [
+        {"$match": company_filter},
+        {"$facet": {
+            "rollups": [{"$project": {"_id": 0, "maintenance_by_equipment": 0}}],
+            "top_equipment": [
+                {"$project": {"items": {"$objectToArray": {"$ifNull": ["$maintenance_by_equipment", {}]}}}},
+                {"$unwind": "$items"},
+                {"$group": {"_id": "$items.k", "count": {"$sum": "$items.v"}}},
+                {"$match": {"count": {"$gt": 0}}},
+                {"$sort": {"count": -1, "_id": 1}},
+                {"$limit": 5},
+                {"$lookup": {"from": "equipment", "localField": "_id", "foreignField": "id", "as": "eq"}},
+                {"$unwind": "$eq"},
+            ],
+        }},
+    ]
+    result, expiring_services = await asyncio.gather(
+        reporting_db.dashboard_rollups.aggregate(pipeline).to_list(1), _expiring_services_count(company_filter, now)
+    )
+    facets = result[0] if result else {"rollups": [], "top_equipment": []}
+
+    since = _months_back(now)
+    maint_months, eq_months = {}, {}
+    maintenance_status, equipment_status, ticket_status = {}, {}, {}
+    resolution_sum, resolution_count = 0.0, 0
+    for doc in facets["rollups"]:
+        if doc["month"] >= since:
+            _add_counts(maint_months.setdefault(doc["month"], {}), doc.get("maintenance_by_type"))
+            eq_months[doc["month"]] = eq_months.get(doc["month"], 0) + doc.get("equipment_added", 0)
+        _add_counts(maintenance_status, doc.get("maintenance_by_status"))
+        _add_counts(equipment_status, doc.get("equipment_by_status"))
+        _add_counts(ticket_status, doc.get("tickets_by_status"))
+        resolution_sum += doc.get("resolution_hours_sum", 0)
+        resolution_count += doc.get("resolution_count", 0)
+
+    maint_by_month = []
+    for month in sorted(maint_months):
+        entry = {"month": month, "Preventivo": 0, "Correctivo": 0, "Reparacion": 0, "Otro": 0}
+        entry.update({k: int(v) for k, v in maint_months[month].items()})
+        entry["total"] = entry["Preventivo"] + entry["Correctivo"] + entry["Reparacion"] + entry["Otro"]
+        if any(v > 0 for v in maint_months[month].values()):
+            maint_by_month.append(entry)
+
+    top_equipment = [{
+        "equipment_id": item["_id"],
+        "code": item["eq"].get("inventory_code", "N/A"),
+        "type": item["eq"].get("equipment_type", ""),
+        "brand_model": f"{item['eq'].get('brand', '')} {item['eq'].get('model', '')}".strip(),
+        "count": int(item["count"])
+    } for item in facets["top_equipment"]]
+
+    return {
+        "maintenance_by_month": maint_by_month,
+        "maintenance_by_status": _sorted_counts(maintenance_status, "status"),
+        "avg_resolution_hours": round(resolution_sum / resolution_count, 1) if resolution_count else 0,
+        "total_completed": int(resolution_count),
+        "top_equipment_incidents": top_equipment,
+        "equipment_by_status": _sorted_counts(equipment_status, "status"),
+        "equipment_by_month": [{"month": m, "count": int(c)} for m, c in sorted(eq_months.items()) if c > 0],
+        "expiring_services_30d": expiring_services,
+        "tickets_by_status": _sorted_counts(ticket_status, "status")
+    }
+
+
 @router.get("/dashboard/advanced-stats")
-async def get_advanced_dashboard_stats(current_user: dict = Depends(get_current_user)):
+async def get_advanced_dashboard_stats(fresh: bool = False, current_user: dict = Depends(get_current_user)):
+    """Served from dashboard_rollups; `fresh=true` recomputes from the raw collections"""
     now = datetime.now(timezone.utc)
-
-    # Build company filter for multi-tenant
     company_filter = {}
-    eq_id_filter = {}
     if current_user.get("company_id"):
         company_filter["company_id"] = current_user["company_id"]
-        eq_list = await db.equipment.find({"company_id": current_user["company_id"]}, {"id": 1}).to_list(1000)
-        eq_ids = [e["id"] for e in eq_list]
-        eq_id_filter = {"equipment_id": {"$in": eq_ids}}
+    if not fresh:
+        return await _rollup_advanced_stats(company_filter, now)
+    return await _live_advanced_stats(company_filter, now)
+
 
+@router.post("/dashboard/rollups/rebuild")
+async def rebuild_dashboard_rollups(current_user: dict = Depends(get_current_user)):
+    await check_permission(current_user, "admin")
+    count = await rebuild_rollups()
+    return {"message": "Resumen del dashboard reconstruido", "documents": count}
+
+
+async def _live_advanced_stats(company_filter: dict, now: datetime) -> dict:
+    # Maintenance logs and tickets carry their company_id, so company_filter applies to them as is
     # --- Maintenance by month (last 6 months) ---
     six_months_ago = now - timedelta(days=180)
     maint_match = {"created_at": {"$gte": six_months_ago.isoformat()}}
-    if eq_id_filter:
-        maint_match.update(eq_id_filter)
+    if company_filter:
+        maint_match.update(company_filter)
     maintenance_pipeline = [
         {"$match": maint_match},
         {"$addFields": {"month": {"$substr": ["$created_at", 0, 7]}}},
@@ -134,7 +274,7 @@ async def get_advanced_dashboard_stats(current_user: dict = Depends(get_current_
         }},
         {"$sort": {"_id.month": 1}}
     ]
-    maint_by_month_raw = await db.maintenance_logs.aggregate(maintenance_pipeline).to_list(100)
+    maint_by_month_raw = await reporting_db.maintenance_logs.aggregate(maintenance_pipeline).to_list(100)
 
     months_set = sorted(set(r["_id"]["month"] for r in maint_by_month_raw))
     maint_by_month = []
@@ -147,19 +287,19 @@ async def get_advanced_dashboard_stats(current_user: dict = Depends(get_current_
         maint_by_month.append(entry)
 
     # --- Maintenance status distribution ---
-    maint_status_match = eq_id_filter if eq_id_filter else {}
+    maint_status_match = company_filter if company_filter else {}
     status_pipeline = [
         {"$match": maint_status_match} if maint_status_match else {"$match": {}},
         {"$group": {"_id": "$status", "count": {"$sum": 1}}}
     ]
-    maint_status_raw = await db.maintenance_logs.aggregate(status_pipeline).to_list(10)
+    maint_status_raw = await reporting_db.maintenance_logs.aggregate(status_pipeline).to_list(10)
     maintenance_by_status = [{"status": r["_id"] or "Sin estado", "count": r["count"]} for r in maint_status_raw]
 
     # --- Average resolution time (completed maintenances) ---
     completed_query = {"status": "Finalizado", "completed_at": {"$exists": True}, "created_at": {"$exists": True}}
-    if eq_id_filter:
-        completed_query.update(eq_id_filter)
-    completed_logs = await db.maintenance_logs.find(
+    if company_filter:
+        completed_query.update(company_filter)
+    completed_logs = await reporting_db.maintenance_logs.find(
         completed_query, {"_id": 0, "created_at": 1, "completed_at": 1}
     ).to_list(500)
 
@@ -177,17 +317,17 @@ async def get_advanced_dashboard_stats(current_user: dict = Depends(get_current_
     avg_resolution_hours = round(sum(resolution_times) / len(resolution_times), 1) if resolution_times else 0
 
     # --- Top equipment with most maintenance (top 5) ---
-    top_eq_match = eq_id_filter if eq_id_filter else {}
+    top_eq_match = company_filter if company_filter else {}
     top_eq_pipeline = [
         {"$match": top_eq_match} if top_eq_match else {"$match": {}},
         {"$group": {"_id": "$equipment_id", "count": {"$sum": 1}}},
         {"$sort": {"count": -1}},
         {"$limit": 5}
     ]
-    top_equipment_raw = await db.maintenance_logs.aggregate(top_eq_pipeline).to_list(5)
+    top_equipment_raw = await reporting_db.maintenance_logs.aggregate(top_eq_pipeline).to_list(5)
     top_equipment = []
     for item in top_equipment_raw:
-        eq = await db.equipment.find_one({"id": item["_id"]}, {"_id": 0, "inventory_code": 1, "equipment_type": 1, "brand": 1, "model": 1})
+        eq = await reporting_db.equipment.find_one({"id": item["_id"]}, {"_id": 0, "inventory_code": 1, "equipment_type": 1, "brand": 1, "model": 1})
         if eq:
             top_equipment.append({
                 "equipment_id": item["_id"],
@@ -204,22 +344,11 @@ async def get_advanced_dashboard_stats(current_user: dict = Depends(get_current_
         {"$group": {"_id": "$status", "count": {"$sum": 1}}},
         {"$sort": {"count": -1}}
     ]
-    eq_by_status_raw = await db.equipment.aggregate(eq_status_pipeline).to_list(10)
+    eq_by_status_raw = await reporting_db.equipment.aggregate(eq_status_pipeline).to_list(10)
     equipment_by_status = [{"status": r["_id"] or "Sin estado", "count": r["count"]} for r in eq_by_status_raw]
 
     # --- Services expiring soon (next 30 days) ---
-    expiring_services = 0
-    svc_query = {"is_active": {"$ne": False}, "renewal_date": {"$exists": True}}
-    if company_filter:
-        svc_query.update(company_filter)
-    services = await db.external_services.find(svc_query, {"_id": 0, "renewal_date": 1}).to_list(500)
-    for svc in services:
-        try:
-            renewal = datetime.fromisoformat(svc["renewal_date"].replace("Z", "+00:00"))
-            if 0 <= (renewal - now).days <= 30:
-                expiring_services += 1
-        except Exception:
-            pass
+    expiring_services = await _expiring_services_count(company_filter, now)
 
     # --- Monthly equipment additions (last 6 months) ---
     eq_month_match = {"created_at": {"$gte": six_months_ago.isoformat()}}
@@ -231,9 +360,17 @@ async def get_advanced_dashboard_stats(current_user: dict = Depends(get_current_
         {"$group": {"_id": "$month", "count": {"$sum": 1}}},
         {"$sort": {"_id": 1}}
     ]
-    eq_by_month_raw = await db.equipment.aggregate(eq_by_month_pipeline).to_list(12)
+    eq_by_month_raw = await reporting_db.equipment.aggregate(eq_by_month_pipeline).to_list(12)
     equipment_by_month = [{"month": r["_id"], "count": r["count"]} for r in eq_by_month_raw]
 
+    # --- Tickets by status ---
+    ticket_status_raw = await reporting_db.tickets.aggregate([
+        {"$match": company_filter},
+        {"$group": {"_id": "$status", "count": {"$sum": 1}}},
+        {"$sort": {"count": -1}}
+    ]).to_list(20)
+    tickets_by_status = [{"status": r["_id"] or "Sin estado", "count": r["count"]} for r in ticket_status_raw]
+
     return {
         "maintenance_by_month": maint_by_month,
         "maintenance_by_status": maintenance_by_status,
@@ -242,7 +379,8 @@ async def get_advanced_dashboard_stats(current_user: dict = Depends(get_current_
         "top_equipment_incidents": top_equipment,
         "equipment_by_status": equipment_by_status,
         "equipment_by_month": equipment_by_month,
-        "expiring_services_30d": expiring_services
+        "expiring_services_30d": expiring_services,
+        "tickets_by_status": tickets_by_status
     }
 
 
@@ -279,11 +417,7 @@ async def get_all_permissions(current_user: dict = Depends(get_current_user)):
 
 @router.get("/permissions/check")
 async def check_user_permission(permission: str, current_user: dict = Depends(get_current_user)):
-    if current_user.get("role_id"):
-        role = await db.roles.find_one({"id": current_user["role_id"]}, {"_id": 0})
-        if role and (permission in role.get("permissions", []) or "admin" in role.get("permissions", [])):
-            return {"has_permission": True}
-    return {"has_permission": False}
+    return {"has_permission": await has_permission(current_user, permission)}
 
 
 # ==================== SETTINGS ====================
@@ -0,0 +1,40 @@
+from fastapi import APIRouter, Depends
+from auth import get_current_user, check_permission
+from database import pool_stats
+from services.index_service import ensure_indexes, index_report
+from services.cache_service import user_cache, role_cache
+
+router = APIRouter()
+
+
+# ==================== INDEXES ====================
+
+@router.get("/diagnostics/indexes")
+async def get_index_report(current_user: dict = Depends(get_current_user)):
+    """Declared indexes that are missing, and existing indexes that are unused or undeclared"""
+    await check_permission(current_user, "admin")
+    return await index_report()
+
+
+@router.post("/diagnostics/indexes/ensure")
+async def create_missing_indexes(current_user: dict = Depends(get_current_user)):
+    await check_permission(current_user, "admin")
+    failed = await ensure_indexes()
+    return {"failed": failed, **await index_report()}
+
+
+# ==================== CACHES ====================
+
+@router.get("/diagnostics/cache")
+async def get_cache_stats(current_user: dict = Depends(get_current_user)):
+    await check_permission(current_user, "admin")
+    return {"caches": [user_cache.stats(), role_cache.stats()]}
+
+
+# ==================== CONNECTION POOL ====================
+
+@router.get("/diagnostics/pool")
+async def get_pool_stats(current_user: dict = Depends(get_current_user)):
+    """MongoDB connections of this worker process: open, in use and checkout waits per server"""
+    await check_permission(current_user, "admin")
+    return pool_stats()
@@ -1,23 +1,58 @@
-from fastapi import APIRouter, HTTPException, Depends
-from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Depends, Query
+from typing import List, Optional, Union
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 from database import db
 from auth import get_current_user, check_permission
 from models import (
     EquipmentCreate, EquipmentResponse,
     EquipmentLogCreate, EquipmentLogResponse,
     AssignmentCreate, AssignmentResponse,
-    DecommissionCreate, DecommissionResponse
+    DecommissionCreate, DecommissionResponse,
+    Page
 )
-from helpers import generate_id, now_iso
+from helpers import generate_id, now_iso, projection
+from services.resolver_service import Ref, resolve_refs, full_name
+from services.pagination_service import list_response, PAGE_MAX_LIMIT
+from services.rollup_service import record, set_equipment
+from services.alert_service import refresh_alerts, OPEN_MAINTENANCE, OPEN_TICKETS
 
 router = APIRouter()
 
+EQUIPMENT_REFS = (
+    Ref("company_id", "companies", {"company_name": "name"}),
+    Ref("branch_id", "branches", {"branch_name": "name"}),
+    Ref("assigned_to", "employees", {"assigned_employee_name": full_name}, project=("first_name", "last_name")),
+)
+EQUIPMENT_LOG_REFS = (
+    Ref("performed_by", "users", {"performed_by_name": "name"}),
+)
+ASSIGNMENT_REFS = (
+    Ref("equipment_id", "equipment", {"equipment_code": "inventory_code", "equipment_type": "equipment_type"}),
+    Ref("employee_id", "employees", {"employee_name": full_name}, project=("first_name", "last_name")),
+)
+DECOMMISSION_REFS = (
+    Ref("equipment_id", "equipment", {"equipment_code": "inventory_code"}),
+    Ref("responsible_user_id", "users", {"responsible_user_name": "name"}),
+)
+EQUIPMENT_PROJECTION = projection(EquipmentResponse)
+EQUIPMENT_LOG_PROJECTION = projection(EquipmentLogResponse)
+ASSIGNMENT_PROJECTION = projection(AssignmentResponse)
+DECOMMISSION_PROJECTION = projection(DecommissionResponse)
+
 
 # ==================== EQUIPMENT ====================
 
-@router.get("/equipment", response_model=List[EquipmentResponse])
+async def _build_equipment(docs: List[dict]) -> List[EquipmentResponse]:
+    await resolve_refs(docs, *EQUIPMENT_REFS)
+    return [EquipmentResponse(**eq) for eq in docs]
+
+
+@router.get("/equipment", response_model=Union[List[EquipmentResponse], Page[EquipmentResponse]])
 async def get_equipment(company_id: Optional[str] = None, branch_id: Optional[str] = None,
                         status: Optional[str] = None, equipment_type: Optional[str] = None,
+                        limit: Optional[int] = Query(None, ge=1, le=PAGE_MAX_LIMIT),
+                        cursor: Optional[str] = None, stream: bool = False,
                         current_user: dict = Depends(get_current_user)):
     query = {}
     if company_id:
@@ -30,46 +65,37 @@ async def get_equipment(company_id: Optional[str] = None, branch_id: Optional[st
         query["status"] = status
     if equipment_type:
         query["equipment_type"] = equipment_type
-    equipment_list = await db.equipment.find(query, {"_id": 0}).to_list(1000)
-    result = []
-    for eq in equipment_list:
-        company = await db.companies.find_one({"id": eq["company_id"]}, {"_id": 0})
-        eq["company_name"] = company["name"] if company else None
-        if eq.get("branch_id"):
-            branch = await db.branches.find_one({"id": eq["branch_id"]}, {"_id": 0})
-            eq["branch_name"] = branch["name"] if branch else None
-        if eq.get("assigned_to"):
-            employee = await db.employees.find_one({"id": eq["assigned_to"]}, {"_id": 0})
-            eq["assigned_employee_name"] = f"{employee['first_name']} {employee['last_name']}" if employee else None
-        result.append(EquipmentResponse(**eq))
-    return result
+    return await list_response(db.equipment, query, _build_equipment, limit, cursor, stream,
+                               projection=EQUIPMENT_PROJECTION)
 
 
 @router.get("/equipment/{equipment_id}", response_model=EquipmentResponse)
 async def get_equipment_by_id(equipment_id: str, current_user: dict = Depends(get_current_user)):
-    eq = await db.equipment.find_one({"id": equipment_id}, {"_id": 0})
+    eq = await db.equipment.find_one({"id": equipment_id}, EQUIPMENT_PROJECTION)
     if not eq:
         raise HTTPException(status_code=404, detail="Equipo no encontrado")
-    company = await db.companies.find_one({"id": eq["company_id"]}, {"_id": 0})
-    eq["company_name"] = company["name"] if company else None
-    if eq.get("branch_id"):
-        branch = await db.branches.find_one({"id": eq["branch_id"]}, {"_id": 0})
-        eq["branch_name"] = branch["name"] if branch else None
-    if eq.get("assigned_to"):
-        employee = await db.employees.find_one({"id": eq["assigned_to"]}, {"_id": 0})
-        eq["assigned_employee_name"] = f"{employee['first_name']} {employee['last_name']}" if employee else None
+    await resolve_refs([eq], *EQUIPMENT_REFS)
     return EquipmentResponse(**eq)
 
 
+# Unique indexes on equipment (see services/index_service.py) and the message for each
+DUPLICATE_MESSAGES = {
+    "serial_number": "Ya existe un equipo con ese número de serie",
+    "inventory_code": "Ya existe un equipo con ese código de inventario",
+}
+
+
+def _raise_duplicate(error: DuplicateKeyError):
+    key = (error.details or {}).get("keyPattern", {})
+    for field, message in DUPLICATE_MESSAGES.items():
+        if field in key:
+            raise HTTPException(status_code=400, detail=message)
+    raise HTTPException(status_code=400, detail="El equipo ya existe")
+
+
 @router.post("/equipment", response_model=EquipmentResponse)
 async def create_equipment(eq_data: EquipmentCreate, current_user: dict = Depends(get_current_user)):
     await check_permission(current_user, "equipment.write")
-    existing = await db.equipment.find_one({"serial_number": eq_data.serial_number})
-    if existing:
-        raise HTTPException(status_code=400, detail="Ya existe un equipo con ese número de serie")
-    existing_code = await db.equipment.find_one({"inventory_code": eq_data.inventory_code})
-    if existing_code:
-        raise HTTPException(status_code=400, detail="Ya existe un equipo con ese código de inventario")
     equipment = {
         "id": generate_id(), "company_id": eq_data.company_id, "branch_id": eq_data.branch_id,
         "inventory_code": eq_data.inventory_code, "equipment_type": eq_data.equipment_type,
@@ -89,43 +115,66 @@ async def create_equipment(eq_data: EquipmentCreate, current_user: dict = Depend
         "cloud_user": eq_data.cloud_user, "cloud_password": eq_data.cloud_password,
         "custom_fields": eq_data.custom_fields, "assigned_to": eq_data.assigned_to, "created_at": now_iso()
     }
-    await db.equipment.insert_one(equipment)
-    company = await db.companies.find_one({"id": eq_data.company_id}, {"_id": 0})
-    equipment["company_name"] = company["name"] if company else None
-    if eq_data.branch_id:
-        branch = await db.branches.find_one({"id": eq_data.branch_id}, {"_id": 0})
-        equipment["branch_name"] = branch["name"] if branch else None
-    if eq_data.assigned_to:
-        employee = await db.employees.find_one({"id": eq_data.assigned_to}, {"_id": 0})
-        equipment["assigned_employee_name"] = f"{employee['first_name']} {employee['last_name']}" if employee else None
+    try:
+        await db.equipment.insert_one(equipment)
+    except DuplicateKeyError as e:
+        _raise_duplicate(e)
+    await record("equipment", None, equipment)
+    await resolve_refs([equipment], *EQUIPMENT_REFS)
     return EquipmentResponse(**equipment)
 
 
+async def _move_open_work(equipment_id: str, old_company: Optional[str], new_company: Optional[str]):
+    """Move the equipment's open maintenances and tickets to its new company.
+
+    Their company_id scopes alerts, events, digests and rollups, and open work is now the new
+    company's. Closed work and equipment logs stay with the company it was done for.
+    """
+    for collection, kind, open_statuses in (("maintenance_logs", "maintenance", OPEN_MAINTENANCE),
+                                            ("tickets", "ticket", OPEN_TICKETS)):
+        query = {"equipment_id": equipment_id, "company_id": old_company, "status": {"$in": open_statuses}}
+        for doc in await db[collection].find(query, {"_id": 0, "id": 1}).to_list(None):
+            # One document at a time, so each rollup delta matches the update that was applied
+            before = await db[collection].find_one_and_update(
+                {**query, "id": doc["id"]}, {"$set": {"company_id": new_company}},
+                projection={"_id": 0}, return_document=ReturnDocument.BEFORE,
+            )
+            if before:
+                await record(kind, before, {**before, "company_id": new_company})
+
+
 @router.put("/equipment/{equipment_id}", response_model=EquipmentResponse)
 async def update_equipment(equipment_id: str, eq_data: EquipmentCreate, current_user: dict = Depends(get_current_user)):
     await check_permission(current_user, "equipment.write")
     update_data = eq_data.model_dump()
-    result = await db.equipment.update_one({"id": equipment_id}, {"$set": update_data})
-    if result.matched_count == 0:
+    try:
+        before = await db.equipment.find_one_and_update(
+            {"id": equipment_id}, {"$set": update_data},
+            projection={"_id": 0}, return_document=ReturnDocument.BEFORE
+        )
+    except DuplicateKeyError as e:
+        _raise_duplicate(e)
+    if not before:
         raise HTTPException(status_code=404, detail="Equipo no encontrado")
-    eq = await db.equipment.find_one({"id": equipment_id}, {"_id": 0})
-    company = await db.companies.find_one({"id": eq["company_id"]}, {"_id": 0})
-    eq["company_name"] = company["name"] if company else None
-    if eq.get("branch_id"):
-        branch = await db.branches.find_one({"id": eq["branch_id"]}, {"_id": 0})
-        eq["branch_name"] = branch["name"] if branch else None
-    if eq.get("assigned_to"):
-        employee = await db.employees.find_one({"id": eq["assigned_to"]}, {"_id": 0})
-        eq["assigned_employee_name"] = f"{employee['first_name']} {employee['last_name']}" if employee else None
+    eq = {**before, **update_data}
+    await record("equipment", before, eq)
+    if before.get("company_id") != eq["company_id"]:
+        await _move_open_work(equipment_id, before.get("company_id"), eq["company_id"])
+    # Pending maintenances in the alert feed show the inventory code
+    if before.get("inventory_code") != eq["inventory_code"] or before.get("company_id") != eq["company_id"]:
+        await refresh_alerts(before.get("company_id"), eq["company_id"])
+    await resolve_refs([eq], *EQUIPMENT_REFS)
     return EquipmentResponse(**eq)
 
 
 @router.delete("/equipment/{equipment_id}")
 async def delete_equipment(equipment_id: str, current_user: dict = Depends(get_current_user)):
     await check_permission(current_user, "equipment.write")
-    result = await db.equipment.delete_one({"id": equipment_id})
-    if result.deleted_count == 0:
+    deleted = await db.equipment.find_one_and_delete({"id": equipment_id}, projection={"_id": 0})
+    if not deleted:
         raise HTTPException(status_code=404, detail="Equipo no encontrado")
+    await record("equipment", deleted, None)
+    await refresh_alerts(deleted.get("company_id"))
     return {"message": "Equipo eliminado"}
 
 
@@ -133,25 +182,21 @@ async def delete_equipment(equipment_id: str, current_user: dict = Depends(get_c
 
 @router.get("/equipment/{equipment_id}/logs", response_model=List[EquipmentLogResponse])
 async def get_equipment_logs(equipment_id: str, current_user: dict = Depends(get_current_user)):
-    logs = await db.equipment_logs.find({"equipment_id": equipment_id}, {"_id": 0}).sort("created_at", -1).to_list(100)
-    result = []
-    for log in logs:
-        if log.get("performed_by"):
-            user = await db.users.find_one({"id": log["performed_by"]}, {"_id": 0})
-            log["performed_by_name"] = user["name"] if user else None
-        result.append(EquipmentLogResponse(**log))
-    return result
+    logs = await db.equipment_logs.find({"equipment_id": equipment_id}, EQUIPMENT_LOG_PROJECTION).sort("created_at", -1).to_list(100)
+    await resolve_refs(logs, *EQUIPMENT_LOG_REFS)
+    return [EquipmentLogResponse(**log) for log in logs]
 
 
 @router.post("/equipment/{equipment_id}/logs", response_model=EquipmentLogResponse)
 async def create_equipment_log(equipment_id: str, log_data: EquipmentLogCreate, current_user: dict = Depends(get_current_user)):
     await check_permission(current_user, "equipment.write")
-    eq = await db.equipment.find_one({"id": equipment_id})
+    eq = await db.equipment.find_one({"id": equipment_id}, {"_id": 0, "company_id": 1})
     if not eq:
         raise HTTPException(status_code=404, detail="Equipo no encontrado")
     log = {
-        "id": generate_id(), "equipment_id": equipment_id, "log_type": log_data.log_type,
-        "description": log_data.description, "performed_by": current_user["id"], "created_at": now_iso()
+        "id": generate_id(), "equipment_id": equipment_id, "company_id": eq.get("company_id"),
+        "log_type": log_data.log_type, "description": log_data.description,
+        "performed_by": current_user["id"], "created_at": now_iso()
     }
     await db.equipment_logs.insert_one(log)
     log["performed_by_name"] = current_user["name"]
@@ -160,9 +205,17 @@ async def create_equipment_log(equipment_id: str, log_data: EquipmentLogCreate,
 
 # ==================== ASSIGNMENTS ====================
 
-@router.get("/assignments", response_model=List[AssignmentResponse])
+async def _build_assignments(docs: List[dict]) -> List[AssignmentResponse]:
+    await resolve_refs(docs, *ASSIGNMENT_REFS)
+    return [AssignmentResponse(**assign) for assign in docs]
+
+
+@router.get("/assignments", response_model=Union[List[AssignmentResponse], Page[AssignmentResponse]])
 async def get_assignments(equipment_id: Optional[str] = None, employee_id: Optional[str] = None,
-                          status: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+                          status: Optional[str] = None,
+                          limit: Optional[int] = Query(None, ge=1, le=PAGE_MAX_LIMIT),
+                          cursor: Optional[str] = None, stream: bool = False,
+                          current_user: dict = Depends(get_current_user)):
     query = {}
     if equipment_id:
         query["equipment_id"] = equipment_id
@@ -170,29 +223,20 @@ async def get_assignments(equipment_id: Optional[str] = None, employee_id: Optio
         query["employee_id"] = employee_id
     if status:
         query["status"] = status
-    assignments = await db.assignments.find(query, {"_id": 0}).sort("created_at", -1).to_list(1000)
-    result = []
-    for assign in assignments:
-        eq = await db.equipment.find_one({"id": assign["equipment_id"]}, {"_id": 0})
-        if eq:
-            assign["equipment_code"] = eq.get("inventory_code")
-            assign["equipment_type"] = eq.get("equipment_type")
-        emp = await db.employees.find_one({"id": assign["employee_id"]}, {"_id": 0})
-        if emp:
-            assign["employee_name"] = f"{emp['first_name']} {emp['last_name']}"
-        result.append(AssignmentResponse(**assign))
-    return result
+    return await list_response(db.assignments, query, _build_assignments, limit, cursor, stream,
+                               sort=[("created_at", -1)], projection=ASSIGNMENT_PROJECTION)
 
 
 @router.post("/assignments", response_model=AssignmentResponse)
 async def create_assignment(assign_data: AssignmentCreate, current_user: dict = Depends(get_current_user)):
     await check_permission(current_user, "assignments.write")
-    eq = await db.equipment.find_one({"id": assign_data.equipment_id})
+    eq = await db.equipment.find_one({"id": assign_data.equipment_id},
+                                     {"_id": 0, "status": 1, "company_id": 1, "inventory_code": 1, "equipment_type": 1})
     if not eq:
         raise HTTPException(status_code=404, detail="Equipo no encontrado")
     if eq.get("status") != "Disponible":
         raise HTTPException(status_code=400, detail="El equipo no está disponible")
-    emp = await db.employees.find_one({"id": assign_data.employee_id})
+    emp = await db.employees.find_one({"id": assign_data.employee_id}, {"_id": 0, "first_name": 1, "last_name": 1})
     if not emp:
         raise HTTPException(status_code=404, detail="Empleado no encontrado")
     assignment = {
@@ -202,11 +246,10 @@ async def create_assignment(assign_data: AssignmentCreate, current_user: dict =
         "return_observations": None, "created_at": now_iso()
     }
     await db.assignments.insert_one(assignment)
-    await db.equipment.update_one({"id": assign_data.equipment_id},
-                                   {"$set": {"status": "Asignado", "assigned_to": assign_data.employee_id}})
+    await set_equipment(assign_data.equipment_id, {"status": "Asignado", "assigned_to": assign_data.employee_id})
     log = {
-        "id": generate_id(), "equipment_id": assign_data.equipment_id, "log_type": "Cambio",
-        "description": f"Equipo asignado a {emp['first_name']} {emp['last_name']}",
+        "id": generate_id(), "equipment_id": assign_data.equipment_id, "company_id": eq.get("company_id"),
+        "log_type": "Cambio", "description": f"Equipo asignado a {emp['first_name']} {emp['last_name']}",
         "performed_by": current_user["id"], "created_at": now_iso()
     }
     await db.equipment_logs.insert_one(log)
@@ -219,18 +262,17 @@ async def create_assignment(assign_data: AssignmentCreate, current_user: dict =
 @router.put("/assignments/{assignment_id}/return")
 async def return_assignment(assignment_id: str, observations: Optional[str] = None, current_user: dict = Depends(get_current_user)):
     await check_permission(current_user, "assignments.write")
-    assignment = await db.assignments.find_one({"id": assignment_id})
+    assignment = await db.assignments.find_one({"id": assignment_id}, {"_id": 0, "status": 1, "equipment_id": 1})
     if not assignment:
         raise HTTPException(status_code=404, detail="Asignación no encontrada")
     if assignment["status"] != "Activa":
         raise HTTPException(status_code=400, detail="La asignación ya fue finalizada")
     await db.assignments.update_one({"id": assignment_id},
                                      {"$set": {"status": "Finalizada", "return_date": now_iso(), "return_observations": observations}})
-    await db.equipment.update_one({"id": assignment["equipment_id"]},
-                                   {"$set": {"status": "Disponible", "assigned_to": None}})
+    eq = await set_equipment(assignment["equipment_id"], {"status": "Disponible", "assigned_to": None})
     log = {
-        "id": generate_id(), "equipment_id": assignment["equipment_id"], "log_type": "Cambio",
-        "description": "Equipo devuelto y marcado como disponible",
+        "id": generate_id(), "equipment_id": assignment["equipment_id"], "company_id": eq.get("company_id") if eq else None,
+        "log_type": "Cambio", "description": "Equipo devuelto y marcado como disponible",
         "performed_by": current_user["id"], "created_at": now_iso()
     }
     await db.equipment_logs.insert_one(log)
@@ -241,23 +283,16 @@ async def return_assignment(assignment_id: str, observations: Optional[str] = No
 
 @router.get("/decommissions", response_model=List[DecommissionResponse])
 async def get_decommissions(current_user: dict = Depends(get_current_user)):
-    decommissions = await db.decommissions.find({}, {"_id": 0}).sort("decommission_date", -1).to_list(1000)
-    result = []
-    for dec in decommissions:
-        eq = await db.equipment.find_one({"id": dec["equipment_id"]}, {"_id": 0})
-        if eq:
-            dec["equipment_code"] = eq.get("inventory_code")
-        if dec.get("responsible_user_id"):
-            user = await db.users.find_one({"id": dec["responsible_user_id"]}, {"_id": 0})
-            dec["responsible_user_name"] = user["name"] if user else None
-        result.append(DecommissionResponse(**dec))
-    return result
+    decommissions = await db.decommissions.find({}, DECOMMISSION_PROJECTION).sort("decommission_date", -1).to_list(1000)
+    await resolve_refs(decommissions, *DECOMMISSION_REFS)
+    return [DecommissionResponse(**dec) for dec in decommissions]
 
 
 @router.post("/decommissions", response_model=DecommissionResponse)
 async def create_decommission(dec_data: DecommissionCreate, current_user: dict = Depends(get_current_user)):
     await check_permission(current_user, "equipment.write")
-    eq = await db.equipment.find_one({"id": dec_data.equipment_id})
+    eq = await db.equipment.find_one({"id": dec_data.equipment_id},
+                                     {"_id": 0, "status": 1, "company_id": 1, "inventory_code": 1})
     if not eq:
         raise HTTPException(status_code=404, detail="Equipo no encontrado")
     if eq.get("status") == "Asignado":
@@ -269,10 +304,10 @@ async def create_decommission(dec_data: DecommissionCreate, current_user: dict =
         "reason": dec_data.reason, "description": dec_data.description, "responsible_user_id": current_user["id"]
     }
     await db.decommissions.insert_one(decommission)
-    await db.equipment.update_one({"id": dec_data.equipment_id}, {"$set": {"status": "De Baja"}})
+    await set_equipment(dec_data.equipment_id, {"status": "De Baja"})
     log = {
-        "id": generate_id(), "equipment_id": dec_data.equipment_id, "log_type": "Cambio",
-        "description": f"Equipo dado de baja: {dec_data.reason}",
+        "id": generate_id(), "equipment_id": dec_data.equipment_id, "company_id": eq.get("company_id"),
+        "log_type": "Cambio", "description": f"Equipo dado de baja: {dec_data.reason}",
         "performed_by": current_user["id"], "created_at": now_iso()
     }
     await db.equipment_logs.insert_one(log)
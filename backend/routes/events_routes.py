@@ -0,0 +1,74 @@
+import asyncio
+from typing import List
+from fastapi import APIRouter, Depends, Request
+from fastapi.responses import StreamingResponse
+from auth import get_stream_user, is_solicitante
+from config import EVENT_STREAM_KEEPALIVE_SECONDS, EVENT_STREAM_RETRY_MS
+from services.alert_service import alert_scope, get_alert_feed
+from services.events_service import subscribe, sse, topic, ALL_COMPANIES
+
+router = APIRouter()
+
+# Event kinds pushed to clients: ticket changes and comments, maintenance status changes,
+# and the refreshed alert feed
+EVENT_KINDS = ("tickets", "maintenance", "alerts")
+
+
+# ==================== SERVER EVENTS ====================
+
+def _resync_events(own_tickets: bool) -> List[str]:
+    """Tell the client to refetch, after events for it may have been missed"""
+    kinds = ("tickets",) if own_tickets else ("tickets", "maintenance")
+    return [sse(kind, {"action": "resync"}) for kind in kinds]
+
+
+async def _server_events(request: Request, user: dict, own_tickets: bool):
+    scope = alert_scope(user)
+    if own_tickets:
+        # Solicitantes only get their own tickets, whatever their company
+        topics = [topic("tickets", ALL_COMPANIES)]
+    else:
+        topics = [topic(kind, scope) for kind in EVENT_KINDS]
+    # Subscribe before the first read so no refresh falls in between
+    with subscribe(*topics) as queue:
+        yield f"retry: {EVENT_STREAM_RETRY_MS}\n\n"
+        feed_at = ""
+        if not own_tickets:
+            # The current feed, in case it changed while the client was disconnected
+            feed = await get_alert_feed(scope)
+            feed_at = feed["updated_at"]
+            yield sse("alerts", feed)
+        while not await request.is_disconnected():
+            try:
+                name, event = await asyncio.wait_for(queue.get(), EVENT_STREAM_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                name, event = None, None
+            resync, queue.lagged = queue.lagged, False
+            if resync:
+                for message in _resync_events(own_tickets):
+                    yield message
+            if name is not None and not name.startswith("alerts:"):
+                if not own_tickets or event.get("created_by") == user["id"]:
+                    yield sse(name.partition(":")[0], event)
+            if own_tickets:
+                if name is None:
+                    yield ": keepalive\n\n"
+                continue
+            if name is None or resync:
+                # Re-read the feed when idle, which also catches refreshes whose events were missed
+                event = await get_alert_feed(scope)
+            elif not name.startswith("alerts:"):
+                continue
+            if event["updated_at"] > feed_at:
+                feed_at = event["updated_at"]
+                yield sse("alerts", event)
+            elif name is None:
+                yield ": keepalive\n\n"
+
+
+@router.get("/events/stream")
+async def stream_events(request: Request, current_user: dict = Depends(get_stream_user)):
+    """Server-sent events for the user's company: `tickets`, `maintenance` and `alerts` (token in the query string)"""
+    own_tickets = await is_solicitante(current_user)
+    return StreamingResponse(_server_events(request, current_user, own_tickets), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
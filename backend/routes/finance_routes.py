@@ -1,22 +1,83 @@
-from fastapi import APIRouter, HTTPException, Depends
-from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Depends, Query
+from typing import List, Optional, Union
 from datetime import datetime, timezone, timedelta
+from pymongo.errors import DuplicateKeyError
 from database import db
 from auth import get_current_user, check_permission
 from config import PAC_PROVIDER, PAC_API_KEY, PAC_API_SECRET, PAC_SANDBOX
 from models import (
     QuotationCreate, QuotationResponse,
-    InvoiceCreate, InvoiceResponse
+    InvoiceCreate, InvoiceResponse,
+    NumberReservation, NumberReservationResponse,
+    Page
 )
-from helpers import generate_id, now_iso
+from helpers import generate_id, now_iso, projection
+from services.resolver_service import Ref, resolve_refs
+from services.pagination_service import list_response, PAGE_MAX_LIMIT
+from services.counter_service import reserve_numbers, next_sequence, is_reserved, invoice_key, quotation_key
 
 router = APIRouter()
 
+COMPANY_REFS = (
+    Ref("company_id", "companies", {"company_name": "name"}),
+)
+QUOTATION_PROJECTION = projection(QuotationResponse)
+INVOICE_PROJECTION = projection(InvoiceResponse)
+
+
+# ==================== NUMBERING ====================
+
+def _folio(number: int) -> str:
+    return str(number).zfill(6)
+
+
+def _quotation_number(number: int) -> str:
+    return f"COT-{_folio(number)}"
+
+
+async def _check_reserved(key: str, number: str) -> int:
+    """A number given by the client must come from a previous reservation; returns it as an int.
+
+    Reuse of a reserved number is rejected by the unique index on the stored number, which is
+    why callers store it in its canonical form (`_folio` / `_quotation_number`).
+    """
+    try:
+        value = int(number)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Folio inválido")
+    if value < 1 or not await is_reserved(key, value):
+        raise HTTPException(status_code=400, detail="El folio no ha sido reservado")
+    return value
+
+
+@router.post("/quotations/reserve-numbers", response_model=NumberReservationResponse)
+async def reserve_quotation_numbers(data: NumberReservation, current_user: dict = Depends(get_current_user)):
+    """Reserve consecutive quotation numbers for a batch import"""
+    await check_permission(current_user, "quotations.write")
+    first, last = await reserve_numbers(quotation_key(data.company_id), data.count)
+    return {"numbers": [_quotation_number(n) for n in range(first, last + 1)]}
+
+
+@router.post("/invoices/reserve-folios", response_model=NumberReservationResponse)
+async def reserve_invoice_folios(data: NumberReservation, current_user: dict = Depends(get_current_user)):
+    """Reserve consecutive folios of a serie for a batch import"""
+    await check_permission(current_user, "invoices.write")
+    first, last = await reserve_numbers(invoice_key(data.company_id, data.serie or "A"), data.count)
+    return {"numbers": [_folio(n) for n in range(first, last + 1)]}
+
 
 # ==================== QUOTATIONS ====================
 
-@router.get("/quotations", response_model=List[QuotationResponse])
-async def get_quotations(company_id: Optional[str] = None, status: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+async def _build_quotations(docs: List[dict]) -> List[QuotationResponse]:
+    await resolve_refs(docs, *COMPANY_REFS)
+    return [QuotationResponse(**quot) for quot in docs]
+
+
+@router.get("/quotations", response_model=Union[List[QuotationResponse], Page[QuotationResponse]])
+async def get_quotations(company_id: Optional[str] = None, status: Optional[str] = None,
+               limit: Optional[int] = Query(None, ge=1, le=PAGE_MAX_LIMIT),
+               cursor: Optional[str] = None, stream: bool = False,
+               current_user: dict = Depends(get_current_user)):
     query = {}
     if company_id:
         query["company_id"] = company_id
@@ -24,30 +85,28 @@ async def get_quotations(company_id: Optional[str] = None, status: Optional[str]
         query["company_id"] = current_user["company_id"]
     if status:
         query["status"] = status
-    quotations = await db.quotations.find(query, {"_id": 0}).sort("created_at", -1).to_list(1000)
-    result = []
-    for quot in quotations:
-        company = await db.companies.find_one({"id": quot["company_id"]}, {"_id": 0})
-        quot["company_name"] = company["name"] if company else None
-        result.append(QuotationResponse(**quot))
-    return result
+    return await list_response(db.quotations, query, _build_quotations, limit, cursor, stream,
+                               sort=[("created_at", -1)], projection=QUOTATION_PROJECTION)
 
 
 @router.get("/quotations/{quotation_id}", response_model=QuotationResponse)
 async def get_quotation_by_id(quotation_id: str, current_user: dict = Depends(get_current_user)):
-    quot = await db.quotations.find_one({"id": quotation_id}, {"_id": 0})
+    quot = await db.quotations.find_one({"id": quotation_id}, QUOTATION_PROJECTION)
     if not quot:
         raise HTTPException(status_code=404, detail="Cotización no encontrada")
-    company = await db.companies.find_one({"id": quot["company_id"]}, {"_id": 0})
-    quot["company_name"] = company["name"] if company else None
+    await resolve_refs([quot], *COMPANY_REFS)
     return QuotationResponse(**quot)
 
 
 @router.post("/quotations", response_model=QuotationResponse)
 async def create_quotation(quot_data: QuotationCreate, current_user: dict = Depends(get_current_user)):
     await check_permission(current_user, "quotations.write")
-    count = await db.quotations.count_documents({})
-    quotation_number = f"COT-{str(count + 1).zfill(6)}"
+    key = quotation_key(quot_data.company_id)
+    if quot_data.quotation_number:
+        number = quot_data.quotation_number.strip().removeprefix("COT-")
+        quotation_number = _quotation_number(await _check_reserved(key, number))
+    else:
+        quotation_number = _quotation_number(await next_sequence(key))
     items = []
     subtotal = 0
     for item in quot_data.items:
@@ -72,9 +131,11 @@ async def create_quotation(quot_data: QuotationCreate, current_user: dict = Depe
         "valid_until": valid_until, "status": "Pendiente",
         "uso_cfdi": quot_data.uso_cfdi, "custom_fields": quot_data.custom_fields, "created_at": now_iso()
     }
-    await db.quotations.insert_one(quotation)
-    company = await db.companies.find_one({"id": quot_data.company_id}, {"_id": 0})
-    quotation["company_name"] = company["name"] if company else None
+    try:
+        await db.quotations.insert_one(quotation)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="El número de cotización ya fue utilizado")
+    await resolve_refs([quotation], *COMPANY_REFS)
     return QuotationResponse(**quotation)
 
 
@@ -91,8 +152,16 @@ async def update_quotation_status(quotation_id: str, status: str, current_user:
 
 # ==================== INVOICES ====================
 
-@router.get("/invoices", response_model=List[InvoiceResponse])
-async def get_invoices(company_id: Optional[str] = None, status: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+async def _build_invoices(docs: List[dict]) -> List[InvoiceResponse]:
+    await resolve_refs(docs, *COMPANY_REFS)
+    return [InvoiceResponse(**inv) for inv in docs]
+
+
+@router.get("/invoices", response_model=Union[List[InvoiceResponse], Page[InvoiceResponse]])
+async def get_invoices(company_id: Optional[str] = None, status: Optional[str] = None,
+               limit: Optional[int] = Query(None, ge=1, le=PAGE_MAX_LIMIT),
+               cursor: Optional[str] = None, stream: bool = False,
+               current_user: dict = Depends(get_current_user)):
     query = {}
     if company_id:
         query["company_id"] = company_id
@@ -100,31 +169,28 @@ async def get_invoices(company_id: Optional[str] = None, status: Optional[str] =
         query["company_id"] = current_user["company_id"]
     if status:
         query["status"] = status
-    invoices = await db.invoices.find(query, {"_id": 0}).sort("created_at", -1).to_list(1000)
-    result = []
-    for inv in invoices:
-        company = await db.companies.find_one({"id": inv["company_id"]}, {"_id": 0})
-        inv["company_name"] = company["name"] if company else None
-        result.append(InvoiceResponse(**inv))
-    return result
+    return await list_response(db.invoices, query, _build_invoices, limit, cursor, stream,
+                               sort=[("created_at", -1)], projection=INVOICE_PROJECTION)
 
 
 @router.get("/invoices/{invoice_id}", response_model=InvoiceResponse)
 async def get_invoice_by_id(invoice_id: str, current_user: dict = Depends(get_current_user)):
-    inv = await db.invoices.find_one({"id": invoice_id}, {"_id": 0})
+    inv = await db.invoices.find_one({"id": invoice_id}, INVOICE_PROJECTION)
     if not inv:
         raise HTTPException(status_code=404, detail="Factura no encontrada")
-    company = await db.companies.find_one({"id": inv["company_id"]}, {"_id": 0})
-    inv["company_name"] = company["name"] if company else None
+    await resolve_refs([inv], *COMPANY_REFS)
     return InvoiceResponse(**inv)
 
 
 @router.post("/invoices", response_model=InvoiceResponse)
 async def create_invoice(inv_data: InvoiceCreate, current_user: dict = Depends(get_current_user)):
     await check_permission(current_user, "invoices.write")
-    count = await db.invoices.count_documents({})
-    folio = str(count + 1).zfill(6)
     serie = inv_data.serie or "A"
+    key = invoice_key(inv_data.company_id, serie)
+    if inv_data.folio:
+        folio = _folio(await _check_reserved(key, inv_data.folio))
+    else:
+        folio = _folio(await next_sequence(key))
     invoice_number = f"{serie}-{folio}"
 
     items = []
@@ -157,11 +223,13 @@ async def create_invoice(inv_data: InvoiceCreate, current_user: dict = Depends(g
         "sello_cfdi": None, "cadena_original": None,
         "custom_fields": inv_data.custom_fields, "created_at": now_iso()
     }
-    await db.invoices.insert_one(invoice)
+    try:
+        await db.invoices.insert_one(invoice)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="El folio ya fue utilizado")
     if inv_data.quotation_id:
         await db.quotations.update_one({"id": inv_data.quotation_id}, {"$set": {"status": "Convertida"}})
-    company = await db.companies.find_one({"id": inv_data.company_id}, {"_id": 0})
-    invoice["company_name"] = company["name"] if company else None
+    await resolve_refs([invoice], *COMPANY_REFS)
     return InvoiceResponse(**invoice)
 
 
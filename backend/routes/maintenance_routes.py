@@ -1,19 +1,48 @@
-from fastapi import APIRouter, HTTPException, Depends
-from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Depends, Query
+from typing import List, Optional, Union
+from pymongo import ReturnDocument
 from database import db
 from auth import get_current_user, check_permission
-from models import MaintenanceLogCreate, MaintenanceLogResponse
-from helpers import generate_id, now_iso
-from services.email_service import send_email, get_email_template, get_recipients_for_company, get_global_admin_emails
-import asyncio
+from models import MaintenanceLogCreate, MaintenanceLogResponse, Page
+from helpers import generate_id, now_iso, projection
+from services.email_service import (
+    enqueue_email, get_email_template, get_recipients_for_company, get_global_admin_emails, COMPANY_BRANDING_FIELDS
+)
+from services.resolver_service import Ref, resolve_refs
+from services.pagination_service import list_response, PAGE_MAX_LIMIT
+from services.rollup_service import record, set_equipment
+from services.alert_service import refresh_alerts
+from services.events_service import publish_to_company
 import logging
 
 router = APIRouter()
 
+MAINTENANCE_REFS = (
+    Ref("equipment_id", "equipment", {"equipment_code": "inventory_code", "equipment_type": "equipment_type",
+                                      "equipment_brand": "brand"}),
+    Ref("performed_by", "users", {"performed_by_name": "name"}),
+)
+# company_id is not returned but feeds the rollups and the completion email
+MAINTENANCE_PROJECTION = projection(MaintenanceLogResponse, "company_id")
 
-@router.get("/maintenance", response_model=List[MaintenanceLogResponse])
+
+async def _publish_maintenance(log: dict, status: str):
+    await publish_to_company("maintenance", log.get("company_id"), {
+        "maintenance_id": log["id"], "equipment_id": log["equipment_id"], "status": status,
+    })
+
+
+async def _build_maintenance_logs(docs: List[dict]) -> List[MaintenanceLogResponse]:
+    await resolve_refs(docs, *MAINTENANCE_REFS)
+    return [MaintenanceLogResponse(**log) for log in docs]
+
+
+@router.get("/maintenance", response_model=Union[List[MaintenanceLogResponse], Page[MaintenanceLogResponse]])
 async def get_maintenance_logs(status: Optional[str] = None, maintenance_type: Optional[str] = None,
-                                equipment_id: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+                                equipment_id: Optional[str] = None,
+                                limit: Optional[int] = Query(None, ge=1, le=PAGE_MAX_LIMIT),
+                                cursor: Optional[str] = None, stream: bool = False,
+                                current_user: dict = Depends(get_current_user)):
     query = {}
     if status:
         query["status"] = status
@@ -21,66 +50,41 @@ async def get_maintenance_logs(status: Optional[str] = None, maintenance_type: O
         query["maintenance_type"] = maintenance_type
     if equipment_id:
         query["equipment_id"] = equipment_id
-    logs = await db.maintenance_logs.find(query, {"_id": 0}).sort("created_at", -1).to_list(1000)
-    result = []
-    for log in logs:
-        eq = await db.equipment.find_one({"id": log["equipment_id"]}, {"_id": 0})
-        if eq:
-            log["equipment_code"] = eq.get("inventory_code")
-            log["equipment_type"] = eq.get("equipment_type")
-            log["equipment_brand"] = eq.get("brand")
-        if log.get("performed_by"):
-            user = await db.users.find_one({"id": log["performed_by"]}, {"_id": 0})
-            log["performed_by_name"] = user["name"] if user else None
-        result.append(MaintenanceLogResponse(**log))
-    return result
+    return await list_response(db.maintenance_logs, query, _build_maintenance_logs, limit, cursor, stream,
+                               sort=[("created_at", -1)], projection=MAINTENANCE_PROJECTION)
 
 
 # Use a different path to avoid conflict with the GET /maintenance route
 @router.get("/maintenance-logs", response_model=List[MaintenanceLogResponse])
 async def get_maintenance_logs_alias(current_user: dict = Depends(get_current_user)):
     """Alias for getting all maintenance logs (used by frontend notifications)"""
-    logs = await db.maintenance_logs.find({}, {"_id": 0}).sort("created_at", -1).to_list(1000)
-    result = []
-    for log in logs:
-        eq = await db.equipment.find_one({"id": log["equipment_id"]}, {"_id": 0})
-        if eq:
-            log["equipment_code"] = eq.get("inventory_code")
-            log["equipment_type"] = eq.get("equipment_type")
-            log["equipment_brand"] = eq.get("brand")
-        if log.get("performed_by"):
-            user = await db.users.find_one({"id": log["performed_by"]}, {"_id": 0})
-            log["performed_by_name"] = user["name"] if user else None
-        result.append(MaintenanceLogResponse(**log))
-    return result
+    logs = await db.maintenance_logs.find({}, MAINTENANCE_PROJECTION).sort("created_at", -1).to_list(None)
+    return await _build_maintenance_logs(logs)
 
 
 @router.get("/maintenance/history/{equipment_id}", response_model=List[MaintenanceLogResponse])
 async def get_equipment_maintenance_history(equipment_id: str, current_user: dict = Depends(get_current_user)):
-    eq = await db.equipment.find_one({"id": equipment_id}, {"_id": 0})
+    eq = await db.equipment.find_one({"id": equipment_id}, {"_id": 0, "inventory_code": 1, "equipment_type": 1, "brand": 1})
     if not eq:
         raise HTTPException(status_code=404, detail="Equipo no encontrado")
-    logs = await db.maintenance_logs.find({"equipment_id": equipment_id}, {"_id": 0}).sort("created_at", -1).to_list(1000)
-    result = []
+    logs = await db.maintenance_logs.find({"equipment_id": equipment_id}, MAINTENANCE_PROJECTION).sort("created_at", -1).to_list(None)
     for log in logs:
         log["equipment_code"] = eq.get("inventory_code")
         log["equipment_type"] = eq.get("equipment_type")
         log["equipment_brand"] = eq.get("brand")
-        if log.get("performed_by"):
-            user = await db.users.find_one({"id": log["performed_by"]}, {"_id": 0})
-            log["performed_by_name"] = user["name"] if user else None
-        result.append(MaintenanceLogResponse(**log))
-    return result
+    await resolve_refs(logs, MAINTENANCE_REFS[1])
+    return [MaintenanceLogResponse(**log) for log in logs]
 
 
 @router.post("/maintenance", response_model=MaintenanceLogResponse)
 async def create_maintenance_log(log_data: MaintenanceLogCreate, current_user: dict = Depends(get_current_user)):
     await check_permission(current_user, "maintenance.write")
-    eq = await db.equipment.find_one({"id": log_data.equipment_id})
+    eq = await db.equipment.find_one({"id": log_data.equipment_id},
+                                     {"_id": 0, "company_id": 1, "inventory_code": 1, "equipment_type": 1, "brand": 1})
     if not eq:
         raise HTTPException(status_code=404, detail="Equipo no encontrado")
     maint_log = {
-        "id": generate_id(), "equipment_id": log_data.equipment_id,
+        "id": generate_id(), "equipment_id": log_data.equipment_id, "company_id": eq.get("company_id"),
         "maintenance_type": log_data.maintenance_type, "description": log_data.description,
         "technician": log_data.technician,
         "performed_date": log_data.performed_date or now_iso()[:10],
@@ -94,12 +98,16 @@ async def create_maintenance_log(log_data: MaintenanceLogCreate, current_user: d
         "created_at": now_iso(), "completed_at": None, "performed_by": current_user["id"]
     }
     await db.maintenance_logs.insert_one(maint_log)
+    await record("maintenance", None, maint_log)
     eq_log = {
-        "id": generate_id(), "equipment_id": log_data.equipment_id, "log_type": "Mantenimiento",
+        "id": generate_id(), "equipment_id": log_data.equipment_id, "company_id": eq.get("company_id"),
+        "log_type": "Mantenimiento",
         "description": f"Mantenimiento {log_data.maintenance_type}: {log_data.description}",
         "performed_by": current_user["id"], "created_at": now_iso()
     }
     await db.equipment_logs.insert_one(eq_log)
+    await refresh_alerts(eq.get("company_id"))
+    await _publish_maintenance(maint_log, "Pendiente")
     maint_log["equipment_code"] = eq.get("inventory_code")
     maint_log["equipment_type"] = eq.get("equipment_type")
     maint_log["equipment_brand"] = eq.get("brand")
@@ -110,13 +118,19 @@ async def create_maintenance_log(log_data: MaintenanceLogCreate, current_user: d
 @router.put("/maintenance/{log_id}/start")
 async def start_maintenance(log_id: str, current_user: dict = Depends(get_current_user)):
     await check_permission(current_user, "maintenance.write")
-    log = await db.maintenance_logs.find_one({"id": log_id})
+    # Only the request that moves the log out of Pendiente applies the side effects
+    log = await db.maintenance_logs.find_one_and_update(
+        {"id": log_id, "status": "Pendiente"}, {"$set": {"status": "En Proceso"}},
+        projection=MAINTENANCE_PROJECTION, return_document=ReturnDocument.BEFORE,
+    )
     if not log:
-        raise HTTPException(status_code=404, detail="Registro no encontrado")
-    if log["status"] != "Pendiente":
+        if not await db.maintenance_logs.find_one({"id": log_id}, {"_id": 1}):
+            raise HTTPException(status_code=404, detail="Registro no encontrado")
         raise HTTPException(status_code=400, detail="El mantenimiento ya fue iniciado")
-    await db.maintenance_logs.update_one({"id": log_id}, {"$set": {"status": "En Proceso"}})
-    await db.equipment.update_one({"id": log["equipment_id"]}, {"$set": {"status": "En Mantenimiento"}})
+    await set_equipment(log["equipment_id"], {"status": "En Mantenimiento"})
+    await record("maintenance", log, {**log, "status": "En Proceso"})
+    await refresh_alerts(log.get("company_id"))
+    await _publish_maintenance(log, "En Proceso")
     return {"message": "Mantenimiento iniciado"}
 
 
@@ -124,7 +138,7 @@ async def start_maintenance(log_id: str, current_user: dict = Depends(get_curren
 async def complete_maintenance(log_id: str, notes: Optional[str] = None, solution: Optional[str] = None,
                                repair_time: Optional[float] = None, current_user: dict = Depends(get_current_user)):
     await check_permission(current_user, "maintenance.write")
-    log = await db.maintenance_logs.find_one({"id": log_id})
+    log = await db.maintenance_logs.find_one({"id": log_id}, MAINTENANCE_PROJECTION)
     if not log:
         raise HTTPException(status_code=404, detail="Registro no encontrado")
     if log["status"] == "Finalizado":
@@ -136,26 +150,34 @@ async def complete_maintenance(log_id: str, notes: Optional[str] = None, solutio
         update_data["solution_applied"] = solution
     if repair_time:
         update_data["repair_time_hours"] = repair_time
-    await db.maintenance_logs.update_one({"id": log_id}, {"$set": update_data})
-    await db.equipment.update_one({"id": log["equipment_id"]}, {"$set": {"status": "Disponible"}})
+    # Matched on the status read above, so a concurrent start or completion cannot apply twice
+    if not await db.maintenance_logs.find_one_and_update(
+        {"id": log_id, "status": log["status"]}, {"$set": update_data}, projection={"_id": 1}
+    ):
+        raise HTTPException(status_code=400, detail="El mantenimiento cambió de estado, intente de nuevo")
+    await set_equipment(log["equipment_id"], {"status": "Disponible"})
+    await record("maintenance", log, {**log, **update_data})
     eq_log = {
-        "id": generate_id(), "equipment_id": log["equipment_id"], "log_type": "Mantenimiento",
+        "id": generate_id(), "equipment_id": log["equipment_id"], "company_id": log.get("company_id"),
+        "log_type": "Mantenimiento",
         "description": f"Mantenimiento {log['maintenance_type']} completado",
         "performed_by": current_user["id"], "created_at": now_iso()
     }
     await db.equipment_logs.insert_one(eq_log)
+    await refresh_alerts(log.get("company_id"))
+    await _publish_maintenance(log, "Finalizado")
 
-    # Send email notification for completed maintenance (per-company)
+    # Queue email notification for completed maintenance (per-company)
     try:
-        eq = await db.equipment.find_one({"id": log["equipment_id"]}, {"_id": 0})
+        eq = await db.equipment.find_one({"id": log["equipment_id"]}, {"_id": 0, "company_id": 1, "inventory_code": 1})
         company_id = eq.get("company_id") if eq else None
         if company_id:
             notif_settings = await db.notification_settings.find_one(
                 {"type": "company_notifications", "company_id": company_id}, {"_id": 0}
             )
             if notif_settings and notif_settings.get("maintenance_completed_enabled", True):
-                company = await db.companies.find_one({"id": company_id}, {"_id": 0})
-                updated_log = await db.maintenance_logs.find_one({"id": log_id}, {"_id": 0})
+                company = await db.companies.find_one({"id": company_id}, COMPANY_BRANDING_FIELDS)
+                updated_log = {**log, **update_data}
                 updated_log["equipment_code"] = eq.get("inventory_code", "N/A") if eq else "N/A"
 
                 template_data = {
@@ -167,10 +189,8 @@ async def complete_maintenance(log_id: str, notes: Optional[str] = None, solutio
                 subject, html = get_email_template("maintenance_completed", template_data)
                 recipients = await get_recipients_for_company(company_id, notif_settings)
                 global_admins = await get_global_admin_emails()
-                all_recipients = list(set(recipients + global_admins))
-                for email_addr in all_recipients:
-                    await send_email(email_addr, subject, html)
-                    await asyncio.sleep(0.1)
+                await enqueue_email(recipients + global_admins, subject, html,
+                                    {"type": "maintenance_completed", "company_id": company_id, "maintenance_id": log_id})
     except Exception as e:
         logging.error(f"Error sending maintenance completed email: {str(e)}")
 
@@ -1,14 +1,21 @@
-from fastapi import APIRouter, HTTPException, Depends, Query
+import asyncio
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from fastapi.responses import StreamingResponse
 from typing import Optional, List
-from datetime import datetime, timezone
 from database import db
-from auth import get_current_user, check_permission
+from auth import get_current_user, get_stream_user, check_permission
+from config import ALERT_STREAM_POLL_SECONDS
 from models import NotificationSettings, NotificationSendRequest, EmailTestRequest
 from services.email_service import (
-    send_email, get_email_template, send_automatic_notifications,
-    send_notifications_for_company, update_scheduler_job, scheduler
+    send_email, enqueue_email, get_email_template, send_automatic_notifications,
+    send_notifications_for_company, save_scheduler_job, scheduler, outbox_summary, EQUIPMENT_CODE_REF,
+    COMPANY_BRANDING_FIELDS, MAINTENANCE_TEMPLATE_FIELDS, TICKET_TEMPLATE_FIELDS, expiring_services
 )
-from helpers import now_iso
+from helpers import now_iso, iso
+from services.resolver_service import resolve_refs
+from services.alert_service import get_alert_feed, alert_scope, alerts_topic
+from services.events_service import subscribe, sse
+from services.scheduler_lease_service import is_scheduler_leader, LEASE_NAME
 
 router = APIRouter()
 
@@ -105,7 +112,7 @@ async def update_notification_settings(
         {"type": "company_notifications", "auto_send_enabled": True}
     )
     global_auto = settings_data.auto_send_enabled if not company_id else (any_auto > 0)
-    await update_scheduler_job(enabled=global_auto, send_time=settings_data.send_time)
+    await save_scheduler_job(enabled=global_auto, send_time=settings_data.send_time)
 
     return result
 
@@ -116,11 +123,13 @@ async def update_notification_settings(
 async def get_all_company_notification_settings(current_user: dict = Depends(get_current_user)):
     """Returns notification settings for all companies"""
     companies = await db.companies.find({"is_active": {"$ne": False}}, {"_id": 0, "id": 1, "name": 1}).to_list(100)
+    settings_list = await db.notification_settings.find(
+        {"type": "company_notifications", "company_id": {"$in": [c["id"] for c in companies]}}, {"_id": 0}
+    ).to_list(None)
+    settings_by_company = {s["company_id"]: s for s in settings_list}
     result = []
     for c in companies:
-        settings = await db.notification_settings.find_one(
-            {"type": "company_notifications", "company_id": c["id"]}, {"_id": 0}
-        )
+        settings = settings_by_company.get(c["id"])
         result.append({
             "company_id": c["id"],
             "company_name": c.get("name", ""),
@@ -135,40 +144,33 @@ async def get_all_company_notification_settings(current_user: dict = Depends(get
 
 @router.get("/notifications/check")
 async def check_notifications(current_user: dict = Depends(get_current_user)):
-    pending_maintenance = await db.maintenance_logs.find(
-        {"status": {"$in": ["Pendiente", "En Proceso"]}},
-        {"_id": 0, "id": 1, "maintenance_type": 1, "description": 1, "equipment_id": 1, "status": 1}
-    ).to_list(50)
-    for m in pending_maintenance:
-        eq = await db.equipment.find_one({"id": m["equipment_id"]}, {"_id": 0})
-        m["equipment_code"] = eq.get("inventory_code", "N/A") if eq else "N/A"
-
-    today = datetime.now(timezone.utc)
-    services = await db.external_services.find({"is_active": {"$ne": False}}, {"_id": 0}).to_list(500)
-    expiring_services = []
-    for svc in services:
-        if svc.get("renewal_date"):
+    return await get_alert_feed(alert_scope(current_user))
+
+
+async def _alert_events(request: Request, scope: str):
+    # Subscribe before the first read so no refresh falls in between
+    with subscribe(alerts_topic(scope)) as queue:
+        feed = await get_alert_feed(scope)
+        sent_at = feed["updated_at"]
+        yield sse("alerts", feed)
+        while not await request.is_disconnected():
             try:
-                renewal = datetime.fromisoformat(svc["renewal_date"].replace("Z", "+00:00"))
-                days_until = (renewal - today).days
-                if 0 <= days_until <= 30:
-                    company = await db.companies.find_one({"id": svc.get("company_id")}, {"_id": 0})
-                    expiring_services.append({
-                        "id": svc["id"], "provider": svc.get("provider"),
-                        "service_type": svc.get("service_type"),
-                        "company_name": company.get("name") if company else "N/A",
-                        "renewal_date": svc["renewal_date"], "days_until": days_until
-                    })
-            except Exception:
-                pass
+                _, feed = await asyncio.wait_for(queue.get(), ALERT_STREAM_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                # Catches refreshes whose events were missed
+                feed = await get_alert_feed(scope)
+            if feed["updated_at"] != sent_at:
+                sent_at = feed["updated_at"]
+                yield sse("alerts", feed)
+            else:
+                yield ": keepalive\n\n"
 
-    return {
-        "pending_maintenance": pending_maintenance,
-        "expiring_services": sorted(expiring_services, key=lambda x: x.get("days_until", 999)),
-        "completed_maintenance": await db.maintenance_logs.count_documents({"status": "Finalizado"}),
-        "open_tickets": await db.tickets.count_documents({"status": {"$in": ["Abierto", "En Proceso"]}}),
-        "total_alerts": len(pending_maintenance) + len(expiring_services)
-    }
+
+@router.get("/notifications/stream")
+async def stream_notifications(request: Request, current_user: dict = Depends(get_stream_user)):
+    """Server-sent events: the alert feed now and every time it changes (token in the query string)"""
+    return StreamingResponse(_alert_events(request, alert_scope(current_user)), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 # ==================== NOTIFICATION HISTORY ====================
@@ -179,6 +181,19 @@ async def get_notification_history(current_user: dict = Depends(get_current_user
     return history
 
 
+@router.get("/notifications/outbox")
+async def get_email_outbox(
+    status: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    current_user: dict = Depends(get_current_user)
+):
+    """Queued and recent notification emails, without their HTML body"""
+    await check_permission(current_user, "admin")
+    query = {"status": status} if status else {}
+    messages = await db.email_outbox.find(query, {"_id": 0, "html": 0}).sort("created_at", -1).to_list(limit)
+    return {"summary": await outbox_summary(), "messages": messages}
+
+
 # ==================== EMAIL NOTIFICATIONS ====================
 
 @router.post("/notifications/email/test")
@@ -208,7 +223,7 @@ async def send_notification_email(
 
     # If company_id provided, send company-specific notifications
     if company_id:
-        company = await db.companies.find_one({"id": company_id}, {"_id": 0})
+        company = await db.companies.find_one({"id": company_id}, COMPANY_BRANDING_FIELDS)
         if not company:
             raise HTTPException(status_code=404, detail="Empresa no encontrada")
         notif_settings = await db.notification_settings.find_one(
@@ -233,7 +248,7 @@ async def send_notification_email(
             "total_sent": len(sent),
             "triggered_by": current_user.get("name", current_user.get("email"))
         })
-        return {"message": f"Notificaciones enviadas: {len(sent)}", "sent": len(sent)}
+        return {"message": f"Notificaciones en cola: {len(sent)}", "sent": len(sent)}
 
     # Global send (legacy behavior)
     app_settings = await db.settings.find_one({"type": "system"}, {"_id": 0}) or {}
@@ -244,39 +259,26 @@ async def send_notification_email(
     }
 
     if data.notification_type == "maintenance_pending":
-        maintenances = await db.maintenance_logs.find({"status": {"$in": ["Pendiente", "En Proceso"]}}, {"_id": 0}).to_list(100)
-        for m in maintenances:
-            eq = await db.equipment.find_one({"id": m["equipment_id"]}, {"_id": 0})
-            m["equipment_code"] = eq.get("inventory_code", "N/A") if eq else "N/A"
+        maintenances = await db.maintenance_logs.find({"status": {"$in": ["Pendiente", "En Proceso"]}},
+                                                      MAINTENANCE_TEMPLATE_FIELDS).to_list(100)
+        await resolve_refs(maintenances, EQUIPMENT_CODE_REF)
         template_data["maintenances"] = maintenances
         if not maintenances:
             return {"message": "No hay mantenimientos pendientes", "sent": 0}
     elif data.notification_type == "service_renewal":
-        today = datetime.now(timezone.utc)
-        services = await db.external_services.find({"is_active": {"$ne": False}}, {"_id": 0}).to_list(500)
-        expiring = []
-        for svc in services:
-            if svc.get("renewal_date"):
-                try:
-                    renewal = datetime.fromisoformat(svc["renewal_date"].replace("Z", "+00:00"))
-                    days_until = (renewal - today).days
-                    if 0 <= days_until <= 30:
-                        expiring.append({**svc, "days_until": days_until})
-                except Exception:
-                    pass
-        template_data["services"] = sorted(expiring, key=lambda x: x.get("days_until", 999))
+        expiring = await expiring_services({}, 30)
+        template_data["services"] = expiring
         if not expiring:
             return {"message": "No hay servicios proximos a renovar", "sent": 0}
     elif data.notification_type == "maintenance_completed":
-        completed = await db.maintenance_logs.find({"status": "Finalizado"}, {"_id": 0}).sort("completed_at", -1).to_list(50)
-        for m in completed:
-            eq = await db.equipment.find_one({"id": m.get("equipment_id")}, {"_id": 0})
-            m["equipment_code"] = eq.get("inventory_code", "N/A") if eq else "N/A"
+        completed = await db.maintenance_logs.find({"status": "Finalizado"},
+                                                   MAINTENANCE_TEMPLATE_FIELDS).sort("completed_at", -1).to_list(50)
+        await resolve_refs(completed, EQUIPMENT_CODE_REF)
         template_data["maintenances"] = completed
         if not completed:
             return {"message": "No hay mantenimientos realizados", "sent": 0}
     elif data.notification_type == "tickets_open":
-        tickets = await db.tickets.find({"status": {"$in": ["Abierto", "En Proceso"]}}, {"_id": 0}).to_list(100)
+        tickets = await db.tickets.find({"status": {"$in": ["Abierto", "En Proceso"]}}, TICKET_TEMPLATE_FIELDS).to_list(100)
         template_data["tickets"] = tickets
         if not tickets:
             return {"message": "No hay tickets abiertos", "sent": 0}
@@ -286,20 +288,17 @@ async def send_notification_email(
     subject, html = get_email_template(data.notification_type, template_data)
     recipients = data.recipient_emails if data.recipient_emails else [u["email"] for u in await db.users.find({"is_active": True}, {"_id": 0, "email": 1}).to_list(100) if u.get("email")]
 
-    results = []
-    for email_addr in recipients:
-        result = await send_email(email_addr, subject, html)
-        results.append(result)
+    message = await enqueue_email(recipients, subject, html, {"type": data.notification_type})
+    queued = message["recipient_count"] if message else 0
 
     await db.notification_history.insert_one({
         "sent_at": now_iso(), "type": "manual",
         "notification_type": data.notification_type,
-        "total_sent": len([r for r in results if r.get("status") == "success"]),
-        "total_failed": len([r for r in results if r.get("status") != "success"]),
+        "total_sent": queued,
+        "outbox_id": message["id"] if message else None,
         "triggered_by": current_user.get("name", current_user.get("email"))
     })
-    successful = len([r for r in results if r.get("status") == "success"])
-    return {"message": f"Notificaciones enviadas: {successful}/{len(recipients)}", "sent": successful, "results": results}
+    return {"message": f"Notificaciones en cola: {queued}", "sent": queued, "outbox_id": message["id"] if message else None}
 
 
 @router.post("/notifications/send-now")
@@ -310,7 +309,7 @@ async def trigger_automatic_notifications(
     """Manually trigger notifications - optionally for a specific company"""
     await check_permission(current_user, "admin")
     if company_id:
-        company = await db.companies.find_one({"id": company_id}, {"_id": 0})
+        company = await db.companies.find_one({"id": company_id}, COMPANY_BRANDING_FIELDS)
         if not company:
             raise HTTPException(status_code=404, detail="Empresa no encontrada")
         notif_settings = await db.notification_settings.find_one(
@@ -319,7 +318,7 @@ async def trigger_automatic_notifications(
         if not notif_settings:
             return {"message": "No hay configuracion de notificaciones para esta empresa", "sent": 0}
         sent = await send_notifications_for_company(company_id, company, notif_settings)
-        return {"message": f"Notificaciones enviadas para {company.get('name', '')}: {len(sent)}", "sent": len(sent)}
+        return {"message": f"Notificaciones en cola para {company.get('name', '')}: {len(sent)}", "sent": len(sent)}
     else:
         await send_automatic_notifications()
         return {"message": "Notificaciones automaticas ejecutadas (todas las empresas)"}
@@ -327,10 +326,13 @@ async def trigger_automatic_notifications(
 
 @router.get("/notifications/scheduler/status")
 async def get_scheduler_status(current_user: dict = Depends(get_current_user)):
+    """Scheduler of the worker answering; only the holder of the scheduler lease runs the jobs"""
     job = scheduler.get_job("auto_notifications")
-    running = scheduler.running if hasattr(scheduler, 'running') else False
+    lease = await db.scheduler_leases.find_one({"_id": LEASE_NAME}, {"_id": 0, "owner": 1, "expires_at": 1})
     return {
-        "scheduler_running": running,
+        "scheduler_running": is_scheduler_leader(),
+        "lease_owner": lease["owner"] if lease else None,
+        "lease_expires_at": iso(lease["expires_at"]) if lease else None,
         "job_active": job is not None,
         "next_run": str(job.next_run_time) if job else None,
         "job_id": "auto_notifications" if job else None
@@ -1,27 +1,38 @@
-from fastapi import APIRouter, HTTPException, Depends
-from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Depends, Query
+from typing import List, Optional, Union
 from database import db
 from auth import get_current_user, check_permission
-from models import ExternalServiceCreate, ExternalServiceResponse
-from helpers import generate_id, now_iso
+from models import ExternalServiceCreate, ExternalServiceResponse, Page
+from helpers import generate_id, now_iso, projection
+from services.resolver_service import Ref, resolve_refs
+from services.pagination_service import list_response, PAGE_MAX_LIMIT
+from services.alert_service import refresh_alerts
 
 router = APIRouter()
 
+SERVICE_REFS = (
+    Ref("company_id", "companies", {"company_name": "name"}),
+)
+SERVICE_PROJECTION = projection(ExternalServiceResponse)
 
-@router.get("/external-services", response_model=List[ExternalServiceResponse])
-async def get_external_services(company_id: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+
+async def _build_services(docs: List[dict]) -> List[ExternalServiceResponse]:
+    await resolve_refs(docs, *SERVICE_REFS)
+    return [ExternalServiceResponse(**svc) for svc in docs]
+
+
+@router.get("/external-services", response_model=Union[List[ExternalServiceResponse], Page[ExternalServiceResponse]])
+async def get_external_services(company_id: Optional[str] = None,
+                                limit: Optional[int] = Query(None, ge=1, le=PAGE_MAX_LIMIT),
+                                cursor: Optional[str] = None, stream: bool = False,
+                                current_user: dict = Depends(get_current_user)):
     query = {"is_active": {"$ne": False}}
     if company_id:
         query["company_id"] = company_id
     elif current_user.get("company_id"):
         query["company_id"] = current_user["company_id"]
-    services = await db.external_services.find(query, {"_id": 0}).to_list(1000)
-    result = []
-    for svc in services:
-        company = await db.companies.find_one({"id": svc["company_id"]}, {"_id": 0})
-        svc["company_name"] = company["name"] if company else None
-        result.append(ExternalServiceResponse(**svc))
-    return result
+    return await list_response(db.external_services, query, _build_services, limit, cursor, stream,
+                               projection=SERVICE_PROJECTION)
 
 
 @router.post("/external-services", response_model=ExternalServiceResponse)
@@ -35,8 +46,8 @@ async def create_external_service(svc_data: ExternalServiceCreate, current_user:
         "custom_fields": svc_data.custom_fields, "is_active": True, "created_at": now_iso()
     }
     await db.external_services.insert_one(service)
-    company = await db.companies.find_one({"id": svc_data.company_id}, {"_id": 0})
-    service["company_name"] = company["name"] if company else None
+    await refresh_alerts(service["company_id"])
+    await resolve_refs([service], *SERVICE_REFS)
     return ExternalServiceResponse(**service)
 
 
@@ -44,19 +55,22 @@ async def create_external_service(svc_data: ExternalServiceCreate, current_user:
 async def update_external_service(service_id: str, svc_data: ExternalServiceCreate, current_user: dict = Depends(get_current_user)):
     await check_permission(current_user, "services.write")
     update_data = svc_data.model_dump()
-    result = await db.external_services.update_one({"id": service_id}, {"$set": update_data})
-    if result.matched_count == 0:
+    before = await db.external_services.find_one_and_update({"id": service_id}, {"$set": update_data},
+                                                            projection={"_id": 0, "company_id": 1})
+    if before is None:
         raise HTTPException(status_code=404, detail="Servicio no encontrado")
-    service = await db.external_services.find_one({"id": service_id}, {"_id": 0})
-    company = await db.companies.find_one({"id": service["company_id"]}, {"_id": 0})
-    service["company_name"] = company["name"] if company else None
+    await refresh_alerts(before.get("company_id"), update_data["company_id"])
+    service = await db.external_services.find_one({"id": service_id}, SERVICE_PROJECTION)
+    await resolve_refs([service], *SERVICE_REFS)
     return ExternalServiceResponse(**service)
 
 
 @router.delete("/external-services/{service_id}")
 async def delete_external_service(service_id: str, current_user: dict = Depends(get_current_user)):
     await check_permission(current_user, "services.write")
-    result = await db.external_services.update_one({"id": service_id}, {"$set": {"is_active": False}})
-    if result.matched_count == 0:
+    before = await db.external_services.find_one_and_update({"id": service_id}, {"$set": {"is_active": False}},
+                                                            projection={"_id": 0, "company_id": 1})
+    if before is None:
         raise HTTPException(status_code=404, detail="Servicio no encontrado")
+    await refresh_alerts(before.get("company_id"))
     return {"message": "Servicio desactivado"}
@@ -1,12 +1,17 @@
 from fastapi import APIRouter, HTTPException, Depends, Query
-from typing import List, Optional
-import asyncio
+from typing import List, Optional, Union
 import logging
 from database import db
-from auth import get_current_user
-from models import TicketCreate, TicketUpdate, TicketResponse, TicketCommentCreate, TicketCommentResponse
-from helpers import generate_id, now_iso
-from services.email_service import send_email
+from auth import get_current_user, is_solicitante
+from models import TicketCreate, TicketUpdate, TicketResponse, TicketCommentCreate, TicketCommentResponse, Page
+from helpers import generate_id, now_iso, projection
+from services.email_service import enqueue_email
+from services.resolver_service import Ref, resolve_refs
+from services.pagination_service import list_response, PAGE_MAX_LIMIT
+from services.counter_service import next_sequence, TICKETS_KEY
+from services.rollup_service import record, ticket_company
+from services.alert_service import refresh_alerts
+from services.events_service import publish_to_company
 
 router = APIRouter()
 
@@ -14,17 +19,29 @@ TICKET_STATUSES = ["Abierto", "En Proceso", "Resuelto", "Cerrado"]
 TICKET_PRIORITIES = ["Baja", "Media", "Alta", "Critica"]
 TICKET_CATEGORIES = ["General", "Hardware", "Software", "Red", "Accesos", "Email", "Impresora", "Otro"]
 
+TICKET_REFS = (
+    Ref("equipment_id", "equipment", {"equipment_code": "inventory_code"}),
+    Ref("assigned_to", "users", {"assigned_to_name": "name"}),
+    Ref("created_by", "users", {"created_by_name": "name"}),
+)
+COMMENT_REFS = (
+    Ref("author_id", "users", {"author_name": "name"}),
+)
+# company_id is not returned but feeds the rollups
+TICKET_PROJECTION = projection(TicketResponse, "company_id")
+COMMENT_PROJECTION = projection(TicketCommentResponse)
 
-async def _is_solicitante(user: dict) -> bool:
-    if user.get("role_id"):
-        role = await db.roles.find_one({"id": user["role_id"]}, {"_id": 0, "name": 1})
-        if role and role.get("name") == "Solicitante":
-            return True
-    return False
+
+async def _publish_ticket(action: str, ticket: dict):
+    """Push a ticket change to the /events/stream subscribers; they refetch what they need"""
+    await publish_to_company("tickets", ticket.get("company_id"), {
+        "action": action, "ticket_id": ticket["id"], "ticket_number": ticket.get("ticket_number"),
+        "status": ticket.get("status"), "created_by": ticket.get("created_by"),
+    })
 
 
 async def _send_ticket_email(ticket: dict, event_type: str, extra_info: str = ""):
-    """Send email notification for ticket events"""
+    """Queue the email notification for a ticket event"""
     try:
         ticket_number = ticket.get("ticket_number", "N/A")
         title = ticket.get("title", "")
@@ -46,11 +63,7 @@ async def _send_ticket_email(ticket: dict, event_type: str, extra_info: str = ""
                 recipients.add(tech["email"])
 
         # Get custom recipients from notification settings (per-company or global)
-        eq = None
-        if ticket.get("equipment_id"):
-            eq = await db.equipment.find_one({"id": ticket["equipment_id"]}, {"_id": 0, "company_id": 1})
-        company_id = eq.get("company_id") if eq else None
-
+        company_id = ticket.get("company_id")
         if company_id:
             notif_settings = await db.notification_settings.find_one(
                 {"type": "company_notifications", "company_id": company_id}, {"_id": 0}
@@ -106,49 +119,40 @@ async def _send_ticket_email(ticket: dict, event_type: str, extra_info: str = ""
             <div class="footer">Notificación automática de InventarioTI</div>
         </div></body></html>"""
 
-        for email_addr in recipients:
-            await send_email(email_addr, subject, html)
-            await asyncio.sleep(0.1)
+        await enqueue_email(list(recipients), subject, html, {"type": f"ticket_{event_type}", "ticket_id": ticket.get("id")})
     except Exception as e:
         logging.error(f"Error sending ticket email: {str(e)}")
 
 
 async def _enrich_ticket(ticket: dict) -> dict:
-    if ticket.get("equipment_id"):
-        eq = await db.equipment.find_one({"id": ticket["equipment_id"]}, {"_id": 0, "inventory_code": 1})
-        ticket["equipment_code"] = eq.get("inventory_code") if eq else None
-    if ticket.get("assigned_to"):
-        user = await db.users.find_one({"id": ticket["assigned_to"]}, {"_id": 0, "name": 1})
-        ticket["assigned_to_name"] = user.get("name") if user else None
-    if ticket.get("created_by"):
-        user = await db.users.find_one({"id": ticket["created_by"]}, {"_id": 0, "name": 1})
-        ticket["created_by_name"] = user.get("name") if user else None
+    await resolve_refs([ticket], *TICKET_REFS)
     return ticket
 
 
 async def _next_ticket_number() -> str:
-    last = await db.tickets.find({}, {"_id": 0, "ticket_number": 1}).sort("created_at", -1).to_list(1)
-    if last and last[0].get("ticket_number"):
-        try:
-            num = int(last[0]["ticket_number"].replace("TK-", "")) + 1
-        except ValueError:
-            num = 1
-    else:
-        num = 1
+    num = await next_sequence(TICKETS_KEY)
     return f"TK-{num:04d}"
 
 
-@router.get("/tickets", response_model=List[TicketResponse])
+async def _build_tickets(docs: List[dict]) -> List[TicketResponse]:
+    await resolve_refs(docs, *TICKET_REFS)
+    return [TicketResponse(**t) for t in docs]
+
+
+@router.get("/tickets", response_model=Union[List[TicketResponse], Page[TicketResponse]])
 async def get_tickets(
     status: Optional[str] = None,
     priority: Optional[str] = None,
     category: Optional[str] = None,
     assigned_to: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=PAGE_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    stream: bool = False,
     current_user: dict = Depends(get_current_user)
 ):
     query = {}
     # Solicitante only sees their own tickets
-    if await _is_solicitante(current_user):
+    if await is_solicitante(current_user):
         query["created_by"] = current_user.get("id")
     if status:
         query["status"] = status
@@ -159,18 +163,14 @@ async def get_tickets(
     if assigned_to:
         query["assigned_to"] = assigned_to
 
-    tickets = await db.tickets.find(query, {"_id": 0}).sort("created_at", -1).to_list(500)
-    result = []
-    for t in tickets:
-        t = await _enrich_ticket(t)
-        result.append(TicketResponse(**t))
-    return result
+    return await list_response(db.tickets, query, _build_tickets, limit, cursor, stream,
+                               sort=[("created_at", -1)], projection=TICKET_PROJECTION)
 
 
 @router.get("/tickets/stats")
 async def get_ticket_stats(current_user: dict = Depends(get_current_user)):
     base_query = {}
-    if await _is_solicitante(current_user):
+    if await is_solicitante(current_user):
         base_query["created_by"] = current_user.get("id")
 
     total = await db.tickets.count_documents(base_query)
@@ -226,10 +226,10 @@ async def get_my_assigned_equipment(current_user: dict = Depends(get_current_use
 
 @router.get("/tickets/{ticket_id}", response_model=TicketResponse)
 async def get_ticket(ticket_id: str, current_user: dict = Depends(get_current_user)):
-    ticket = await db.tickets.find_one({"id": ticket_id}, {"_id": 0})
+    ticket = await db.tickets.find_one({"id": ticket_id}, TICKET_PROJECTION)
     if not ticket:
         raise HTTPException(status_code=404, detail="Ticket no encontrado")
-    if await _is_solicitante(current_user) and ticket.get("created_by") != current_user.get("id"):
+    if await is_solicitante(current_user) and ticket.get("created_by") != current_user.get("id"):
         raise HTTPException(status_code=403, detail="No tiene acceso a este ticket")
     ticket = await _enrich_ticket(ticket)
     return TicketResponse(**ticket)
@@ -254,7 +254,11 @@ async def create_ticket(data: TicketCreate, current_user: dict = Depends(get_cur
         "updated_at": now_iso(),
         "closed_at": None
     }
+    ticket["company_id"] = await ticket_company(ticket)
     await db.tickets.insert_one(ticket)
+    await record("ticket", None, ticket)
+    await refresh_alerts(ticket["company_id"])
+    await _publish_ticket("created", ticket)
     ticket = await _enrich_ticket(ticket)
     del ticket["_id"]
 
@@ -266,10 +270,10 @@ async def create_ticket(data: TicketCreate, current_user: dict = Depends(get_cur
 
 @router.put("/tickets/{ticket_id}", response_model=TicketResponse)
 async def update_ticket(ticket_id: str, data: TicketUpdate, current_user: dict = Depends(get_current_user)):
-    ticket = await db.tickets.find_one({"id": ticket_id}, {"_id": 0})
+    ticket = await db.tickets.find_one({"id": ticket_id}, TICKET_PROJECTION)
     if not ticket:
         raise HTTPException(status_code=404, detail="Ticket no encontrado")
-    if await _is_solicitante(current_user):
+    if await is_solicitante(current_user):
         raise HTTPException(status_code=403, detail="No tiene permisos para modificar tickets")
 
     update_data = data.model_dump(exclude_unset=True)
@@ -278,9 +282,17 @@ async def update_ticket(ticket_id: str, data: TicketUpdate, current_user: dict =
     if "status" in update_data:
         if update_data["status"] in ["Resuelto", "Cerrado"] and not ticket.get("closed_at"):
             update_data["closed_at"] = now_iso()
+    if "equipment_id" in update_data:
+        update_data["company_id"] = await ticket_company({**ticket, **update_data})
 
     await db.tickets.update_one({"id": ticket_id}, {"$set": update_data})
-    updated = await db.tickets.find_one({"id": ticket_id}, {"_id": 0})
+    updated = await db.tickets.find_one({"id": ticket_id}, TICKET_PROJECTION)
+    if "status" in update_data or "equipment_id" in update_data:
+        await record("ticket", ticket, updated)
+        await refresh_alerts(ticket.get("company_id"), updated.get("company_id"))
+    if ticket.get("company_id") != updated.get("company_id"):
+        await _publish_ticket("updated", ticket)
+    await _publish_ticket("updated", updated)
     updated = await _enrich_ticket(updated)
 
     # Send email notification if status changed
@@ -292,11 +304,14 @@ async def update_ticket(ticket_id: str, data: TicketUpdate, current_user: dict =
 
 @router.delete("/tickets/{ticket_id}")
 async def delete_ticket(ticket_id: str, current_user: dict = Depends(get_current_user)):
-    if await _is_solicitante(current_user):
+    if await is_solicitante(current_user):
         raise HTTPException(status_code=403, detail="No tiene permisos para eliminar tickets")
-    result = await db.tickets.delete_one({"id": ticket_id})
-    if result.deleted_count == 0:
+    deleted = await db.tickets.find_one_and_delete({"id": ticket_id}, projection={"_id": 0})
+    if not deleted:
         raise HTTPException(status_code=404, detail="Ticket no encontrado")
+    await record("ticket", deleted, None)
+    await refresh_alerts(deleted.get("company_id"))
+    await _publish_ticket("deleted", deleted)
     await db.ticket_comments.delete_many({"ticket_id": ticket_id})
     return {"message": "Ticket eliminado"}
 
@@ -305,26 +320,21 @@ async def delete_ticket(ticket_id: str, current_user: dict = Depends(get_current
 
 @router.get("/tickets/{ticket_id}/comments", response_model=List[TicketCommentResponse])
 async def get_ticket_comments(ticket_id: str, current_user: dict = Depends(get_current_user)):
-    if await _is_solicitante(current_user):
+    if await is_solicitante(current_user):
         ticket = await db.tickets.find_one({"id": ticket_id}, {"_id": 0, "created_by": 1})
         if not ticket or ticket.get("created_by") != current_user.get("id"):
             raise HTTPException(status_code=403, detail="No tiene acceso a este ticket")
-    comments = await db.ticket_comments.find({"ticket_id": ticket_id}, {"_id": 0}).sort("created_at", 1).to_list(100)
-    result = []
-    for c in comments:
-        if c.get("author_id"):
-            user = await db.users.find_one({"id": c["author_id"]}, {"_id": 0, "name": 1})
-            c["author_name"] = user.get("name") if user else None
-        result.append(TicketCommentResponse(**c))
-    return result
+    comments = await db.ticket_comments.find({"ticket_id": ticket_id}, COMMENT_PROJECTION).sort("created_at", 1).to_list(100)
+    await resolve_refs(comments, *COMMENT_REFS)
+    return [TicketCommentResponse(**c) for c in comments]
 
 
 @router.post("/tickets/{ticket_id}/comments", response_model=TicketCommentResponse)
 async def create_ticket_comment(ticket_id: str, data: TicketCommentCreate, current_user: dict = Depends(get_current_user)):
-    ticket = await db.tickets.find_one({"id": ticket_id})
+    ticket = await db.tickets.find_one({"id": ticket_id}, {"_id": 0, "created_by": 1})
     if not ticket:
         raise HTTPException(status_code=404, detail="Ticket no encontrado")
-    if await _is_solicitante(current_user) and ticket.get("created_by") != current_user.get("id"):
+    if await is_solicitante(current_user) and ticket.get("created_by") != current_user.get("id"):
         raise HTTPException(status_code=403, detail="No tiene acceso a este ticket")
 
     comment = {
@@ -339,8 +349,9 @@ async def create_ticket_comment(ticket_id: str, data: TicketCommentCreate, curre
     del comment["_id"]
 
     # Send email notification for new comment
-    ticket_for_email = await db.tickets.find_one({"id": ticket_id}, {"_id": 0})
+    ticket_for_email = await db.tickets.find_one({"id": ticket_id}, TICKET_PROJECTION)
     if ticket_for_email:
+        await _publish_ticket("commented", ticket_for_email)
         author_name = current_user.get("name", "Usuario")
         await _send_ticket_email(
             ticket_for_email, "comment",
@@ -1,24 +1,50 @@
 import logging
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from config import CORS_ORIGINS
-from database import db
+from database import db, query_counter, QueryCounter, warm_up_pool
 from auth import hash_password
 from helpers import generate_id, now_iso
 from routes import api_router
-from services.email_service import scheduler, update_scheduler_job
+from services.email_service import load_scheduler_job, start_outbox_workers, stop_outbox_workers
+from services.index_service import ensure_indexes
+from services.report_engine import shutdown_report_pool
+from services.migration_service import run_migrations
+from services.http_cache_service import conditional_get, start_version_sync, stop_version_sync
+from services.alert_service import ensure_alert_feeds, schedule_alert_roll
+from services.scheduler_lease_service import start_scheduler_lease, stop_scheduler_lease
+from services.events_service import start_event_relay, stop_event_relay
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = FastAPI(title="InventarioTI API", version="2.0.0")
 
+# Registered before count_queries, which then wraps it and also counts the 304 answers
+app.middleware("http")(conditional_get)
+
+
+@app.middleware("http")
+async def count_queries(request: Request, call_next):
+    """Expose the number of MongoDB queries issued while building the response"""
+    counter = QueryCounter()
+    token = query_counter.set(counter)
+    try:
+        response = await call_next(request)
+    finally:
+        query_counter.reset(token)
+    response.headers["X-Query-Count"] = str(counter.count)
+    return response
+
+
+# Added last so it is the outermost layer and also covers the 304 answers
 app.add_middleware(
     CORSMiddleware,
     allow_origins=CORS_ORIGINS,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Query-Count", "ETag"],
 )
 
 app.include_router(api_router)
@@ -84,7 +110,7 @@ async def init_default_roles():
         admin_user = {
             "id": generate_id(),
             "email": "admin@example.com",
-            "password": hash_password("adminpassword"),
+            "password": await hash_password("adminpassword"),
             "name": "Administrador",
             "role_id": admin_role_doc["id"] if admin_role_doc else None,
             "company_id": None,
@@ -98,18 +124,21 @@ async def init_default_roles():
 @app.on_event("startup")
 async def startup_event():
     logger.info("Starting InventarioTI API...")
+    await warm_up_pool()
+    await ensure_indexes(require_unique=True)
+    await run_migrations()
     await init_default_roles()
+    start_outbox_workers()
+    start_version_sync()
+    start_event_relay()
+    await ensure_alert_feeds()
 
-    # Initialize scheduler
+    # Initialize scheduler; it only runs jobs in the worker holding the scheduler lease
     try:
-        notif_settings = await db.notification_settings.find_one({"type": "notifications"}, {"_id": 0})
-        if notif_settings and notif_settings.get("auto_send_enabled"):
-            send_time = notif_settings.get("send_time", "08:00")
-            await update_scheduler_job(enabled=True, send_time=send_time)
-
-        if not scheduler.running:
-            scheduler.start()
-            logger.info("Notification scheduler started")
+        schedule_alert_roll()
+        await load_scheduler_job()
+        start_scheduler_lease()
+        logger.info("Notification scheduler started")
     except Exception as e:
         logger.error(f"Error initializing scheduler: {str(e)}")
 
@@ -118,6 +147,9 @@ async def startup_event():
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    if scheduler.running:
-        scheduler.shutdown()
-        logger.info("Notification scheduler stopped")
+    await stop_scheduler_lease()
+    logger.info("Notification scheduler stopped")
+    shutdown_report_pool()
+    await stop_outbox_workers()
+    await stop_version_sync()
+    await stop_event_relay()
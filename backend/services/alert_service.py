@@ -0,0 +1,141 @@
+"""Materialized alert feed served by /notifications/check.
+
+The `alert_feeds` collection holds one document per company, plus one under ALL_COMPANIES for
+users without a company. Each has the pending maintenances, the services renewing within
+ALERT_RENEWAL_DAYS and the counts of completed maintenances and open tickets. Routes call
+`refresh_alerts` after writing maintenances, services, tickets, equipment or companies, and
+`roll_alerts` recomputes every feed once a day so the days until renewal move on. A feed's
+`updated_at` is taken before its reads, and a feed never replaces one built after it.
+"""
+import asyncio
+import logging
+from datetime import date, datetime, timezone
+from typing import List, Optional
+from apscheduler.triggers.cron import CronTrigger
+from pymongo.errors import DuplicateKeyError
+from database import db
+from helpers import now_iso, iso, days_window, days_until
+from services.email_service import scheduler, run_daily_once, EQUIPMENT_CODE_REF
+from services.events_service import publish, topic, ALL_COMPANIES
+from services.resolver_service import Ref, resolve_refs
+
+logger = logging.getLogger(__name__)
+
+ALERT_RENEWAL_DAYS = 30
+PENDING_MAINTENANCE_LIMIT = 50
+OPEN_MAINTENANCE = ["Pendiente", "En Proceso"]
+OPEN_TICKETS = ["Abierto", "En Proceso"]
+
+SERVICE_COMPANY_REF = Ref("company_id", "companies", {"company_name": "name"}, default="N/A")
+
+
+def alerts_topic(scope: str) -> str:
+    return topic("alerts", scope)
+
+
+def alert_scope(user: dict) -> str:
+    """Users of a company see its alerts; the others see every company's"""
+    return user.get("company_id") or ALL_COMPANIES
+
+
+async def _expiring_services(company_filter: dict, today: date) -> List[dict]:
+    expiring = await db.external_services.find(
+        {**company_filter, "is_active": {"$ne": False}, "renewal_date": days_window(today, ALERT_RENEWAL_DAYS)},
+        {"_id": 0, "id": 1, "provider": 1, "service_type": 1, "company_id": 1, "renewal_date": 1}
+    ).sort("renewal_date", 1).to_list(None)
+    await resolve_refs(expiring, SERVICE_COMPANY_REF)
+    for svc in expiring:
+        svc["days_until"] = days_until(svc["renewal_date"], today)
+        svc["renewal_date"] = iso(svc["renewal_date"])
+        svc.setdefault("company_name", "N/A")
+        del svc["company_id"]
+    return expiring
+
+
+async def _pending_maintenance(company_filter: dict) -> List[dict]:
+    pending = await db.maintenance_logs.find(
+        {**company_filter, "status": {"$in": OPEN_MAINTENANCE}},
+        {"_id": 0, "id": 1, "maintenance_type": 1, "description": 1, "equipment_id": 1, "status": 1}
+    ).to_list(PENDING_MAINTENANCE_LIMIT)
+    await resolve_refs(pending, EQUIPMENT_CODE_REF)
+    return pending
+
+
+async def build_alert_feed(scope: str, today: date, built_at: Optional[str] = None) -> dict:
+    """The feed of `scope`; `built_at` (default: now) must be taken before the reads"""
+    built_at = built_at or now_iso()
+    company_filter = {} if scope == ALL_COMPANIES else {"company_id": scope}
+    pending, expiring, completed, open_tickets = await asyncio.gather(
+        _pending_maintenance(company_filter),
+        _expiring_services(company_filter, today),
+        db.maintenance_logs.count_documents({**company_filter, "status": "Finalizado"}),
+        db.tickets.count_documents({**company_filter, "status": {"$in": OPEN_TICKETS}}),
+    )
+    return {
+        "company_id": scope, "date": today.isoformat(), "updated_at": built_at,
+        "pending_maintenance": pending,
+        "expiring_services": expiring,
+        "completed_maintenance": completed,
+        "open_tickets": open_tickets,
+        "total_alerts": len(pending) + len(expiring),
+    }
+
+
+async def _refresh_scope(scope: str, today: date) -> dict:
+    """Rebuild and store the feed unless a build that started later already stored one"""
+    built_at = now_iso()
+    feed = await build_alert_feed(scope, today, built_at)
+    try:
+        await db.alert_feeds.replace_one(
+            {"company_id": scope, "$or": [{"updated_at": {"$lt": built_at}}, {"updated_at": {"$exists": False}}]},
+            feed, upsert=True,
+        )
+    except DuplicateKeyError:
+        # The upsert found no older feed to replace: the stored one is newer
+        return await db.alert_feeds.find_one({"company_id": scope}, {"_id": 0}) or feed
+    await publish(alerts_topic(scope), feed)
+    return feed
+
+
+async def refresh_alerts(*company_ids: Optional[str]):
+    """Recompute the feeds of the given companies and the all-companies feed.
+
+    A failure is logged and does not fail the write that triggered it; the next refresh or the
+    daily roll repairs the feed.
+    """
+    today = datetime.now(timezone.utc).date()
+    scopes = {company_id for company_id in company_ids if company_id} | {ALL_COMPANIES}
+    try:
+        await asyncio.gather(*(_refresh_scope(scope, today) for scope in scopes))
+    except Exception as e:
+        logger.error(f"Error refreshing alert feeds {sorted(scopes)}: {str(e)}")
+
+
+async def roll_alerts():
+    """Recompute every feed; runs daily after midnight UTC"""
+    today = datetime.now(timezone.utc).date()
+    company_ids = await db.companies.distinct("id")
+    for scope in [ALL_COMPANIES, *company_ids]:
+        await _refresh_scope(scope, today)
+    await db.alert_feeds.delete_many({"company_id": {"$nin": [ALL_COMPANIES, *company_ids]}})
+    logger.info(f"Alert feeds rolled for {len(company_ids)} companies")
+
+
+async def get_alert_feed(scope: str) -> dict:
+    feed = await db.alert_feeds.find_one({"company_id": scope}, {"_id": 0})
+    if feed is None:
+        feed = await _refresh_scope(scope, datetime.now(timezone.utc).date())
+    return feed
+
+
+async def ensure_alert_feeds():
+    """Build the feeds on first start, and roll them if the server was down at midnight"""
+    feed = await db.alert_feeds.find_one({"company_id": ALL_COMPANIES}, {"_id": 0, "date": 1})
+    if not feed or feed.get("date") != datetime.now(timezone.utc).date().isoformat():
+        await roll_alerts()
+
+
+def schedule_alert_roll():
+    scheduler.add_job(run_daily_once, CronTrigger(hour=0, minute=1, timezone="UTC"),
+                      args=["alert_feed_roll", 0, 1, roll_alerts], kwargs={"utc": True},
+                      id="alert_feed_roll", replace_existing=True)
@@ -0,0 +1,56 @@
+import copy
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+from config import AUTH_CACHE_TTL_SECONDS, AUTH_CACHE_MAX_ENTRIES
+
+
+class TTLCache:
+    """Bounded LRU cache whose entries also expire after `ttl` seconds.
+
+    Values are deep-copied on the way in and out so callers can mutate what they get.
+    The cache is per process: writes made by another worker are only seen after the TTL.
+    """
+
+    def __init__(self, name: str, max_entries: int, ttl: float):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return copy.deepcopy(entry[1])
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Store `value`; `ttl` overrides the cache default for this entry"""
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0 or self.max_entries <= 0:
+            return
+        self._entries[key] = (time.monotonic() + ttl, copy.deepcopy(value))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {"name": self.name, "size": len(self._entries), "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl, "hits": self.hits, "misses": self.misses}
+
+
+user_cache = TTLCache("users", AUTH_CACHE_MAX_ENTRIES, AUTH_CACHE_TTL_SECONDS)
+role_cache = TTLCache("roles", AUTH_CACHE_MAX_ENTRIES, AUTH_CACHE_TTL_SECONDS)
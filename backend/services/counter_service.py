@@ -0,0 +1,85 @@
+from typing import Optional, Tuple
+from helpers import now_iso
+from pymongo import ReturnDocument
+from database import db
+
+# Counters already aligned with the numbers stored before this collection existed
+_seeded = set()
+
+
+def invoice_key(company_id: str, serie: str) -> str:
+    return f"invoices:{company_id}:{serie}"
+
+
+def quotation_key(company_id: str) -> str:
+    return f"quotations:{company_id}"
+
+
+TICKETS_KEY = "tickets"
+
+
+async def _legacy_max(collection: str, field: str, prefix: str = "", query: Optional[dict] = None) -> int:
+    """Highest number already stored in `field` (after stripping `prefix`), 0 if none"""
+    pipeline = [
+        {"$match": {**(query or {}), field: {"$type": "string"}}},
+        {"$group": {"_id": None, "max": {"$max": {"$convert": {
+            "input": {"$substrCP": [f"${field}", len(prefix), 32]},
+            "to": "int", "onError": 0, "onNull": 0,
+        }}}}},
+    ]
+    result = await db[collection].aggregate(pipeline).to_list(1)
+    return result[0]["max"] if result and result[0].get("max") else 0
+
+
+async def _seed(key: str) -> None:
+    """Start a new counter after the numbers issued by the old count/sort based numbering.
+
+    Old numbers were global, so scoped counters are seeded from the global maximum;
+    `$max` keeps this idempotent and safe to race with other workers.
+    """
+    if key in _seeded:
+        return
+    kind, _, scope = key.partition(":")
+    if kind == "invoices":
+        serie = scope.split(":", 1)[1]
+        legacy = await _legacy_max("invoices", "folio", query={"serie": serie})
+    elif kind == "quotations":
+        legacy = await _legacy_max("quotations", "quotation_number", "COT-")
+    elif kind == "tickets":
+        legacy = await _legacy_max("tickets", "ticket_number", "TK-")
+    else:
+        legacy = 0
+    await db.counters.update_one({"_id": key}, {"$max": {"seq": legacy}}, upsert=True)
+    _seeded.add(key)
+
+
+async def reserve_sequence(key: str, count: int = 1) -> Tuple[int, int]:
+    """Atomically reserve `count` consecutive numbers; returns the first and last one"""
+    await _seed(key)
+    counter = await db.counters.find_one_and_update(
+        {"_id": key}, {"$inc": {"seq": count}},
+        upsert=True, return_document=ReturnDocument.AFTER,
+    )
+    return counter["seq"] - count + 1, counter["seq"]
+
+
+async def next_sequence(key: str) -> int:
+    first, _ = await reserve_sequence(key, 1)
+    return first
+
+
+async def reserve_numbers(key: str, count: int) -> Tuple[int, int]:
+    """Reserve `count` numbers for a batch import and record the range, see `is_reserved`"""
+    first, last = await reserve_sequence(key, count)
+    await db.number_reservations.insert_one({"key": key, "first": first, "last": last, "created_at": now_iso()})
+    return first, last
+
+
+async def is_reserved(key: str, number: int) -> bool:
+    """Whether `number` was handed out by `reserve_numbers` (numbers from `next_sequence` are not).
+
+    Whether it was already used is left to the unique index of the collection it is stored in.
+    """
+    return await db.number_reservations.find_one(
+        {"key": key, "first": {"$lte": number}, "last": {"$gte": number}}, {"_id": 1}
+    ) is not None
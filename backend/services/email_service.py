@@ -1,150 +1,305 @@
 import logging
 import asyncio
+import random
+import time
 import resend
-from datetime import datetime, timezone
+from string import Template
+from resend.exceptions import ResendError
+from datetime import datetime, timezone, timedelta
+from functools import lru_cache
+from typing import List, Optional
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
-from database import db
-from config import RESEND_API_KEY, SENDER_EMAIL
-from helpers import now_iso
+from database import db, reporting_db
+from config import (
+    RESEND_API_KEY, SENDER_EMAIL, EMAIL_WORKERS, EMAIL_RATE_PER_SECOND, EMAIL_MAX_ATTEMPTS, EMAIL_RETRY_BASE_SECONDS,
+    EMAIL_BATCH_SIZE, NOTIFICATION_CONCURRENCY, SCHEDULER_LEASE_TTL_SECONDS, SCHEDULER_LEASE_RENEW_SECONDS,
+)
+from helpers import generate_id, now_iso, iso, days_window, days_until
+from services.resolver_service import Ref, resolve_refs
 
 if RESEND_API_KEY:
     resend.api_key = RESEND_API_KEY
 
-scheduler = AsyncIOScheduler()
+# A job due while the scheduler lease changed hands (see services/scheduler_lease_service.py)
+# still runs on the new holder: the grace covers an expired lease plus one renewal period.
+# Daily jobs go through `run_daily_once`, so resuming never repeats a run that already happened.
+SCHEDULER_MISFIRE_GRACE_SECONDS = int(SCHEDULER_LEASE_TTL_SECONDS + 2 * SCHEDULER_LEASE_RENEW_SECONDS)
+scheduler = AsyncIOScheduler(job_defaults={"misfire_grace_time": SCHEDULER_MISFIRE_GRACE_SECONDS, "coalesce": True})
 
+EQUIPMENT_CODE_REF = Ref("equipment_id", "equipment", {"equipment_code": "inventory_code"}, default="N/A")
+# Company fields used for email branding
+COMPANY_BRANDING_FIELDS = {"_id": 0, "id": 1, "name": 1, "logo_url": 1}
 
-def get_email_template(notification_type: str, data: dict) -> tuple:
-    """Generate email subject and HTML content based on notification type"""
-    company_name = data.get('company_name', 'InventarioTI')
-    logo_url = data.get('logo_url', '')
-    primary_color = data.get('primary_color', '#3b82f6')
 
-    logo_html = f'<img src="{logo_url}" alt="{company_name}" style="max-height:50px;max-width:200px;">' if logo_url else f'<h2 style="color:{primary_color};margin:0;">{company_name}</h2>'
+# ==================== TEMPLATES ====================
+# The page around each notification (styles, header, fixed texts) depends only on the
+# notification type and the company branding, so it is compiled once per combination and
+# cached; each call only renders the item list, joined in one pass, and the timestamp.
 
-    base_style = f'''
+EMAIL_STYLE = Template("""
     <style>
-        body {{ font-family: Arial, sans-serif; background: #f4f4f4; margin: 0; padding: 20px; }}
-        .container {{ max-width: 600px; margin: 0 auto; background: white; border-radius: 8px; overflow: hidden; box-shadow: 0 2px 10px rgba(0,0,0,0.1); }}
-        .header {{ background: {primary_color}; padding: 20px; text-align: center; }}
-        .header img, .header h2 {{ margin: 0; }}
-        .content {{ padding: 30px; }}
-        .footer {{ background: #f8f9fa; padding: 15px; text-align: center; font-size: 12px; color: #666; }}
-        .btn {{ display: inline-block; padding: 12px 24px; background: {primary_color}; color: white; text-decoration: none; border-radius: 6px; margin-top: 15px; }}
-        .alert {{ padding: 15px; border-radius: 6px; margin: 15px 0; }}
-        .alert-warning {{ background: #fff3cd; border-left: 4px solid #ffc107; }}
-        .alert-info {{ background: #cce5ff; border-left: 4px solid #0d6efd; }}
-        .alert-success {{ background: #d4edda; border-left: 4px solid #28a745; }}
-        table {{ width: 100%; border-collapse: collapse; margin: 15px 0; }}
-        th, td {{ padding: 10px; text-align: left; border-bottom: 1px solid #eee; }}
-        th {{ background: #f8f9fa; font-weight: 600; }}
+        body { font-family: Arial, sans-serif; background: #f4f4f4; margin: 0; padding: 20px; }
+        .container { max-width: 600px; margin: 0 auto; background: white; border-radius: 8px; overflow: hidden; box-shadow: 0 2px 10px rgba(0,0,0,0.1); }
+        .header { background: $primary_color; padding: 20px; text-align: center; }
+        .header img, .header h2 { margin: 0; }
+        .content { padding: 30px; }
+        .footer { background: #f8f9fa; padding: 15px; text-align: center; font-size: 12px; color: #666; }
+        .btn { display: inline-block; padding: 12px 24px; background: $primary_color; color: white; text-decoration: none; border-radius: 6px; margin-top: 15px; }
+        .alert { padding: 15px; border-radius: 6px; margin: 15px 0; }
+        .alert-warning { background: #fff3cd; border-left: 4px solid #ffc107; }
+        .alert-info { background: #cce5ff; border-left: 4px solid #0d6efd; }
+        .alert-success { background: #d4edda; border-left: 4px solid #28a745; }
+        table { width: 100%; border-collapse: collapse; margin: 15px 0; }
+        th, td { padding: 10px; text-align: left; border-bottom: 1px solid #eee; }
+        th { background: #f8f9fa; font-weight: 600; }
     </style>
-    '''
-
-    if notification_type == 'service_renewal':
-        services = data.get('services', [])
-        subject = f"{company_name}: Servicios proximos a renovar"
-        services_html = ''
-        for svc in services:
-            days = svc.get('days_until', 0)
-            alert_class = 'alert-warning' if days <= 7 else 'alert-info'
-            services_html += f'''
-            <div class="alert {alert_class}">
-                <strong>{svc.get('provider', 'N/A')}</strong> - {svc.get('service_type', 'N/A')}<br>
-                <small>Vence en <strong>{days} dias</strong> ({svc.get('renewal_date', '')[:10]})</small>
-            </div>'''
-        html = f'''<!DOCTYPE html><html><head>{base_style}</head><body>
-            <div class="container"><div class="header">{logo_html}</div>
-            <div class="content"><h2>Servicios Proximos a Renovar</h2>
-            <p>Los siguientes servicios requieren atencion:</p>{services_html}
-            <p>Te recomendamos revisar y renovar estos servicios a tiempo.</p></div>
-            <div class="footer">Mensaje automatico de {company_name} - {datetime.now().strftime('%d/%m/%Y %H:%M')}</div>
-            </div></body></html>'''
-
-    elif notification_type == 'maintenance_pending':
-        maintenances = data.get('maintenances', [])
-        subject = f"{company_name}: Mantenimientos pendientes"
-        maint_rows = ''
-        for m in maintenances:
-            maint_rows += f'<tr><td>{m.get("equipment_code", "N/A")}</td><td>{m.get("maintenance_type", "N/A")}</td><td>{m.get("status", "N/A")}</td><td>{m.get("created_at", "")[:10]}</td></tr>'
-        html = f'''<!DOCTYPE html><html><head>{base_style}</head><body>
-            <div class="container"><div class="header">{logo_html}</div>
-            <div class="content"><h2>Mantenimientos Pendientes</h2>
-            <p>Tienes <strong>{len(maintenances)}</strong> mantenimiento(s) sin finalizar:</p>
+    """)
+
+# notification type -> (subject suffix, content with $count/$items/$message, footer prefix)
+EMAIL_CONTENT = {
+    "service_renewal": ("Servicios proximos a renovar", """<h2>Servicios Proximos a Renovar</h2>
+            <p>Los siguientes servicios requieren atencion:</p>$items
+            <p>Te recomendamos revisar y renovar estos servicios a tiempo.</p>""", "Mensaje automatico de "),
+    "maintenance_pending": ("Mantenimientos pendientes", """<h2>Mantenimientos Pendientes</h2>
+            <p>Tienes <strong>$count</strong> mantenimiento(s) sin finalizar:</p>
             <table><thead><tr><th>Equipo</th><th>Tipo</th><th>Estado</th><th>Fecha</th></tr></thead>
-            <tbody>{maint_rows}</tbody></table>
-            <p>Por favor, revisa y actualiza el estado de estos mantenimientos.</p></div>
-            <div class="footer">Mensaje automatico de {company_name} - {datetime.now().strftime('%d/%m/%Y %H:%M')}</div>
-            </div></body></html>'''
-
-    elif notification_type == 'maintenance_completed':
-        maintenances = data.get('maintenances', [])
-        subject = f"{company_name}: Mantenimientos realizados"
-        maint_details = ''
-        for m in maintenances:
-            detail_rows = f'<strong>Descripcion:</strong> {m.get("description", "")}<br>'
-            if m.get('technician'):
-                detail_rows += f'<strong>Tecnico:</strong> {m["technician"]}<br>'
-            if m.get('problem_diagnosis'):
-                detail_rows += f'<strong>Diagnostico:</strong> {m["problem_diagnosis"]}<br>'
-            if m.get('solution_applied'):
-                detail_rows += f'<strong>Solucion:</strong> {m["solution_applied"]}<br>'
-            if m.get('repair_time_hours'):
-                detail_rows += f'<strong>Tiempo:</strong> {m["repair_time_hours"]} horas<br>'
-            if m.get('parts_used'):
-                detail_rows += f'<strong>Materiales:</strong> {m["parts_used"]}<br>'
-            completed_at = m.get('completed_at', m.get('created_at', ''))[:10]
-            maint_details += f'''<div class="alert alert-success" style="margin-bottom:10px;">
-                <strong>{m.get("equipment_code","N/A")} - {m.get("maintenance_type","N/A")}</strong>
-                <span style="float:right;font-size:12px;color:#666;">Completado: {completed_at}</span>
-                <hr style="margin:8px 0;border:none;border-top:1px solid #ccc;"><div style="font-size:13px;">{detail_rows}</div></div>'''
-        html = f'''<!DOCTYPE html><html><head>{base_style}</head><body>
-            <div class="container"><div class="header">{logo_html}</div>
-            <div class="content"><h2>Mantenimientos Realizados</h2>
-            <p>Se han completado <strong>{len(maintenances)}</strong> mantenimiento(s):</p>{maint_details}</div>
-            <div class="footer">Mensaje automatico de {company_name} - {datetime.now().strftime('%d/%m/%Y %H:%M')}</div>
-            </div></body></html>'''
-
-    elif notification_type == 'tickets_open':
-        tickets = data.get('tickets', [])
-        subject = f"{company_name}: Tickets de soporte abiertos"
-        tickets_rows = ''
-        for t in tickets:
-            priority_colors = {"Baja": "#64748b", "Media": "#3b82f6", "Alta": "#f59e0b", "Critica": "#ef4444"}
-            p_color = priority_colors.get(t.get('priority', ''), '#3b82f6')
-            tickets_rows += f'<tr><td>{t.get("ticket_number", "")}</td><td>{t.get("title", "")[:40]}</td><td style="color:{p_color};font-weight:600;">{t.get("priority", "")}</td><td>{t.get("status", "")}</td><td>{t.get("created_at", "")[:10]}</td></tr>'
-        html = f'''<!DOCTYPE html><html><head>{base_style}</head><body>
-            <div class="container"><div class="header">{logo_html}</div>
-            <div class="content"><h2>Tickets de Soporte Abiertos</h2>
-            <p>Hay <strong>{len(tickets)}</strong> ticket(s) pendientes de atender:</p>
+            <tbody>$items</tbody></table>
+            <p>Por favor, revisa y actualiza el estado de estos mantenimientos.</p>""", "Mensaje automatico de "),
+    "maintenance_completed": ("Mantenimientos realizados", """<h2>Mantenimientos Realizados</h2>
+            <p>Se han completado <strong>$count</strong> mantenimiento(s):</p>$items""", "Mensaje automatico de "),
+    "tickets_open": ("Tickets de soporte abiertos", """<h2>Tickets de Soporte Abiertos</h2>
+            <p>Hay <strong>$count</strong> ticket(s) pendientes de atender:</p>
             <table><thead><tr><th>No.</th><th>Titulo</th><th>Prioridad</th><th>Estado</th><th>Fecha</th></tr></thead>
-            <tbody>{tickets_rows}</tbody></table>
-            <p>Por favor, revisa y atiende estos tickets.</p></div>
-            <div class="footer">Mensaje automatico de {company_name} - {datetime.now().strftime('%d/%m/%Y %H:%M')}</div>
-            </div></body></html>'''
-
-    else:
-        subject = f"{company_name}: Notificacion"
-        html = f'''<!DOCTYPE html><html><head>{base_style}</head><body>
+            <tbody>$items</tbody></table>
+            <p>Por favor, revisa y atiende estos tickets.</p>""", "Mensaje automatico de "),
+    "default": ("Notificacion", "<h2>Notificacion</h2><p>$message</p>", ""),
+}
+
+COMPLETED_DETAILS = (
+    ("technician", "Tecnico", ""),
+    ("problem_diagnosis", "Diagnostico", ""),
+    ("solution_applied", "Solucion", ""),
+    ("repair_time_hours", "Tiempo", " horas"),
+    ("parts_used", "Materiales", ""),
+)
+TICKET_PRIORITY_COLORS = {"Baja": "#64748b", "Media": "#3b82f6", "Alta": "#f59e0b", "Critica": "#ef4444"}
+
+# Fields the item builders below read; maintenance equipment_id feeds EQUIPMENT_CODE_REF
+SERVICE_TEMPLATE_FIELDS = {"_id": 0, "provider": 1, "service_type": 1, "renewal_date": 1}
+MAINTENANCE_TEMPLATE_FIELDS = {
+    "_id": 0, "equipment_id": 1, "maintenance_type": 1, "status": 1, "description": 1,
+    "created_at": 1, "completed_at": 1, **{field: 1 for field, _, _ in COMPLETED_DETAILS},
+}
+TICKET_TEMPLATE_FIELDS = {"_id": 0, "ticket_number": 1, "title": 1, "priority": 1, "status": 1, "created_at": 1}
+
+@lru_cache(maxsize=256)
+def _compile_template(kind: str, company_name: str, logo_url: str, primary_color: str) -> tuple:
+    """(subject, html before the content, content template, html before the timestamp)"""
+    title, content, footer = EMAIL_CONTENT[kind]
+    logo_html = f'<img src="{logo_url}" alt="{company_name}" style="max-height:50px;max-width:200px;">' if logo_url else f'<h2 style="color:{primary_color};margin:0;">{company_name}</h2>'
+    head = f"""<!DOCTYPE html><html><head>{EMAIL_STYLE.substitute(primary_color=primary_color)}</head><body>
             <div class="container"><div class="header">{logo_html}</div>
-            <div class="content"><h2>Notificacion</h2><p>{data.get('message', 'Tienes una nueva notificacion.')}</p></div>
-            <div class="footer">{company_name} - {datetime.now().strftime('%d/%m/%Y %H:%M')}</div>
-            </div></body></html>'''
+            <div class="content">"""
+    return f"{company_name}: {title}", head, Template(content), f"""</div>
+            <div class="footer">{footer}{company_name} - """
+
+
+def _service_items(services: list) -> str:
+    return "".join(f'''
+            <div class="alert {'alert-warning' if svc.get('days_until', 0) <= 7 else 'alert-info'}">
+                <strong>{svc.get('provider', 'N/A')}</strong> - {svc.get('service_type', 'N/A')}<br>
+                <small>Vence en <strong>{svc.get('days_until', 0)} dias</strong> ({svc.get('renewal_date', '')[:10]})</small>
+            </div>''' for svc in services)
+
+
+def _maintenance_rows(maintenances: list) -> str:
+    return "".join(
+        f'<tr><td>{m.get("equipment_code", "N/A")}</td><td>{m.get("maintenance_type", "N/A")}</td><td>{m.get("status", "N/A")}</td><td>{m.get("created_at", "")[:10]}</td></tr>'
+        for m in maintenances)
+
+
+def _completed_items(maintenances: list) -> str:
+    items = []
+    for m in maintenances:
+        details = f'<strong>Descripcion:</strong> {m.get("description", "")}<br>'
+        for field, label, suffix in COMPLETED_DETAILS:
+            if m.get(field):
+                details += f'<strong>{label}:</strong> {m[field]}{suffix}<br>'
+        items.append(f'''<div class="alert alert-success" style="margin-bottom:10px;">
+                <strong>{m.get("equipment_code","N/A")} - {m.get("maintenance_type","N/A")}</strong>
+                <span style="float:right;font-size:12px;color:#666;">Completado: {m.get('completed_at', m.get('created_at', ''))[:10]}</span>
+                <hr style="margin:8px 0;border:none;border-top:1px solid #ccc;"><div style="font-size:13px;">{details}</div></div>''')
+    return "".join(items)
+
 
+def _ticket_rows(tickets: list) -> str:
+    return "".join(
+        f'<tr><td>{t.get("ticket_number", "")}</td><td>{t.get("title", "")[:40]}</td><td style="color:{TICKET_PRIORITY_COLORS.get(t.get("priority", ""), "#3b82f6")};font-weight:600;">{t.get("priority", "")}</td><td>{t.get("status", "")}</td><td>{t.get("created_at", "")[:10]}</td></tr>'
+        for t in tickets)
+
+
+# notification type -> (data key of the item list, builder of its html)
+EMAIL_ITEMS = {
+    "service_renewal": ("services", _service_items),
+    "maintenance_pending": ("maintenances", _maintenance_rows),
+    "maintenance_completed": ("maintenances", _completed_items),
+    "tickets_open": ("tickets", _ticket_rows),
+}
+
+
+def get_email_template(notification_type: str, data: dict) -> tuple:
+    """Generate email subject and HTML content based on notification type"""
+    kind = notification_type if notification_type in EMAIL_CONTENT else "default"
+    subject, head, content, footer = _compile_template(
+        kind, data.get('company_name', 'InventarioTI'), data.get('logo_url', ''), data.get('primary_color', '#3b82f6'))
+
+    items = []
+    items_html = ""
+    if kind in EMAIL_ITEMS:
+        key, build = EMAIL_ITEMS[kind]
+        items = data.get(key, [])
+        items_html = build(items)
+    body = content.substitute(count=len(items), items=items_html,
+                              message=data.get('message', 'Tienes una nueva notificacion.'))
+    html = f"{head}{body}{footer}{datetime.now().strftime('%d/%m/%Y %H:%M')}</div>\n            </div></body></html>"
     return subject, html
 
 
+class TokenBucket:
+    """Allows `rate` acquisitions per second on average, with bursts of up to `capacity`"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class SharedTokenBucket:
+    """A TokenBucket whose tokens are stored in `rate_limits`, shared by every worker process.
+
+    Tokens are taken with a compare-and-set on the stored count, so concurrent processes
+    never spend the same token; a lost race simply reads the bucket again.
+    """
+
+    def __init__(self, name: str, rate: float, capacity: float):
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity
+        self._lock = asyncio.Lock()
+
+    async def _take(self) -> Optional[float]:
+        """0 when a token was taken, else the seconds to wait (None: lost a race, retry now)"""
+        now = time.time()
+        bucket = await db.rate_limits.find_one({"_id": self.name})
+        if bucket is None:
+            try:
+                await db.rate_limits.insert_one({"_id": self.name, "tokens": self.capacity - 1, "updated": now})
+                return 0
+            except DuplicateKeyError:
+                return None
+        # Hosts' clocks may differ slightly; never count time backwards
+        updated = max(now, bucket["updated"])
+        tokens = min(self.capacity, bucket["tokens"] + (updated - bucket["updated"]) * self.rate)
+        if tokens < 1:
+            return (1 - tokens) / self.rate
+        result = await db.rate_limits.update_one(
+            {"_id": self.name, "tokens": bucket["tokens"], "updated": bucket["updated"]},
+            {"$set": {"tokens": tokens - 1, "updated": updated}},
+        )
+        return 0 if result.modified_count else None
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                wait = await self._take()
+                if wait == 0:
+                    return
+                await asyncio.sleep(wait if wait else random.uniform(0, 0.05))
+
+
+# Shared by every call to the provider, whichever path and worker process sends the email
+send_bucket = SharedTokenBucket("resend", EMAIL_RATE_PER_SECOND, max(1.0, EMAIL_RATE_PER_SECOND))
+
+
+def is_transient_error(error: Exception) -> bool:
+    """Rate limits, provider 5xx and network failures (reported by resend as code 500) can be retried"""
+    if not isinstance(error, ResendError):
+        return False
+    try:
+        code = int(error.code)
+    except (TypeError, ValueError):
+        return False
+    return code == 429 or code >= 500
+
+
 async def send_email(recipient_email: str, subject: str, html_content: str) -> dict:
-    """Send email using Resend API"""
+    """Send email using Resend API. Errors carry `transient` when the send may be retried."""
     if not RESEND_API_KEY:
-        return {"status": "error", "error": "Email service not configured"}
+        return {"status": "error", "error": "Email service not configured", "recipient": recipient_email, "transient": False}
     params = {"from": SENDER_EMAIL, "to": [recipient_email], "subject": subject, "html": html_content}
+    await send_bucket.acquire()
     try:
         email = await asyncio.to_thread(resend.Emails.send, params)
         return {"status": "success", "email_id": email.get("id"), "recipient": recipient_email}
     except Exception as e:
         logging.error(f"Failed to send email to {recipient_email}: {str(e)}")
-        return {"status": "error", "error": str(e), "recipient": recipient_email}
+        return {"status": "error", "error": str(e), "recipient": recipient_email, "transient": is_transient_error(e)}
+
+
+async def send_batch(recipients: List[str], subject: str, html_content: str) -> List[dict]:
+    """Send the same email to every recipient through the Resend batch API.
+
+    Each recipient gets their own message, EMAIL_BATCH_SIZE per call. Only the messages
+    the batch rejected (or every message of a call that failed for a non-transient reason)
+    are sent again one by one with `send_email`. Returns one `send_email` result per recipient.
+    """
+    if not RESEND_API_KEY:
+        return [{"status": "error", "error": "Email service not configured", "recipient": r, "transient": False}
+                for r in recipients]
+    results = []
+    for start in range(0, len(recipients), EMAIL_BATCH_SIZE):
+        chunk = recipients[start:start + EMAIL_BATCH_SIZE]
+        if len(chunk) == 1:
+            results.append(await send_email(chunk[0], subject, html_content))
+            continue
+        params = [{"from": SENDER_EMAIL, "to": [r], "subject": subject, "html": html_content} for r in chunk]
+        await send_bucket.acquire()
+        try:
+            response = await asyncio.to_thread(resend.Batch.send, params, {"batch_validation": "permissive"})
+        except Exception as e:
+            logging.error(f"Failed to send batch of {len(chunk)} emails: {str(e)}")
+            if is_transient_error(e):
+                # Sending one by one would only hit the same limit; the outbox retries the batch later
+                results += [{"status": "error", "error": str(e), "recipient": r, "transient": True} for r in chunk]
+            else:
+                results += [await send_email(r, subject, html_content) for r in chunk]
+            continue
+
+        # In permissive mode `data` lists the accepted messages in order and `errors` the rejected indexes
+        rejected = {error.get("index") for error in response.get("errors") or []}
+        accepted = iter(response.get("data") or [])
+        for index, recipient in enumerate(chunk):
+            if index in rejected:
+                results.append(await send_email(recipient, subject, html_content))
+            else:
+                results.append({"status": "success", "email_id": next(accepted, {}).get("id"), "recipient": recipient})
+    return results
 
 
 async def get_recipients_for_company(company_id: str, notif_settings: dict) -> list:
@@ -155,15 +310,15 @@ async def get_recipients_for_company(company_id: str, notif_settings: dict) -> l
     if recipient_type == "custom" and notif_settings.get("custom_recipients"):
         recipients = list(notif_settings["custom_recipients"])
     elif recipient_type == "admins_only":
-        admin_role = await db.roles.find_one({"name": "Administrador"}, {"id": 1})
+        admin_role = await reporting_db.roles.find_one({"name": "Administrador"}, {"id": 1})
         if admin_role:
-            users = await db.users.find(
+            users = await reporting_db.users.find(
                 {"is_active": True, "role_id": admin_role["id"], "company_id": company_id},
                 {"_id": 0, "email": 1}
             ).to_list(100)
             recipients = [u["email"] for u in users if u.get("email")]
     else:
-        users = await db.users.find(
+        users = await reporting_db.users.find(
             {"is_active": True, "company_id": company_id},
             {"_id": 0, "email": 1}
         ).to_list(100)
@@ -174,155 +329,305 @@ async def get_recipients_for_company(company_id: str, notif_settings: dict) -> l
 
 async def get_global_admin_emails() -> list:
     """Get emails of admin users without a company (global admins only)"""
-    admins = await db.users.find(
+    admins = await reporting_db.users.find(
         {"is_active": True, "company_id": {"$in": [None, ""]}},
         {"_id": 0, "email": 1}
     ).to_list(50)
     return list(set([a["email"] for a in admins if a.get("email")]))
 
 
-async def send_notifications_for_company(company_id: str, company: dict, notif_settings: dict):
-    """Send notifications for a single company"""
+# ==================== OUTBOX ====================
+# Notification emails are stored in `email_outbox` and sent by EMAIL_WORKERS background
+# tasks, so routes and the scheduler only enqueue. A message is claimed atomically, sent
+# through the batch API under a token bucket sized to the provider quota and shared by all
+# worker processes, and transient failures are retried with exponential backoff up to
+# EMAIL_MAX_ATTEMPTS. A message held by a worker that died is claimed again once its lease
+# expires, so mail survives restarts.
+
+OUTBOX_LEASE_SECONDS = 300
+OUTBOX_POLL_SECONDS = 5
+OUTBOX_MAX_BACKOFF_SECONDS = 3600
+
+
+_outbox_wakeup = asyncio.Event()
+_outbox_tasks: List[asyncio.Task] = []
+
+
+def _iso_in(seconds: float) -> str:
+    return (datetime.now(timezone.utc) + timedelta(seconds=seconds)).isoformat()
+
+
+async def enqueue_email(recipients: List[str], subject: str, html_content: str, context: Optional[dict] = None) -> Optional[dict]:
+    """Store one message for every recipient in the outbox and wake a sender; returns it (None if no recipients)"""
+    recipients = sorted({r for r in recipients if r})
+    if not recipients:
+        return None
+    now = now_iso()
+    message = {
+        "id": generate_id(), "subject": subject, "html": html_content, "context": context or {},
+        "recipients": recipients, "recipient_count": len(recipients), "sent": [], "failed": [],
+        "status": "pending", "attempts": 0, "next_attempt_at": now, "created_at": now, "updated_at": now,
+    }
+    await db.email_outbox.insert_one(message)
+    message.pop("_id", None)
+    _outbox_wakeup.set()
+    return message
+
+
+async def _claim_message() -> Optional[dict]:
+    now = now_iso()
+    return await db.email_outbox.find_one_and_update(
+        {"$or": [
+            {"status": "pending", "next_attempt_at": {"$lte": now}},
+            {"status": "sending", "locked_until": {"$lte": now}},
+        ]},
+        {"$set": {"status": "sending", "locked_until": _iso_in(OUTBOX_LEASE_SECONDS), "updated_at": now},
+         "$inc": {"attempts": 1}},
+        sort=[("next_attempt_at", 1)], projection={"_id": 0}, return_document=ReturnDocument.AFTER,
+    )
+
+
+async def _record_results(message_id: str, results: List[dict]):
+    """Move the recipients of `results` from `recipients` to `sent` or `failed`"""
+    if not results:
+        return
+    now = now_iso()
+    sent = [{"recipient": r["recipient"], "email_id": r.get("email_id"), "sent_at": now}
+            for r in results if r.get("status") == "success"]
+    failed = [{"recipient": r["recipient"], "error": r.get("error"), "failed_at": now}
+              for r in results if r.get("status") != "success"]
+    await db.email_outbox.update_one({"id": message_id}, {
+        "$pull": {"recipients": {"$in": [r["recipient"] for r in results]}},
+        "$push": {"sent": {"$each": sent}, "failed": {"$each": failed}},
+    })
+
+
+async def _deliver(message: dict):
+    retry = []
+    recipients = message["recipients"]
+    for start in range(0, len(recipients), EMAIL_BATCH_SIZE):
+        results = await send_batch(recipients[start:start + EMAIL_BATCH_SIZE], message["subject"], message["html"])
+        transient = [r for r in results if r.get("status") != "success" and r.get("transient")]
+        await _record_results(message["id"], [r for r in results if r not in transient])
+        retry += transient
+
+    if retry and message["attempts"] < EMAIL_MAX_ATTEMPTS:
+        backoff = min(EMAIL_RETRY_BASE_SECONDS * 2 ** (message["attempts"] - 1), OUTBOX_MAX_BACKOFF_SECONDS)
+        await db.email_outbox.update_one({"id": message["id"]}, {"$set": {
+            "status": "pending", "next_attempt_at": _iso_in(backoff * random.uniform(0.8, 1.2)),
+            "last_error": retry[-1].get("error"), "updated_at": now_iso(),
+        }, "$unset": {"locked_until": ""}})
+        return
+
+    await _record_results(message["id"], retry)
+    done = await db.email_outbox.find_one({"id": message["id"]}, {"_id": 0, "failed": 1})
+    await db.email_outbox.update_one({"id": message["id"]}, {"$set": {
+        "status": "failed" if done and done.get("failed") else "sent", "updated_at": now_iso(),
+    }, "$unset": {"locked_until": ""}})
+
+
+async def _outbox_worker():
+    while True:
+        try:
+            _outbox_wakeup.clear()
+            message = await _claim_message()
+            if message is None:
+                try:
+                    await asyncio.wait_for(_outbox_wakeup.wait(), OUTBOX_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await _deliver(message)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"Email outbox worker error: {str(e)}")
+            await asyncio.sleep(OUTBOX_POLL_SECONDS)
+
+
+def start_outbox_workers():
+    if _outbox_tasks:
+        return
+    for _ in range(EMAIL_WORKERS):
+        _outbox_tasks.append(asyncio.create_task(_outbox_worker()))
+    logging.info(f"Email outbox started with {EMAIL_WORKERS} workers")
+
+
+async def stop_outbox_workers():
+    """Stop the senders; a message being sent is claimed again after its lease expires"""
+    for task in _outbox_tasks:
+        task.cancel()
+    await asyncio.gather(*_outbox_tasks, return_exceptions=True)
+    _outbox_tasks.clear()
+
+
+async def outbox_summary() -> dict:
+    """Number of outbox messages per status"""
+    counts = await db.email_outbox.aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}]).to_list(None)
+    return {c["_id"]: c["count"] for c in counts}
+
+
+async def expiring_services(query: dict, days: int) -> List[dict]:
+    """Active services renewing within `days` days, soonest first, ready for the service_renewal template"""
+    today = datetime.now(timezone.utc).date()
+    services = await reporting_db.external_services.find(
+        {**query, "is_active": {"$ne": False}, "renewal_date": days_window(today, days)}, SERVICE_TEMPLATE_FIELDS
+    ).sort("renewal_date", 1).to_list(None)
+    return [{**svc, "renewal_date": iso(svc["renewal_date"]), "days_until": days_until(svc["renewal_date"], today)}
+            for svc in services]
+
+
+async def send_notifications_for_company(company_id: str, company: dict, notif_settings: dict,
+                                         global_admins: Optional[List[str]] = None):
+    """Queue the notifications of a single company; returns one entry per queued recipient.
+
+    `global_admins` may be passed in when the caller already looked them up for several companies.
+    """
     company_name = company.get("name", "Empresa")
     logo_url = company.get("logo_url", "")
     data = {"company_name": company_name, "logo_url": logo_url, "primary_color": "#3b82f6"}
 
     recipients = await get_recipients_for_company(company_id, notif_settings)
-    global_admins = await get_global_admin_emails()
+    if global_admins is None:
+        global_admins = await get_global_admin_emails()
     all_recipients = list(set(recipients + global_admins))
 
     if not all_recipients:
         return []
 
-    eq_ids_docs = await db.equipment.find({"company_id": company_id}, {"id": 1}).to_list(1000)
-    eq_ids = [e["id"] for e in eq_ids_docs]
-
     notifications_sent = []
 
-    # Service renewals
-    if notif_settings.get("service_renewal_enabled", True) and eq_ids:
-        renewal_days = notif_settings.get("service_renewal_days", 30)
-        today = datetime.now(timezone.utc)
-        services = await db.external_services.find(
-            {"is_active": {"$ne": False}, "company_id": company_id}, {"_id": 0}
-        ).to_list(500)
-        expiring = []
-        for svc in services:
-            if svc.get("renewal_date"):
-                try:
-                    renewal = datetime.fromisoformat(svc["renewal_date"].replace("Z", "+00:00"))
-                    days_until = (renewal - today).days
-                    if 0 <= days_until <= renewal_days:
-                        expiring.append({**svc, "days_until": days_until})
-                except Exception:
-                    pass
+    async def queue(notification_type: str, count: int, **template_data):
+        subject, html = get_email_template(notification_type, {**data, **template_data})
+        await enqueue_email(all_recipients, subject, html, {"type": notification_type, "company_id": company_id})
+        notifications_sent.extend({"type": notification_type, "recipient": email_addr, "company": company_name, "count": count}
+                                  for email_addr in all_recipients)
+
+    async def service_renewals():
+        expiring = await expiring_services({"company_id": company_id}, notif_settings.get("service_renewal_days", 30))
         if expiring:
-            data["services"] = sorted(expiring, key=lambda x: x.get("days_until", 999))
-            subject, html = get_email_template("service_renewal", data)
-            for email_addr in all_recipients:
-                result = await send_email(email_addr, subject, html)
-                if result.get("status") == "success":
-                    notifications_sent.append({"type": "service_renewal", "recipient": email_addr, "company": company_name, "count": len(expiring)})
-                await asyncio.sleep(0.1)
-
-    # Pending maintenances
-    if notif_settings.get("maintenance_pending_enabled", True) and eq_ids:
-        maintenances = await db.maintenance_logs.find(
-            {"status": {"$in": ["Pendiente", "En Proceso"]}, "equipment_id": {"$in": eq_ids}}, {"_id": 0}
+            await queue("service_renewal", len(expiring), services=expiring)
+
+    async def pending_maintenances():
+        maintenances = await reporting_db.maintenance_logs.find(
+            {"status": {"$in": ["Pendiente", "En Proceso"]}, "company_id": company_id}, MAINTENANCE_TEMPLATE_FIELDS
         ).to_list(100)
-        for m in maintenances:
-            eq = await db.equipment.find_one({"id": m["equipment_id"]}, {"_id": 0, "inventory_code": 1})
-            m["equipment_code"] = eq.get("inventory_code", "N/A") if eq else "N/A"
+        await resolve_refs(maintenances, EQUIPMENT_CODE_REF)
         if maintenances:
-            data["maintenances"] = maintenances
-            subject, html = get_email_template("maintenance_pending", data)
-            for email_addr in all_recipients:
-                result = await send_email(email_addr, subject, html)
-                if result.get("status") == "success":
-                    notifications_sent.append({"type": "maintenance_pending", "recipient": email_addr, "company": company_name, "count": len(maintenances)})
-                await asyncio.sleep(0.1)
-
-    # Completed maintenances (last 24h)
-    if notif_settings.get("maintenance_completed_enabled", True) and eq_ids:
+            await queue("maintenance_pending", len(maintenances), maintenances=maintenances)
+
+    async def completed_maintenances():
+        # Completed maintenances (last 24h)
         yesterday = datetime.now(timezone.utc).isoformat()[:10]
-        completed = await db.maintenance_logs.find(
-            {"status": "Finalizado", "completed_at": {"$gte": yesterday}, "equipment_id": {"$in": eq_ids}}, {"_id": 0}
+        completed = await reporting_db.maintenance_logs.find(
+            {"status": "Finalizado", "completed_at": {"$gte": yesterday}, "company_id": company_id},
+            MAINTENANCE_TEMPLATE_FIELDS
         ).to_list(100)
-        for m in completed:
-            eq = await db.equipment.find_one({"id": m.get("equipment_id")}, {"_id": 0, "inventory_code": 1})
-            m["equipment_code"] = eq.get("inventory_code", "N/A") if eq else "N/A"
+        await resolve_refs(completed, EQUIPMENT_CODE_REF)
         if completed:
-            data["maintenances"] = completed
-            subject, html = get_email_template("maintenance_completed", data)
-            for email_addr in all_recipients:
-                result = await send_email(email_addr, subject, html)
-                if result.get("status") == "success":
-                    notifications_sent.append({"type": "maintenance_completed", "recipient": email_addr, "company": company_name, "count": len(completed)})
-                await asyncio.sleep(0.1)
-
-    # Open tickets
+            await queue("maintenance_completed", len(completed), maintenances=completed)
+
+    async def open_tickets():
+        tickets = await reporting_db.tickets.find(
+            {"status": {"$in": ["Abierto", "En Proceso"]}, "company_id": company_id}, TICKET_TEMPLATE_FIELDS
+        ).sort("created_at", -1).to_list(100)
+        if tickets:
+            await queue("tickets_open", len(tickets), tickets=tickets)
+
+    sections = []
+    if notif_settings.get("service_renewal_enabled", True):
+        sections.append(service_renewals())
+    if notif_settings.get("maintenance_pending_enabled", True):
+        sections.append(pending_maintenances())
+    if notif_settings.get("maintenance_completed_enabled", True):
+        sections.append(completed_maintenances())
     if notif_settings.get("tickets_open_enabled", True):
-        tickets = await db.tickets.find(
-            {"status": {"$in": ["Abierto", "En Proceso"]}}, {"_id": 0}
-        ).to_list(100)
-        # Filter tickets by equipment belonging to this company
-        if eq_ids:
-            company_tickets = [t for t in tickets if t.get("equipment_id") in eq_ids or not t.get("equipment_id")]
-        else:
-            company_tickets = tickets
-        if company_tickets:
-            data["tickets"] = company_tickets
-            subject, html = get_email_template("tickets_open", data)
-            for email_addr in all_recipients:
-                result = await send_email(email_addr, subject, html)
-                if result.get("status") == "success":
-                    notifications_sent.append({"type": "tickets_open", "recipient": email_addr, "company": company_name, "count": len(company_tickets)})
-                await asyncio.sleep(0.1)
+        sections.append(open_tickets())
+    await asyncio.gather(*sections)
 
     return notifications_sent
 
 
 async def send_automatic_notifications():
-    """Background task: iterate companies with enabled notifications and send per-company emails"""
+    """Background task: queue the per-company emails of every company with automatic sending enabled.
+
+    Settings and global admins are read once; companies are processed concurrently, at most
+    NOTIFICATION_CONCURRENCY at a time, and the time spent on each is kept in the history entry.
+    """
     logging.info("Running automatic notification check (per-company)...")
+    started = time.monotonic()
     try:
-        companies = await db.companies.find({"is_active": {"$ne": False}}, {"_id": 0}).to_list(100)
-        all_notifications = []
-
-        for company in companies:
-            company_id = company.get("id")
-            if not company_id:
-                continue
-
-            notif_settings = await db.notification_settings.find_one(
-                {"type": "company_notifications", "company_id": company_id}, {"_id": 0}
-            )
-            if not notif_settings:
-                continue
-            if not notif_settings.get("enabled", True):
-                continue
-            if not notif_settings.get("auto_send_enabled", False):
-                continue
-
-            sent = await send_notifications_for_company(company_id, company, notif_settings)
-            all_notifications.extend(sent)
-
-        if all_notifications:
+        settings_list = await db.notification_settings.find({
+            "type": "company_notifications", "enabled": {"$ne": False}, "auto_send_enabled": True,
+        }, {"_id": 0}).to_list(None)
+        settings_by_company = {s["company_id"]: s for s in settings_list if s.get("company_id")}
+        if not settings_by_company:
+            logging.info("No notifications to send")
+            return
+        companies = await reporting_db.companies.find(
+            {"id": {"$in": list(settings_by_company)}, "is_active": {"$ne": False}}, COMPANY_BRANDING_FIELDS
+        ).to_list(None)
+        global_admins = await get_global_admin_emails()
+        semaphore = asyncio.Semaphore(NOTIFICATION_CONCURRENCY)
+
+        async def run(company: dict) -> tuple:
+            async with semaphore:
+                company_started = time.monotonic()
+                try:
+                    sent = await send_notifications_for_company(
+                        company["id"], company, settings_by_company[company["id"]], global_admins)
+                    error = None
+                except Exception as e:
+                    logging.error(f"Error in automatic notifications for company {company['id']}: {str(e)}")
+                    sent, error = [], str(e)
+                timing = {"company_id": company["id"], "company_name": company.get("name", ""), "sent": len(sent),
+                          "duration_ms": round((time.monotonic() - company_started) * 1000, 1), "error": error}
+                return sent, timing
+
+        results = await asyncio.gather(*(run(company) for company in companies))
+        all_notifications = [entry for sent, _ in results for entry in sent]
+        company_timings = [timing for _, timing in results]
+
+        if all_notifications or any(t["error"] for t in company_timings):
             await db.notification_history.insert_one({
                 "sent_at": now_iso(),
                 "type": "automatic",
                 "notifications": all_notifications,
-                "total_sent": len(all_notifications)
+                "total_sent": len(all_notifications),
+                "companies": company_timings,
+                "duration_ms": round((time.monotonic() - started) * 1000, 1),
             })
-            logging.info(f"Automatic notifications sent: {len(all_notifications)}")
+            logging.info(f"Automatic notifications sent: {len(all_notifications)} "
+                         f"for {len(companies)} companies in {time.monotonic() - started:.1f}s")
         else:
             logging.info("No notifications to send")
     except Exception as e:
         logging.error(f"Error in automatic notifications: {str(e)}")
 
 
+async def run_daily_once(job_id: str, hour: int, minute: int, job, utc: bool = False):
+    """Run the daily `job` unless this day's run at hour:minute was already claimed by a worker"""
+    now = datetime.now(timezone.utc) if utc else datetime.now()
+    slot = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if slot > now:
+        slot -= timedelta(days=1)
+    try:
+        await db.scheduler_runs.insert_one({"_id": f"{job_id}:{slot.isoformat()}",
+                                            "started_at": datetime.now(timezone.utc)})
+    except DuplicateKeyError:
+        logging.info(f"Skipping {job_id} at {slot.isoformat()}: already run")
+        return
+    await job()
+
+
+# Schedule of the automatic notifications currently applied to this process's scheduler
+_applied_schedule: Optional[tuple] = None
+
+
 async def update_scheduler_job(enabled: bool, send_time: str):
     """Update the scheduler job based on settings"""
+    global _applied_schedule
+    _applied_schedule = (enabled, send_time)
     job_id = "auto_notifications"
     if scheduler.get_job(job_id):
         scheduler.remove_job(job_id)
@@ -332,9 +637,30 @@ async def update_scheduler_job(enabled: bool, send_time: str):
         except Exception:
             hour, minute = 8, 0
         scheduler.add_job(
-            send_automatic_notifications,
+            run_daily_once,
             CronTrigger(hour=hour, minute=minute),
+            args=[job_id, hour, minute, send_automatic_notifications],
             id=job_id,
             replace_existing=True
         )
         logging.info(f"Scheduled automatic notifications at {hour:02d}:{minute:02d}")
+
+
+async def save_scheduler_job(enabled: bool, send_time: str):
+    """Store the schedule for every worker (see services/scheduler_lease_service.py) and apply it here"""
+    await db.notification_settings.update_one(
+        {"type": "scheduler"},
+        {"$set": {"auto_send_enabled": enabled, "send_time": send_time, "updated_at": now_iso()}},
+        upsert=True,
+    )
+    await update_scheduler_job(enabled, send_time)
+
+
+async def load_scheduler_job():
+    """Apply the stored schedule if it differs from this process's; without one, the global settings"""
+    stored = await db.notification_settings.find_one({"type": "scheduler"}, {"_id": 0})
+    if not stored:
+        stored = await db.notification_settings.find_one({"type": "notifications"}, {"_id": 0}) or {}
+    schedule = (bool(stored.get("auto_send_enabled")), stored.get("send_time", "08:00"))
+    if schedule != _applied_schedule:
+        await update_scheduler_job(*schedule)
@@ -0,0 +1,181 @@
+"""Publish/subscribe used to push server events to connected clients.
+
+Topics are `<kind>:<scope>`, the scope being a company id or ALL_COMPANIES. Subscribers are the
+streaming responses of this worker. Events travel through the transport chosen by
+EVENT_TRANSPORT: `mongo` writes them to the capped `server_events` collection, which every
+worker tails, so an event published by one worker reaches the clients of all of them; `local`
+delivers them to this process only (a single worker, or tests).
+
+Subscribers that may have missed events, because their queue overflowed or the tail had to be
+reopened, are marked `lagged`; the stream then tells the client to refetch.
+"""
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Set
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid
+from config import EVENT_TRANSPORT, EVENT_LOG_SIZE_BYTES
+from database import db
+
+logger = logging.getLogger(__name__)
+
+# Events a subscriber may fall behind by; older ones are dropped and the subscriber resyncs
+SUBSCRIBER_QUEUE_SIZE = 16
+# Wait before reopening the tail of `server_events` after it failed or was closed
+RELAY_RETRY_SECONDS = 1
+
+ALL_COMPANIES = "*"
+
+
+class Subscription(asyncio.Queue):
+    """`(topic, event)` pairs for one client; `lagged` is set when some may have been missed"""
+
+    def __init__(self):
+        super().__init__(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.lagged = False
+
+
+_subscribers: Dict[str, Set[Subscription]] = defaultdict(set)
+
+
+def topic(kind: str, scope: str) -> str:
+    return f"{kind}:{scope}"
+
+
+@contextmanager
+def subscribe(*topics: str) -> Iterator[Subscription]:
+    """One queue receiving `(topic, event)` for every event published to any of `topics`"""
+    queue = Subscription()
+    for name in topics:
+        _subscribers[name].add(queue)
+    try:
+        yield queue
+    finally:
+        for name in topics:
+            _subscribers[name].discard(queue)
+            if not _subscribers[name]:
+                del _subscribers[name]
+
+
+def deliver(name: str, event):
+    """Hand an event to this process's subscribers of `name`"""
+    for queue in list(_subscribers.get(name, ())):
+        if queue.full():
+            queue.get_nowait()
+            queue.lagged = True
+        queue.put_nowait((name, event))
+
+
+def _mark_lagged():
+    for queues in _subscribers.values():
+        for queue in queues:
+            queue.lagged = True
+
+
+# ==================== TRANSPORTS ====================
+
+class LocalTransport:
+    """Events reach the subscribers of this process only"""
+
+    async def send(self, name: str, event):
+        deliver(name, event)
+
+    def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+
+class MongoTransport:
+    """Events are appended to the capped `server_events` collection; each process tails it"""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+
+    async def send(self, name: str, event):
+        await db.server_events.insert_one({"topic": name, "event": event})
+
+    async def _ensure_log(self):
+        if "server_events" not in await db.list_collection_names():
+            try:
+                await db.create_collection("server_events", capped=True, size=EVENT_LOG_SIZE_BYTES)
+            except CollectionInvalid:
+                pass  # created by another worker
+        # A tailable cursor on an empty capped collection is closed at once
+        if not await db.server_events.find_one({}, {"_id": 1}):
+            await db.server_events.insert_one({"topic": None})
+
+    async def _relay(self):
+        last_id = None
+        while True:
+            try:
+                await self._ensure_log()
+                if last_id is None:
+                    newest = await db.server_events.find({}, {"_id": 1}).sort("$natural", -1).limit(1).to_list(1)
+                    last_id = newest[0]["_id"]
+                else:
+                    # The tail was reopened: events in between may be lost
+                    _mark_lagged()
+                cursor = db.server_events.find({"_id": {"$gt": last_id}}, cursor_type=CursorType.TAILABLE_AWAIT)
+                while cursor.alive:
+                    async for doc in cursor:
+                        last_id = doc["_id"]
+                        if doc.get("topic"):
+                            deliver(doc["topic"], doc["event"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error tailing server events: {str(e)}")
+            await asyncio.sleep(RELAY_RETRY_SECONDS)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._relay())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+transport = MongoTransport() if EVENT_TRANSPORT == "mongo" else LocalTransport()
+
+
+async def publish(name: str, event):
+    """Send an event to the subscribers of `name` in every worker.
+
+    A failure is logged and does not fail the write that triggered it; clients catch up when
+    they refetch.
+    """
+    try:
+        await transport.send(name, event)
+    except Exception as e:
+        logger.error(f"Error publishing event to {name}: {str(e)}")
+
+
+async def publish_to_company(kind: str, company_id: Optional[str], event: dict):
+    """Reach the users of the company and those who see every company"""
+    for scope in {company_id or ALL_COMPANIES, ALL_COMPANIES}:
+        await publish(topic(kind, scope), event)
+
+
+def start_event_relay():
+    transport.start()
+
+
+async def stop_event_relay():
+    await transport.stop()
+
+
+def subscriber_count() -> int:
+    return sum(len(queues) for queues in _subscribers.values())
+
+
+def sse(event: str, data) -> str:
+    """One server-sent event carrying `data` as JSON"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
@@ -0,0 +1,140 @@
+"""Conditional GETs (ETag / If-None-Match) for endpoints the frontend polls.
+
+Each cached route lists the collections its response is built from. The ETag combines their
+write versions (see `database.CollectionVersions`), the caller and the query string, and is
+computed before the route runs, so a matching If-None-Match is answered with 304 without
+querying MongoDB. Versions are shared between workers through the `cache_versions` collection
+every CACHE_VERSION_SYNC_SECONDS: a write made by another worker is only seen after that.
+"""
+import asyncio
+import hashlib
+import logging
+import uuid
+from typing import Dict, Optional, Tuple
+import jwt
+from fastapi import Request
+from fastapi.responses import Response
+from config import (
+    JWT_SECRET, JWT_ALGORITHM, CACHE_VERSION_SYNC_SECONDS, CACHE_ETAG_SALT,
+    CACHE_PUBLIC_MAX_AGE_SECONDS, CACHE_PRIVATE_MAX_AGE_SECONDS, CACHE_MAX_AGE_BY_COMPANY,
+)
+from database import db, collection_versions
+
+logger = logging.getLogger(__name__)
+
+# Tells apart the unpublished writes of this process from those of other workers
+PROCESS_ID = uuid.uuid4().hex[:8]
+
+
+# What an authenticated caller may see depends on their user and role
+AUTH_COLLECTIONS = ("users", "roles")
+
+
+class CachePolicy:
+    """Collections a cached GET response is built from; `public` ones need no token"""
+
+    def __init__(self, collections: Tuple[str, ...], public: bool = False):
+        self.collections = collections if public else collections + AUTH_COLLECTIONS
+        self.public = public
+
+
+# Static responses (no collections) change only with a deploy; set CACHE_ETAG_SALT per release
+CACHE_POLICIES: Dict[str, CachePolicy] = {
+    "/api/notifications/check": CachePolicy(("alert_feeds",)),
+    "/api/dashboard/stats": CachePolicy(("equipment", "companies", "employees", "maintenance_logs", "quotations",
+                                         "invoices", "equipment_logs")),
+    "/api/custom-fields": CachePolicy(("custom_fields",)),
+    "/api/tickets/options/constants": CachePolicy(()),
+    "/api/settings/public": CachePolicy(("settings",), public=True),
+}
+TRACKED_COLLECTIONS = {name for policy in CACHE_POLICIES.values() for name in policy.collections}
+
+
+def _token_claims(request: Request) -> Optional[dict]:
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        return jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+    except jwt.InvalidTokenError:
+        return None
+
+
+def cache_control(policy: CachePolicy, claims: dict) -> str:
+    if policy.public:
+        return f"public, max-age={CACHE_PUBLIC_MAX_AGE_SECONDS}"
+    max_age = CACHE_MAX_AGE_BY_COMPANY.get(claims.get("company_id") or "", CACHE_PRIVATE_MAX_AGE_SECONDS)
+    return f"private, max-age={max_age}" if max_age else "private, no-cache"
+
+
+def compute_etag(request: Request, policy: CachePolicy, claims: dict) -> str:
+    parts = [CACHE_ETAG_SALT, request.url.path, str(sorted(request.query_params.multi_items())),
+             claims.get("user_id", ""), *collection_versions.tags(policy.collections, PROCESS_ID)]
+    return 'W/"' + hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()[:24] + '"'
+
+
+def _matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison, as If-None-Match requires"""
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in tags or etag.removeprefix("W/") in tags
+
+
+async def conditional_get(request: Request, call_next):
+    """Answer 304 when the client's copy is current; otherwise add ETag and Cache-Control"""
+    policy = CACHE_POLICIES.get(request.url.path) if request.method == "GET" else None
+    if policy is None:
+        return await call_next(request)
+    claims = {} if policy.public else _token_claims(request)
+    if claims is None:
+        return await call_next(request)
+
+    etag = compute_etag(request, policy, claims)
+    headers = {"ETag": etag, "Cache-Control": cache_control(policy, claims)}
+    if not policy.public:
+        headers["Vary"] = "Authorization"
+    if _matches(request.headers.get("if-none-match", ""), etag):
+        return Response(status_code=304, headers=headers)
+    response = await call_next(request)
+    if response.status_code == 200:
+        response.headers.update(headers)
+    return response
+
+
+# ==================== VERSION SYNC ====================
+
+_sync_task: Optional[asyncio.Task] = None
+
+
+async def sync_versions():
+    """Publish this process's writes to `cache_versions` and load every worker's counters"""
+    pending = collection_versions.take_pending()
+    for name in pending.keys() & TRACKED_COLLECTIONS:
+        await db.cache_versions.update_one({"collection": name}, {"$inc": {"version": 1}}, upsert=True)
+    shared = {doc["collection"]: doc["version"]
+              async for doc in db.cache_versions.find({}, {"_id": 0, "collection": 1, "version": 1})}
+    collection_versions.synced(shared, pending)
+
+
+async def _sync_worker():
+    while True:
+        try:
+            await sync_versions()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error syncing cache versions: {str(e)}")
+        await asyncio.sleep(CACHE_VERSION_SYNC_SECONDS)
+
+
+def start_version_sync():
+    global _sync_task
+    if _sync_task is None:
+        _sync_task = asyncio.create_task(_sync_worker())
+
+
+async def stop_version_sync():
+    global _sync_task
+    if _sync_task is not None:
+        _sync_task.cancel()
+        await asyncio.gather(_sync_task, return_exceptions=True)
+        _sync_task = None
@@ -0,0 +1,153 @@
+import logging
+from typing import Dict, List
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+from database import db
+
+logger = logging.getLogger(__name__)
+
+# Collections whose documents are addressed by the application-generated `id`
+ID_COLLECTIONS = [
+    "users", "roles", "companies", "branches", "employees", "equipment", "equipment_logs",
+    "assignments", "decommissions", "maintenance_logs", "external_services", "quotations",
+    "invoices", "custom_fields", "tickets", "ticket_comments", "email_outbox",
+]
+
+# (created_at, id) keyset used by paginated list endpoints
+KEYSET = [("created_at", DESCENDING), ("id", DESCENDING)]
+
+INDEX_SPECS: Dict[str, List[IndexModel]] = {name: [IndexModel([("id", ASCENDING)], unique=True)]
+                                            for name in ID_COLLECTIONS}
+INDEX_SPECS["users"] += [
+    IndexModel([("email", ASCENDING)], unique=True),
+]
+INDEX_SPECS["equipment"] += [
+    IndexModel([("serial_number", ASCENDING)], unique=True),
+    IndexModel([("inventory_code", ASCENDING)], unique=True),
+    IndexModel([("company_id", ASCENDING), ("status", ASCENDING)]),
+    IndexModel(KEYSET),
+]
+INDEX_SPECS["maintenance_logs"] += [
+    IndexModel([("equipment_id", ASCENDING), ("created_at", DESCENDING)]),
+    IndexModel([("company_id", ASCENDING), ("created_at", DESCENDING)]),
+    IndexModel([("company_id", ASCENDING), ("status", ASCENDING)]),
+    IndexModel([("status", ASCENDING)]),
+    IndexModel(KEYSET),
+]
+INDEX_SPECS["tickets"] += [
+    IndexModel([("status", ASCENDING), ("created_at", DESCENDING)]),
+    IndexModel([("created_by", ASCENDING), ("created_at", DESCENDING)]),
+    IndexModel([("company_id", ASCENDING), ("status", ASCENDING)]),
+    IndexModel(KEYSET),
+]
+INDEX_SPECS["equipment_logs"] += [
+    IndexModel([("equipment_id", ASCENDING), ("created_at", DESCENDING)]),
+    IndexModel([("company_id", ASCENDING), ("created_at", DESCENDING)]),
+]
+INDEX_SPECS["assignments"] += [
+    IndexModel([("equipment_id", ASCENDING), ("status", ASCENDING)]),
+    IndexModel(KEYSET),
+]
+INDEX_SPECS["ticket_comments"] += [
+    IndexModel([("ticket_id", ASCENDING), ("created_at", ASCENDING)]),
+]
+INDEX_SPECS["invoices"] += [
+    IndexModel([("company_id", ASCENDING), ("serie", ASCENDING), ("folio", ASCENDING)], unique=True),
+]
+INDEX_SPECS["quotations"] += [
+    IndexModel([("company_id", ASCENDING), ("quotation_number", ASCENDING)], unique=True),
+]
+INDEX_SPECS["tickets"] += [IndexModel([("ticket_number", ASCENDING)], unique=True)]
+INDEX_SPECS["dashboard_rollups"] = [
+    IndexModel([("company_id", ASCENDING), ("month", ASCENDING)], unique=True),
+]
+INDEX_SPECS["email_outbox"] += [
+    IndexModel([("status", ASCENDING), ("next_attempt_at", ASCENDING)]),
+    IndexModel([("status", ASCENDING), ("locked_until", ASCENDING)]),
+    IndexModel([("created_at", DESCENDING)]),
+]
+INDEX_SPECS["migrations"] = [IndexModel([("id", ASCENDING)], unique=True)]
+INDEX_SPECS["number_reservations"] = [IndexModel([("key", ASCENDING), ("first", ASCENDING)])]
+INDEX_SPECS["cache_versions"] = [IndexModel([("collection", ASCENDING)], unique=True)]
+INDEX_SPECS["alert_feeds"] = [IndexModel([("company_id", ASCENDING)], unique=True)]
+# Expired leases are removed by MongoDB; the lease itself checks expires_at
+INDEX_SPECS["scheduler_leases"] = [IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0)]
+# Unique indexes that replace the application's duplicate checks: the API must not run without them
+REQUIRED_INDEXES = {"users.email_1", "equipment.serial_number_1", "equipment.inventory_code_1"}
+# Claims of daily scheduled runs, only needed until the next day
+INDEX_SPECS["scheduler_runs"] = [IndexModel([("started_at", ASCENDING)], expireAfterSeconds=7 * 24 * 3600)]
+INDEX_SPECS["employees"] += [IndexModel([("company_id", ASCENDING)])]
+INDEX_SPECS["branches"] += [IndexModel([("company_id", ASCENDING)])]
+for _name in ("quotations", "invoices"):
+    INDEX_SPECS[_name] += [IndexModel([("company_id", ASCENDING)]), IndexModel(KEYSET)]
+# Renewal windows, for one company and for every company
+INDEX_SPECS["external_services"] += [IndexModel([("company_id", ASCENDING), ("renewal_date", ASCENDING)]),
+                                     IndexModel([("renewal_date", ASCENDING)]), IndexModel(KEYSET)]
+
+
+def _key(index_key) -> tuple:
+    return tuple((field, int(direction)) for field, direction in index_key)
+
+
+async def ensure_indexes(require_unique: bool = False) -> List[str]:
+    """Create every declared index. Returns the names that could not be created.
+
+    A failure (typically duplicated values already stored under a unique key) is logged and
+    the index shows up as missing in the report. With `require_unique`, used at startup, a
+    failure on one of REQUIRED_INDEXES raises RuntimeError instead: duplicate checks on
+    equipment and users rely on those indexes, so the duplicates must be cleaned up first.
+    """
+    failed, failed_required = [], []
+    for collection, models in INDEX_SPECS.items():
+        for model in models:
+            try:
+                await db[collection].create_indexes([model])
+            except OperationFailure as e:
+                name = f"{collection}.{model.document['name']}"
+                failed.append(name)
+                if name in REQUIRED_INDEXES:
+                    failed_required.append(name)
+                logger.error(f"Could not create index {name}: {e}")
+    if failed:
+        logger.warning(f"{len(failed)} declared indexes are missing")
+    if require_unique and failed_required:
+        raise RuntimeError(f"Unique indexes could not be created: {', '.join(failed_required)}")
+    return failed
+
+
+async def _usage(collection: str) -> Dict[str, int]:
+    try:
+        stats = await db[collection].aggregate([{"$indexStats": {}}]).to_list(None)
+    except OperationFailure:
+        return {}
+    return {s["name"]: s.get("accesses", {}).get("ops", 0) for s in stats}
+
+
+async def index_report() -> dict:
+    """Compare declared indexes with the ones present in the database.
+
+    `missing` lists declared indexes not found; `unused` lists existing indexes (other than
+    `_id_`) with no recorded access since the server started (needs `$indexStats`);
+    `undeclared` lists existing indexes that are not part of INDEX_SPECS.
+    """
+    existing_collections = set(await db.list_collection_names())
+    report = {"missing": [], "unused": [], "undeclared": []}
+    for collection in sorted(set(INDEX_SPECS) | existing_collections):
+        declared = {_key(m.document["key"].items()): m.document["name"] for m in INDEX_SPECS.get(collection, [])}
+        present = {}
+        if collection in existing_collections:
+            info = await db[collection].index_information()
+            present = {_key(spec["key"]): name for name, spec in info.items()}
+        usage = await _usage(collection) if present else {}
+
+        for key, name in declared.items():
+            if key not in present:
+                report["missing"].append({"collection": collection, "index": name})
+        for key, name in present.items():
+            if name == "_id_":
+                continue
+            if key not in declared:
+                report["undeclared"].append({"collection": collection, "index": name})
+            if usage.get(name) == 0:
+                report["unused"].append({"collection": collection, "index": name})
+    return report
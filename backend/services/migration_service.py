@@ -0,0 +1,109 @@
+"""One-shot data migrations, recorded by id in the `migrations` collection.
+
+Pending migrations run at startup (`run_migrations`) or from the command line with
+`python -m services.migration_service`. A migration must be idempotent: one interrupted
+halfway is not recorded and runs again, and two workers starting together may both run it.
+"""
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, List, Tuple
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+from database import db
+from helpers import now_iso, parse_iso
+from services.rollup_service import build_rollups
+
+logger = logging.getLogger(__name__)
+
+# Collections that carry the `company_id` of their equipment (tickets: else of their creator)
+COMPANY_SCOPED = ("maintenance_logs", "equipment_logs", "tickets")
+BACKFILL_CHUNK_SIZE = 1000
+
+
+async def _set_company(collection: str, field: str, ids_by_company: Dict[str, List[str]]) -> int:
+    modified = 0
+    for company_id, ids in ids_by_company.items():
+        for start in range(0, len(ids), BACKFILL_CHUNK_SIZE):
+            result = await db[collection].update_many(
+                {"company_id": {"$exists": False}, field: {"$in": ids[start:start + BACKFILL_CHUNK_SIZE]}},
+                {"$set": {"company_id": company_id}},
+            )
+            modified += result.modified_count
+    return modified
+
+
+async def backfill_company_id() -> dict:
+    """Store `company_id` on maintenance logs, equipment logs and tickets written before it existed"""
+    equipment_by_company = defaultdict(list)
+    async for eq in db.equipment.find({"company_id": {"$nin": [None, ""]}}, {"_id": 0, "id": 1, "company_id": 1}):
+        equipment_by_company[eq["company_id"]].append(eq["id"])
+    users_by_company = defaultdict(list)
+    async for user in db.users.find({"company_id": {"$nin": [None, ""]}}, {"_id": 0, "id": 1, "company_id": 1}):
+        users_by_company[user["company_id"]].append(user["id"])
+
+    modified = {}
+    for collection in COMPANY_SCOPED:
+        modified[collection] = await _set_company(collection, "equipment_id", equipment_by_company)
+    modified["tickets"] += await _set_company("tickets", "created_by", users_by_company)
+    # Whatever is left has no company; mark it so it is not scanned again
+    for collection in COMPANY_SCOPED:
+        result = await db[collection].update_many({"company_id": {"$exists": False}}, {"$set": {"company_id": None}})
+        modified[collection] += result.modified_count
+    return modified
+
+
+async def renewal_date_as_bson_date() -> dict:
+    """Store `external_services.renewal_date` as a BSON date; blank or unreadable text becomes None"""
+    converted, cleared = 0, 0
+    updates = []
+    async for svc in db.external_services.find({"renewal_date": {"$type": "string"}}, {"_id": 1, "renewal_date": 1}):
+        renewal = parse_iso(svc["renewal_date"])
+        if renewal:
+            converted += 1
+        else:
+            cleared += 1
+        updates.append(UpdateOne({"_id": svc["_id"]}, {"$set": {"renewal_date": renewal}}))
+        if len(updates) == BACKFILL_CHUNK_SIZE:
+            await db.external_services.bulk_write(updates, ordered=False)
+            updates = []
+    if updates:
+        await db.external_services.bulk_write(updates, ordered=False)
+    return {"converted": converted, "cleared": cleared}
+
+
+MIGRATIONS: List[Tuple[str, Callable[[], Awaitable[dict]]]] = [
+    ("0001_company_id_on_logs_and_tickets", backfill_company_id),
+    ("0002_renewal_date_as_bson_date", renewal_date_as_bson_date),
+    ("0003_dashboard_rollups", build_rollups),
+]
+
+
+async def run_migrations() -> List[str]:
+    """Run the migrations not yet recorded, in order. Returns the ids that ran."""
+    applied = set(await db.migrations.distinct("id"))
+    ran = []
+    for migration_id, migrate in MIGRATIONS:
+        if migration_id in applied:
+            continue
+        logger.info(f"Running migration {migration_id}")
+        started = time.monotonic()
+        result = await migrate()
+        duration_ms = round((time.monotonic() - started) * 1000, 1)
+        try:
+            await db.migrations.insert_one({"id": migration_id, "applied_at": now_iso(),
+                                            "duration_ms": duration_ms, "result": result})
+        except DuplicateKeyError:
+            logger.info(f"Migration {migration_id} was also applied by another process")
+        logger.info(f"Migration {migration_id} done in {duration_ms} ms: {result}")
+        ran.append(migration_id)
+    return ran
+
+
+if __name__ == "__main__":
+    import sys
+    logging.basicConfig(level=logging.INFO)
+    if sys.argv[1:]:
+        sys.exit("usage: python -m services.migration_service")
+    asyncio.run(run_migrations())
@@ -0,0 +1,77 @@
+import base64
+import json
+from typing import Awaitable, Callable, List, Optional
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from models import Page
+
+# Keyset order shared by every paginated list: newest first, id breaks ties
+KEYSET_SORT = [("created_at", -1), ("id", -1)]
+PAGE_MAX_LIMIT = 1000
+STREAM_BATCH_SIZE = 200
+
+BuildFn = Callable[[List[dict]], Awaitable[List[BaseModel]]]
+
+
+def encode_cursor(doc: dict) -> str:
+    raw = json.dumps([doc.get("created_at"), doc["id"]])
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        created_at, doc_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return created_at, str(doc_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+
+def _after_cursor(query: dict, cursor: str) -> dict:
+    created_at, doc_id = decode_cursor(cursor)
+    after = {"$or": [
+        {"created_at": {"$lt": created_at}},
+        {"created_at": created_at, "id": {"$lt": doc_id}},
+    ]}
+    return {"$and": [query, after]} if query else after
+
+
+async def _ndjson(cursor, build: BuildFn):
+    batch = []
+    async for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= STREAM_BATCH_SIZE:
+            for item in await build(batch):
+                yield item.model_dump_json() + "\n"
+            batch = []
+    if batch:
+        for item in await build(batch):
+            yield item.model_dump_json() + "\n"
+
+
+async def list_response(collection, query: dict, build: BuildFn, limit: Optional[int] = None,
+                        cursor: Optional[str] = None, stream: bool = False, sort: Optional[list] = None,
+                        projection: Optional[dict] = None):
+    """Serve a list endpoint as a full list, a keyset page or an NDJSON stream.
+
+    Without `limit`/`cursor`/`stream` the whole result is returned as before (no row cap).
+    With `limit` or `cursor` a `Page` ordered by (created_at, id) is returned.
+    With `stream` every matching row is written as one JSON line while the cursor drains.
+    `projection` limits the fields read (see `helpers.projection`); the keyset fields are always kept.
+    """
+    projection = {**projection, "created_at": 1, "id": 1} if projection else {"_id": 0}
+    if stream:
+        db_cursor = collection.find(query, projection).sort(KEYSET_SORT).batch_size(STREAM_BATCH_SIZE)
+        return StreamingResponse(_ndjson(db_cursor, build), media_type="application/x-ndjson")
+
+    if limit is None and cursor is None:
+        db_cursor = collection.find(query, projection)
+        if sort:
+            db_cursor = db_cursor.sort(sort)
+        return await build(await db_cursor.to_list(None))
+
+    limit = limit or PAGE_MAX_LIMIT
+    page_query = _after_cursor(query, cursor) if cursor else query
+    docs = await collection.find(page_query, projection).sort(KEYSET_SORT).limit(limit + 1).to_list(limit + 1)
+    next_cursor = encode_cursor(docs[limit - 1]) if len(docs) > limit else None
+    return Page(items=await build(docs[:limit]), next_cursor=next_cursor)
@@ -1,9 +1,73 @@
 from fpdf import FPDF
 from datetime import datetime
+from typing import Optional
+import hashlib
 import httpx
-import tempfile
+import json
+import logging
 import os
+import tempfile
+import time
+from config import LOGO_CACHE_DIR, LOGO_CACHE_TTL_SECONDS, LOGO_NEGATIVE_TTL_SECONDS, LOGO_FETCH_TIMEOUT_SECONDS
 from helpers import sanitize_text
+from services.cache_service import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# url -> path of the cached image, "" while the url is known to fail
+_logo_memory = TTLCache("logos", 64, LOGO_CACHE_TTL_SECONDS)
+
+
+def _write_atomic(path: str, data: bytes):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def get_logo(url: str) -> Optional[str]:
+    """Local path of the image at `url`, or None if it cannot be downloaded.
+
+    Images are stored in LOGO_CACHE_DIR under the sha256 of the url, next to a meta file
+    with the ETag, so every report worker shares them. After LOGO_CACHE_TTL_SECONDS the
+    image is revalidated with If-None-Match. Failures are remembered for
+    LOGO_NEGATIVE_TTL_SECONDS so a broken url is not requested again on every page.
+    """
+    cached = _logo_memory.get(url)
+    if cached is not None:
+        return cached or None
+
+    os.makedirs(LOGO_CACHE_DIR, exist_ok=True)
+    path = os.path.join(LOGO_CACHE_DIR, hashlib.sha256(url.encode("utf-8")).hexdigest())
+    meta_path = path + ".json"
+    try:
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        meta = {}
+
+    ttl = LOGO_CACHE_TTL_SECONDS if meta.get("ok") else LOGO_NEGATIVE_TTL_SECONDS
+    age = time.time() - meta.get("checked_at", 0)
+    if age >= ttl or (meta.get("ok") and not os.path.exists(path)):
+        headers = {"If-None-Match": meta["etag"]} if meta.get("ok") and meta.get("etag") else {}
+        try:
+            response = httpx.get(url, headers=headers, timeout=LOGO_FETCH_TIMEOUT_SECONDS, follow_redirects=True)
+            if response.status_code == 200:
+                _write_atomic(path, response.content)
+                meta = {"ok": True, "etag": response.headers.get("etag")}
+            elif response.status_code != 304:
+                meta = {"ok": False}
+        except Exception as e:
+            logger.warning(f"Could not download logo {url}: {e}")
+            meta = {"ok": False}
+        meta["checked_at"] = time.time()
+        _write_atomic(meta_path, json.dumps(meta).encode("utf-8"))
+        age = 0
+
+    ok = meta.get("ok") and os.path.exists(path)
+    remaining = (LOGO_CACHE_TTL_SECONDS if ok else LOGO_NEGATIVE_TTL_SECONDS) - age
+    _logo_memory.set(url, path if ok else "", ttl=remaining)
+    return path if ok else None
 
 
 class ModernPDF(FPDF):
@@ -14,6 +78,7 @@ class ModernPDF(FPDF):
         self.title_text = title
         self.company_name = company_name
         self.logo_url = logo_url
+        self._logo_path = None
         self.primary_color = (41, 128, 185)
         self.secondary_color = (52, 73, 94)
         self.light_gray = (245, 245, 245)
@@ -24,19 +89,16 @@ class ModernPDF(FPDF):
         self.rect(0, 0, 210, 35, 'F')
 
         logo_width = 0
-        if self.logo_url:
+        if self.logo_url and self._logo_path is None:
+            self._logo_path = get_logo(self.logo_url) or ""
+        if self._logo_path:
             try:
-                with httpx.Client() as client:
-                    response = client.get(self.logo_url, timeout=5)
-                    if response.status_code == 200:
-                        with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as tmp:
-                            tmp.write(response.content)
-                            tmp_path = tmp.name
-                        self.image(tmp_path, 10, 5, 25)
-                        logo_width = 30
-                        os.unlink(tmp_path)
-            except:
-                pass
+                # Same path on every page: FPDF decodes the image once and reuses it
+                self.image(self._logo_path, 10, 5, 25)
+                logo_width = 30
+            except Exception as e:
+                logger.warning(f"Could not use logo {self.logo_url}: {e}")
+                self._logo_path = ""
 
         self.set_xy(10 + logo_width, 8)
         self.set_text_color(255, 255, 255)
@@ -0,0 +1,156 @@
+"""Building blocks for PDF reports over collections of any size.
+
+Route handlers gather the report data and pass it to `render_pdf`: a JSON-serializable
+context plus, for reports over whole collections, the documents in chunks read from
+the Motor cursor (`iter_chunks`). The chunks are spooled to an NDJSON temporary file,
+so the result set is never held in memory, and the layout runs in a pool of worker
+processes (see services.report_renderers), so FPDF never blocks the event loop.
+Summary figures printed before the detail come from an aggregation (`count_by`).
+The PDF comes back as a temporary file that `pdf_response` streams and then deletes.
+
+At most REPORT_WORKERS reports render at the same time and REPORT_QUEUE_DEPTH more may
+wait for a worker; further requests get a 503 with Retry-After.
+"""
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import AsyncIterable, AsyncIterator, Dict, List, Optional
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from config import REPORT_WORKERS, REPORT_QUEUE_DEPTH, REPORT_RETRY_AFTER_SECONDS
+from services.report_renderers import render_report
+from services.resolver_service import Ref, resolve_refs
+
+logger = logging.getLogger(__name__)
+
+REPORT_CHUNK_SIZE = 200
+FILE_BLOCK_SIZE = 64 * 1024
+
+_executor: Optional[ProcessPoolExecutor] = None
+_in_flight = 0
+
+
+async def iter_chunks(cursor, *refs: Ref, size: int = REPORT_CHUNK_SIZE) -> AsyncIterator[List[dict]]:
+    """Yield the documents of `cursor` in lists of at most `size`, resolving `refs` per list"""
+    chunk = []
+    async for doc in cursor.batch_size(size):
+        chunk.append(doc)
+        if len(chunk) >= size:
+            yield await resolve_refs(chunk, *refs)
+            chunk = []
+    if chunk:
+        yield await resolve_refs(chunk, *refs)
+
+
+async def count_by(collection, query: dict, defaults: Dict[str, str]) -> Dict[str, Dict[str, int]]:
+    """Count the documents matching `query` per value of each field in `defaults`.
+
+    Documents without the field are counted under its default label. Runs as one `$facet`.
+    """
+    facets = {field: [{"$group": {"_id": f"${field}", "count": {"$sum": 1}}}] for field in defaults}
+    result = await collection.aggregate([{"$match": query}, {"$facet": facets}]).to_list(1)
+    counts = {field: {} for field in defaults}
+    for field, groups in (result[0] if result else {}).items():
+        for group in groups:
+            label = group["_id"] if group["_id"] is not None else defaults[field]
+            counts[field][label] = counts[field].get(label, 0) + group["count"]
+    return counts
+
+
+def _pool() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # spawn: workers must not inherit the event loop, the Motor client or the scheduler
+        _executor = ProcessPoolExecutor(max_workers=REPORT_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+
+def shutdown_report_pool():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def _discard(*paths: Optional[str]):
+    for path in paths:
+        if path:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+
+async def _spool(chunks: AsyncIterable[List[dict]]) -> str:
+    fd, path = tempfile.mkstemp(prefix="report_", suffix=".ndjson")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            async for chunk in chunks:
+                for doc in chunk:
+                    f.write(json.dumps(doc, default=str) + "\n")
+    except BaseException:
+        _discard(path)
+        raise
+    return path
+
+
+async def render_pdf(kind: str, ctx: dict, chunks: Optional[AsyncIterable[List[dict]]] = None) -> str:
+    """Lay out report `kind` in the worker pool and return the path of the PDF file.
+
+    Raises 503 when REPORT_WORKERS + REPORT_QUEUE_DEPTH reports are already in progress.
+    """
+    global _executor, _in_flight
+    if _in_flight >= REPORT_WORKERS + REPORT_QUEUE_DEPTH:
+        raise HTTPException(status_code=503, detail="Hay demasiados reportes en proceso, intente de nuevo en unos segundos",
+                            headers={"Retry-After": str(REPORT_RETRY_AFTER_SECONDS)})
+
+    _in_flight += 1
+    spool_path = None
+    fd, out_path = tempfile.mkstemp(prefix="report_", suffix=".pdf")
+    os.close(fd)
+    try:
+        if chunks is not None:
+            spool_path = await _spool(chunks)
+        future = _pool().submit(render_report, kind, ctx, spool_path, out_path)
+        try:
+            await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            # The worker keeps going after the client leaves; clean up once it is done
+            future.add_done_callback(lambda _, paths=(spool_path, out_path): _discard(*paths))
+            spool_path = out_path = None
+            raise
+    except BrokenProcessPool:
+        logger.error("Report worker pool crashed, it will be recreated")
+        _executor = None
+        _discard(out_path)
+        raise
+    except BaseException:
+        _discard(out_path)
+        raise
+    finally:
+        _in_flight -= 1
+        _discard(spool_path)
+    return out_path
+
+
+def _read_and_delete(path: str):
+    try:
+        with open(path, "rb") as f:
+            while block := f.read(FILE_BLOCK_SIZE):
+                yield block
+    finally:
+        _discard(path)
+
+
+def pdf_response(path: str, filename: str) -> StreamingResponse:
+    """Stream the PDF file at `path` as an attachment and delete it afterwards"""
+    headers = {
+        "Content-Disposition": f"attachment; filename={filename}",
+        "Content-Length": str(os.path.getsize(path)),
+    }
+    return StreamingResponse(_read_and_delete(path), media_type="application/pdf", headers=headers)
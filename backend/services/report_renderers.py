@@ -0,0 +1,1085 @@
+"""PDF layout of every report. Runs inside the report worker processes.
+
+Route handlers gather the data and pass a JSON-serializable context plus, for
+reports over whole collections, the path of an NDJSON spool with one document per
+line (already enriched with the referenced names). Nothing here touches the
+database, so a renderer can run in any process.
+"""
+import json
+from datetime import datetime, timezone
+from typing import Iterable, Iterator
+from fpdf import FPDF
+from services.pdf_service import ModernPDF
+from helpers import sanitize_text, parse_iso, days_until
+
+
+class Spool:
+    """Documents written by the route to an NDJSON file; can be iterated more than once"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def __iter__(self) -> Iterator[dict]:
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)
+
+
+def _add_equipment_detail(pdf, eq, assigned_name, custom_fields_list):
+    """Helper: renders a full equipment detail card in the PDF"""
+    page_width = 190
+    col = 95
+
+    # Header bar
+    pdf.set_fill_color(41, 128, 185)
+    pdf.set_text_color(255, 255, 255)
+    pdf.set_font("Helvetica", "B", 10)
+    header = f"  {eq.get('inventory_code', 'N/A')} - {eq.get('equipment_type', '')} | {eq.get('brand', '')} {eq.get('model', '')}"
+    pdf.cell(0, 8, sanitize_text(header), 0, 1, fill=True)
+    pdf.set_text_color(0, 0, 0)
+
+    # Info rows helper
+    def row(label, value, label2=None, value2=None):
+        if not value and not value2:
+            return
+        pdf.set_font("Helvetica", "B", 8)
+        pdf.cell(28, 5, f"{label}:", "L", 0)
+        pdf.set_font("Helvetica", "", 8)
+        pdf.cell(col - 28, 5, sanitize_text(str(value or 'N/A'))[:45], 0, 0)
+        if label2:
+            pdf.set_font("Helvetica", "B", 8)
+            pdf.cell(28, 5, f"{label2}:", 0, 0)
+            pdf.set_font("Helvetica", "", 8)
+            pdf.cell(0, 5, sanitize_text(str(value2 or 'N/A'))[:45], "R", 1)
+        else:
+            pdf.cell(0, 5, "", "R", 1)
+
+    # GENERAL
+    row("Codigo", eq.get('inventory_code'), "Tipo", eq.get('equipment_type'))
+    row("Marca", eq.get('brand'), "Modelo", eq.get('model'))
+    row("No. Serie", eq.get('serial_number'), "Estado", eq.get('status'))
+    if assigned_name:
+        row("Asignado a", assigned_name, None, None)
+    if eq.get('observations'):
+        row("Observaciones", eq.get('observations'), None, None)
+
+    # HARDWARE
+    has_hw = any([eq.get('processor_brand'), eq.get('ram_capacity'), eq.get('storage_capacity')])
+    if has_hw:
+        pdf.set_font("Helvetica", "BI", 8)
+        pdf.set_fill_color(240, 240, 240)
+        pdf.cell(0, 5, "  Hardware", "LR", 1, fill=True)
+        proc = f"{eq.get('processor_brand', '')} {eq.get('processor_model', '')}".strip()
+        if eq.get('processor_speed'):
+            proc += f" @ {eq['processor_speed']}"
+        ram = eq.get('ram_capacity', '')
+        if eq.get('ram_type'):
+            ram += f" ({eq['ram_type']})"
+        storage = ""
+        if eq.get('storage_capacity'):
+            storage = f"{eq.get('storage_type', '')} {eq['storage_capacity']}".strip()
+        row("Procesador", proc if proc else None, "RAM", ram if ram else None)
+        if storage:
+            row("Almacenamiento", storage, None, None)
+
+    # SOFTWARE
+    has_sw = any([eq.get('os_name'), eq.get('antivirus_name'), eq.get('office_version')])
+    if has_sw:
+        pdf.set_font("Helvetica", "BI", 8)
+        pdf.set_fill_color(240, 240, 240)
+        pdf.cell(0, 5, "  Software", "LR", 1, fill=True)
+        os_info = eq.get('os_name', '')
+        if eq.get('os_version'):
+            os_info += f" {eq['os_version']}"
+        row("Sist. Operativo", os_info if os_info else None, "Licencia SO", eq.get('os_license'))
+        if eq.get('office_version'):
+            row("Office", eq.get('office_version'), "Lic. Office", eq.get('office_license'))
+        if eq.get('antivirus_name'):
+            row("Antivirus", eq.get('antivirus_name'), "Vence AV", eq.get('antivirus_expiry'))
+
+    # NETWORK
+    has_net = any([eq.get('ip_address'), eq.get('mac_address')])
+    if has_net:
+        pdf.set_font("Helvetica", "BI", 8)
+        pdf.set_fill_color(240, 240, 240)
+        pdf.cell(0, 5, "  Red", "LR", 1, fill=True)
+        row("IP", eq.get('ip_address'), "MAC", eq.get('mac_address'))
+
+    # CREDENTIALS
+    has_cred = any([eq.get('windows_user'), eq.get('email_account'), eq.get('cloud_user')])
+    if has_cred:
+        pdf.set_font("Helvetica", "BI", 8)
+        pdf.set_fill_color(240, 240, 240)
+        pdf.cell(0, 5, "  Credenciales", "LR", 1, fill=True)
+        if eq.get('windows_user'):
+            row("Usuario Win", eq.get('windows_user'), "Pass Win", eq.get('windows_password'))
+        if eq.get('email_account'):
+            row("Email", eq.get('email_account'), "Pass Email", eq.get('email_password'))
+        if eq.get('cloud_user'):
+            row("Cloud", eq.get('cloud_user'), "Pass Cloud", eq.get('cloud_password'))
+
+    # CUSTOM FIELDS
+    cf_values = eq.get("custom_fields") or {}
+    has_cf = False
+    for cf in custom_fields_list:
+        val = cf_values.get(cf.get("name"), "")
+        if val:
+            if not has_cf:
+                pdf.set_font("Helvetica", "BI", 8)
+                pdf.set_fill_color(240, 240, 240)
+                pdf.cell(0, 5, "  Campos Adicionales", "LR", 1, fill=True)
+                has_cf = True
+            row(cf.get('name', ''), val, None, None)
+
+    # Bottom border
+    pdf.cell(0, 1, "", "LRB", 1)
+    pdf.ln(4)
+
+    if pdf.get_y() > 250:
+        pdf.add_page()
+
+
+
+def render_equipment(ctx: dict, rows: Iterable[dict]) -> FPDF:
+    pdf = ModernPDF(title="Inventario de Equipos", company_name=ctx["company_name"], logo_url=ctx["logo_url"])
+    pdf.alias_nb_pages()
+    pdf.add_page()
+
+    # Summary
+    status_counts, type_counts = ctx["status_counts"], ctx["type_counts"]
+
+    pdf.section_title(f"RESUMEN ({sum(status_counts.values())} equipos)")
+    pdf.set_font("Helvetica", "", 9)
+    summary_parts = [f"{s}: {c}" for s, c in sorted(status_counts.items())]
+    pdf.cell(0, 6, "Por estado: " + " | ".join(summary_parts), ln=True)
+    type_parts = [f"{t}: {c}" for t, c in sorted(type_counts.items())]
+    pdf.cell(0, 6, "Por tipo: " + " | ".join(type_parts), ln=True)
+    pdf.ln(5)
+
+    # Detail per equipment
+    pdf.section_title("DETALLE DE EQUIPOS")
+    for eq in rows:
+        _add_equipment_detail(pdf, eq, eq.get("assigned_name", ""), ctx["custom_fields"])
+    return pdf
+
+
+def render_equipment_logs(ctx: dict, rows: Iterable[dict]) -> FPDF:
+    logs = ctx["logs"]
+    pdf = ModernPDF(title="Bitacora de Equipo", company_name=ctx["company_name"], logo_url=ctx["logo_url"])
+    pdf.alias_nb_pages()
+    pdf.add_page()
+
+    # Full equipment detail
+    _add_equipment_detail(pdf, ctx["equipment"], ctx["assigned_employee"], ctx["custom_fields"])
+
+    # Logs table
+    pdf.section_title(f"HISTORIAL DE BITACORA ({len(logs)} registros)")
+    if not logs:
+        pdf.set_font("Helvetica", "I", 10)
+        pdf.cell(0, 10, "No hay registros en la bitacora", ln=True, align="C")
+    else:
+        headers = ["Fecha", "Tipo", "Descripcion", "Realizado por"]
+        widths = [35, 25, 100, 30]
+        pdf.add_table_header(headers, widths)
+
+        for i, log in enumerate(logs):
+            user_name = (log.get("performed_by_name") or "")[:15]
+            data = [
+                str(log.get("created_at", ""))[:16].replace("T", " "),
+                str(log.get("log_type", "")),
+                sanitize_text(str(log.get("description", "")))[:55],
+                user_name
+            ]
+            pdf.add_table_row(data, widths, alternate=(i % 2 == 1))
+
+    return pdf
+
+
+def render_maintenance_history(ctx: dict, rows: Iterable[dict]) -> FPDF:
+    eq, logs, assigned_employee = ctx["equipment"], ctx["logs"], ctx["assigned_employee"]
+    custom_fields, eq_custom_fields = ctx["custom_fields"], ctx["equipment_custom_fields"]
+    pdf = ModernPDF(title="Historial de Mantenimientos", company_name=ctx["company_name"], logo_url=ctx["logo_url"])
+    pdf.alias_nb_pages()
+    pdf.add_page()
+
+    pdf.section_title("INFORMACION DEL EQUIPO")
+    pdf.set_font("Helvetica", "", 9)
+    col_width = 95
+
+    if eq:
+        pdf.set_font("Helvetica", "B", 9)
+        pdf.cell(30, 6, "Codigo:", 0)
+        pdf.set_font("Helvetica", "", 9)
+        pdf.cell(col_width - 30, 6, str(eq.get('inventory_code', 'N/A')), 0)
+        pdf.set_font("Helvetica", "B", 9)
+        pdf.cell(30, 6, "Tipo:", 0)
+        pdf.set_font("Helvetica", "", 9)
+        pdf.cell(col_width - 30, 6, str(eq.get('equipment_type', 'N/A')), 0, 1)
+
+        pdf.set_font("Helvetica", "B", 9)
+        pdf.cell(30, 6, "Marca:", 0)
+        pdf.set_font("Helvetica", "", 9)
+        pdf.cell(col_width - 30, 6, str(eq.get('brand', 'N/A')), 0)
+        pdf.set_font("Helvetica", "B", 9)
+        pdf.cell(30, 6, "Modelo:", 0)
+        pdf.set_font("Helvetica", "", 9)
+        pdf.cell(col_width - 30, 6, str(eq.get('model', 'N/A')), 0, 1)
+
+        pdf.set_font("Helvetica", "B", 9)
+        pdf.cell(30, 6, "No. Serie:", 0)
+        pdf.set_font("Helvetica", "", 9)
+        pdf.cell(col_width - 30, 6, str(eq.get('serial_number', 'N/A')), 0)
+        pdf.set_font("Helvetica", "B", 9)
+        pdf.cell(30, 6, "Estado:", 0)
+        pdf.set_font("Helvetica", "", 9)
+        pdf.cell(col_width - 30, 6, str(eq.get('status', 'N/A')), 0, 1)
+
+        if assigned_employee:
+            pdf.set_font("Helvetica", "B", 9)
+            pdf.cell(30, 6, "Asignado a:", 0)
+            pdf.set_font("Helvetica", "", 9)
+            pdf.cell(col_width - 30, 6, assigned_employee, 0, 1)
+
+        pdf.ln(3)
+
+        has_hardware = any([eq.get('processor_brand'), eq.get('ram_capacity'), eq.get('storage_capacity')])
+        if has_hardware:
+            pdf.section_title("ESPECIFICACIONES DE HARDWARE")
+            if eq.get('processor_brand') or eq.get('processor_model'):
+                pdf.set_font("Helvetica", "B", 9)
+                pdf.cell(30, 6, "Procesador:", 0)
+                pdf.set_font("Helvetica", "", 9)
+                proc_info = f"{eq.get('processor_brand', '')} {eq.get('processor_model', '')}".strip()
+                if eq.get('processor_speed'):
+                    proc_info += f" @ {eq.get('processor_speed')}"
+                pdf.cell(0, 6, proc_info or 'N/A', 0, 1)
+            if eq.get('ram_capacity'):
+                pdf.set_font("Helvetica", "B", 9)
+                pdf.cell(30, 6, "RAM:", 0)
+                pdf.set_font("Helvetica", "", 9)
+                ram_info = eq.get('ram_capacity', '')
+                if eq.get('ram_type'):
+                    ram_info += f" ({eq.get('ram_type')})"
+                pdf.cell(0, 6, ram_info, 0, 1)
+            if eq.get('storage_capacity'):
+                pdf.set_font("Helvetica", "B", 9)
+                pdf.cell(30, 6, "Almacenamiento:", 0)
+                pdf.set_font("Helvetica", "", 9)
+                storage_info = eq.get('storage_capacity', '')
+                if eq.get('storage_type'):
+                    storage_info = f"{eq.get('storage_type')} {storage_info}"
+                pdf.cell(0, 6, storage_info, 0, 1)
+            pdf.ln(3)
+
+        has_software = any([eq.get('os_name'), eq.get('antivirus_name'), eq.get('office_version')])
+        if has_software:
+            pdf.section_title("SOFTWARE INSTALADO")
+            if eq.get('os_name'):
+                pdf.set_font("Helvetica", "B", 9)
+                pdf.cell(30, 6, "Sist. Operativo:", 0)
+                pdf.set_font("Helvetica", "", 9)
+                os_info = eq.get('os_name', '')
+                if eq.get('os_version'):
+                    os_info += f" {eq.get('os_version')}"
+                pdf.cell(0, 6, os_info, 0, 1)
+                if eq.get('os_license'):
+                    pdf.set_font("Helvetica", "B", 9)
+                    pdf.cell(30, 6, "Licencia SO:", 0)
+                    pdf.set_font("Helvetica", "", 9)
+                    pdf.cell(0, 6, eq.get('os_license', ''), 0, 1)
+            if eq.get('office_version'):
+                pdf.set_font("Helvetica", "B", 9)
+                pdf.cell(30, 6, "Office:", 0)
+                pdf.set_font("Helvetica", "", 9)
+                pdf.cell(0, 6, eq.get('office_version', ''), 0, 1)
+                if eq.get('office_license'):
+                    pdf.set_font("Helvetica", "B", 9)
+                    pdf.cell(30, 6, "Lic. Office:", 0)
+                    pdf.set_font("Helvetica", "", 9)
+                    pdf.cell(0, 6, eq.get('office_license', ''), 0, 1)
+            if eq.get('antivirus_name'):
+                pdf.set_font("Helvetica", "B", 9)
+                pdf.cell(30, 6, "Antivirus:", 0)
+                pdf.set_font("Helvetica", "", 9)
+                pdf.cell(0, 6, eq.get('antivirus_name', ''), 0, 1)
+                if eq.get('antivirus_expiry'):
+                    pdf.set_font("Helvetica", "B", 9)
+                    pdf.cell(30, 6, "Vencimiento AV:", 0)
+                    pdf.set_font("Helvetica", "", 9)
+                    pdf.cell(0, 6, eq.get('antivirus_expiry', ''), 0, 1)
+            pdf.ln(3)
+
+        has_network = any([eq.get('ip_address'), eq.get('mac_address')])
+        if has_network:
+            pdf.section_title("CONFIGURACION DE RED")
+            if eq.get('ip_address'):
+                pdf.set_font("Helvetica", "B", 9)
+                pdf.cell(30, 6, "IP:", 0)
+                pdf.set_font("Helvetica", "", 9)
+                pdf.cell(col_width - 30, 6, eq.get('ip_address', ''), 0)
+            if eq.get('mac_address'):
+                pdf.set_font("Helvetica", "B", 9)
+                pdf.cell(30, 6, "MAC:", 0)
+                pdf.set_font("Helvetica", "", 9)
+                pdf.cell(col_width - 30, 6, eq.get('mac_address', ''), 0)
+            pdf.ln(8)
+
+        if eq_custom_fields and eq.get("custom_fields"):
+            pdf.section_title("CAMPOS ADICIONALES DEL EQUIPO")
+            cf_values = eq.get("custom_fields", {})
+            for cf in eq_custom_fields:
+                value = cf_values.get(cf.get("name"), "")
+                if value:
+                    pdf.set_font("Helvetica", "B", 9)
+                    pdf.cell(50, 6, f"{cf.get('name')}:", 0)
+                    pdf.set_font("Helvetica", "", 9)
+                    pdf.cell(0, 6, str(value)[:80], 0, 1)
+            pdf.ln(3)
+
+    # Maintenance History
+    pdf.section_title(f"HISTORIAL DE MANTENIMIENTOS ({len(logs)} registros)")
+
+    if not logs:
+        pdf.set_font("Helvetica", "I", 10)
+        pdf.cell(0, 10, "No hay registros de mantenimiento para este equipo", ln=True, align="C")
+    else:
+        for idx, log in enumerate(logs):
+            maint_type = str(log.get("maintenance_type", ""))
+            status = str(log.get("status", ""))
+            date_str = str(log.get("performed_date", log.get("created_at", "")))[:10]
+
+            if maint_type == "Preventivo":
+                pdf.set_fill_color(41, 128, 185)
+            elif maint_type == "Correctivo":
+                pdf.set_fill_color(243, 156, 18)
+            elif maint_type == "Reparacion":
+                pdf.set_fill_color(231, 76, 60)
+            else:
+                pdf.set_fill_color(149, 165, 166)
+
+            pdf.set_text_color(255, 255, 255)
+            pdf.set_font("Helvetica", "B", 10)
+            pdf.cell(0, 8, f"  {idx + 1}. {maint_type} - {status} | Fecha: {date_str}", 0, ln=True, fill=True)
+            pdf.set_text_color(0, 0, 0)
+
+            rows = []
+            rows.append(("Descripcion", log.get('description', 'N/A')))
+            if log.get("technician"):
+                rows.append(("Tecnico", log.get('technician')))
+            if maint_type == "Preventivo":
+                if log.get("next_maintenance_date"):
+                    next_info = log.get('next_maintenance_date', '')
+                    if log.get("maintenance_frequency"):
+                        next_info += f" (Frecuencia: {log.get('maintenance_frequency')})"
+                    rows.append(("Prox. Mant.", next_info))
+            if maint_type in ["Correctivo", "Reparacion"]:
+                if log.get("problem_diagnosis"):
+                    rows.append(("Diagnostico", log.get('problem_diagnosis')))
+                if log.get("solution_applied"):
+                    rows.append(("Solucion", log.get('solution_applied')))
+                if log.get("repair_time_hours"):
+                    rows.append(("Tiempo", f"{log.get('repair_time_hours')} horas"))
+            if log.get("parts_used"):
+                rows.append(("Materiales", log.get('parts_used')))
+
+            if custom_fields and log.get("custom_fields"):
+                cf_values = log.get("custom_fields", {})
+                for cf in custom_fields:
+                    value = cf_values.get(cf.get("name"), "")
+                    if value:
+                        rows.append((cf.get('name'), str(value)))
+
+            page_width = 190
+            margin_left = 10
+
+            for i, (label, value) in enumerate(rows):
+                if not value:
+                    continue
+
+                is_first = (i == 0)
+                pdf.set_font("Helvetica", "", 9)
+                text_width = page_width - 30
+                safe_value = sanitize_text(str(value))
+                lines = pdf.multi_cell(text_width, 5, safe_value, split_only=True)
+                text_height = len(lines) * 5
+                row_height = max(6, text_height)
+
+                if pdf.get_y() + row_height > 280:
+                    pdf.add_page()
+                    is_first = True
+
+                start_y = pdf.get_y()
+
+                pdf.set_font("Helvetica", "B", 9)
+                border_l = "LT" if is_first else "L"
+                pdf.cell(30, row_height, f"{label}:", border_l, 0)
+
+                pdf.set_font("Helvetica", "", 9)
+                x_val = pdf.get_x()
+                y_val = pdf.get_y()
+
+                if is_first:
+                    pdf.line(x_val, y_val, margin_left + page_width, y_val)
+
+                pdf.multi_cell(text_width, 5, safe_value, border=0, align="L")
+                end_y = pdf.get_y()
+
+                pdf.line(margin_left + page_width, start_y, margin_left + page_width, end_y)
+                pdf.set_y(end_y)
+
+            pdf.set_font("Helvetica", "", 8)
+            pdf.set_text_color(100, 100, 100)
+            if log.get("completed_at"):
+                completed = str(log.get("completed_at", ""))[:19].replace("T", " ")
+                completion_text = f"Completado: {completed}"
+            else:
+                completion_text = f"Registrado: {str(log.get('created_at', ''))[:19].replace('T', ' ')}"
+
+            pdf.cell(0, 5, completion_text, "LRB", 1)
+            pdf.set_text_color(0, 0, 0)
+            pdf.ln(4)
+
+            if pdf.get_y() > 250:
+                pdf.add_page()
+
+    return pdf
+
+
+def render_maintenance(ctx: dict, rows: Iterable[dict]) -> FPDF:
+    stats, status_stats = ctx["type_counts"], ctx["status_counts"]
+    total = sum(stats.values())
+    pdf = ModernPDF(title="Reporte de Mantenimientos", company_name=ctx["company_name"], logo_url=ctx["logo_url"])
+    pdf.alias_nb_pages()
+    pdf.add_page()
+
+    pdf.set_font("Helvetica", "B", 11)
+    pdf.set_text_color(52, 73, 94)
+    pdf.cell(0, 8, f"Periodo: {ctx['period_label']}", ln=True, align="C")
+    pdf.set_font("Helvetica", "", 10)
+    pdf.set_text_color(100, 100, 100)
+    pdf.cell(0, 6, f"Desde: {ctx['start_date']} - Hasta: {ctx['end_date']}", ln=True, align="C")
+    pdf.set_text_color(0, 0, 0)
+    pdf.ln(5)
+
+    pdf.section_title("RESUMEN ESTADISTICO")
+    pdf.set_font("Helvetica", "B", 10)
+    pdf.cell(95, 8, f"Total de Registros: {total}", 1, 0, "C")
+    finalized = status_stats.get("Finalizado", 0)
+    pdf.cell(95, 8, f"Completados: {finalized} ({round(finalized/total*100) if total else 0}%)", 1, 1, "C")
+    pdf.ln(3)
+
+    pdf.set_font("Helvetica", "B", 9)
+    pdf.cell(0, 6, "Por Tipo de Mantenimiento:", ln=True)
+    pdf.set_font("Helvetica", "", 9)
+
+    colors = {"Preventivo": (41, 128, 185), "Correctivo": (243, 156, 18), "Reparacion": (231, 76, 60), "Otro": (149, 165, 166)}
+    for mtype, count in stats.items():
+        if count > 0:
+            pdf.set_fill_color(*colors.get(mtype, (149, 165, 166)))
+            pdf.set_text_color(255, 255, 255)
+            pdf.cell(47, 7, f"{mtype}: {count}", 1, 0, "C", fill=True)
+    pdf.ln(10)
+    pdf.set_text_color(0, 0, 0)
+
+    pdf.set_font("Helvetica", "B", 9)
+    pdf.cell(0, 6, "Por Estado:", ln=True)
+    pdf.set_font("Helvetica", "", 9)
+    status_colors = {"Pendiente": (241, 196, 15), "En Proceso": (52, 152, 219), "Finalizado": (46, 204, 113)}
+    for status, count in status_stats.items():
+        if count > 0:
+            pdf.set_fill_color(*status_colors.get(status, (149, 165, 166)))
+            pdf.set_text_color(255, 255, 255)
+            pdf.cell(63, 7, f"{status}: {count}", 1, 0, "C", fill=True)
+    pdf.ln(10)
+    pdf.set_text_color(0, 0, 0)
+
+    if not total:
+        pdf.set_font("Helvetica", "I", 10)
+        pdf.cell(0, 10, "No hay registros de mantenimiento en este periodo", ln=True, align="C")
+    else:
+        pdf.section_title("DETALLE DE MANTENIMIENTOS")
+
+    for idx, log in enumerate(rows):
+        eq = log.get("equipment") or {}
+        maint_type = log.get("maintenance_type", "Otro")
+        status = log.get("status", "Pendiente")
+        date_str = str(log.get("performed_date", log.get("created_at", "")))[:10]
+
+        if maint_type == "Preventivo":
+            pdf.set_fill_color(41, 128, 185)
+        elif maint_type == "Correctivo":
+            pdf.set_fill_color(243, 156, 18)
+        elif maint_type == "Reparacion":
+            pdf.set_fill_color(231, 76, 60)
+        else:
+            pdf.set_fill_color(149, 165, 166)
+
+        pdf.set_text_color(255, 255, 255)
+        pdf.set_font("Helvetica", "B", 9)
+        pdf.cell(0, 7, f"  {idx + 1}. {maint_type} | {status} | {date_str}", 0, ln=True, fill=True)
+        pdf.set_text_color(0, 0, 0)
+
+        pdf.set_fill_color(248, 249, 250)
+        pdf.set_draw_color(200, 200, 200)
+
+        pdf.set_font("Helvetica", "B", 8)
+        pdf.cell(25, 5, "Equipo:", "LT")
+        pdf.set_font("Helvetica", "", 8)
+        assigned_name = eq.get("assigned_name", "")
+        eq_code = eq.get('inventory_code', log.get('equipment_code', 'N/A'))
+        if assigned_name:
+            eq_info = f"{eq_code} - {assigned_name} - {eq.get('equipment_type', log.get('equipment_type', ''))}"
+        else:
+            eq_info = f"{eq_code} - {eq.get('equipment_type', log.get('equipment_type', ''))}"
+        pdf.cell(70, 5, eq_info[:55], "T")
+        pdf.set_font("Helvetica", "B", 8)
+        pdf.cell(20, 5, "Marca:", "T")
+        pdf.set_font("Helvetica", "", 8)
+        pdf.cell(0, 5, f"{eq.get('brand', '')} {eq.get('model', '')}"[:30], "RT", 1)
+
+        pdf.set_font("Helvetica", "B", 8)
+        pdf.cell(25, 5, "No. Serie:", "L")
+        pdf.set_font("Helvetica", "", 8)
+        pdf.cell(70, 5, str(eq.get('serial_number', 'N/A'))[:25], 0)
+
+        if eq.get('processor_brand') or eq.get('ram_capacity'):
+            pdf.set_font("Helvetica", "B", 8)
+            pdf.cell(20, 5, "Config:", 0)
+            pdf.set_font("Helvetica", "", 8)
+            config = []
+            if eq.get('processor_brand'):
+                config.append(f"{eq.get('processor_brand')} {eq.get('processor_model', '')}"[:15])
+            if eq.get('ram_capacity'):
+                config.append(f"RAM {eq.get('ram_capacity')}")
+            if eq.get('storage_capacity'):
+                config.append(f"{eq.get('storage_type', '')} {eq.get('storage_capacity')}"[:12])
+            pdf.cell(0, 5, " | ".join(config)[:45], "R", 1)
+        else:
+            pdf.cell(0, 5, "", "R", 1)
+
+        if eq.get('os_name') or eq.get('status'):
+            pdf.set_font("Helvetica", "B", 8)
+            pdf.cell(25, 5, "S.O.:", "L")
+            pdf.set_font("Helvetica", "", 8)
+            os_info = f"{eq.get('os_name', '')} {eq.get('os_version', '')}"[:30] if eq.get('os_name') else "N/A"
+            pdf.cell(70, 5, os_info, 0)
+            pdf.set_font("Helvetica", "B", 8)
+            pdf.cell(20, 5, "Estado Eq:", 0)
+            pdf.set_font("Helvetica", "", 8)
+            pdf.cell(0, 5, eq.get('status', 'N/A'), "R", 1)
+
+        if eq.get('office_version'):
+            pdf.set_font("Helvetica", "B", 8)
+            pdf.cell(25, 5, "Office:", "L")
+            pdf.set_font("Helvetica", "", 8)
+            office_info = eq.get('office_version', '')
+            if eq.get('office_license'):
+                office_info += f" | Lic: {eq.get('office_license', '')}"
+            pdf.cell(0, 5, office_info[:60], "R", 1)
+
+        assigned_name = eq.get("assigned_name", "")
+        if assigned_name:
+            pdf.set_font("Helvetica", "B", 8)
+            pdf.cell(25, 5, "Asignado a:", "L")
+            pdf.set_font("Helvetica", "", 8)
+            pdf.cell(0, 5, assigned_name, "R", 1)
+
+        detail_rows = []
+        detail_rows.append(("Descripcion", log.get('description', '')))
+        if log.get("technician"):
+            detail_rows.append(("Tecnico", log.get('technician')))
+        if maint_type == "Preventivo":
+            if log.get("next_maintenance_date") or log.get("maintenance_frequency"):
+                next_info = log.get('next_maintenance_date', 'N/A')
+                if log.get("maintenance_frequency"):
+                    next_info += f" (Frecuencia: {log.get('maintenance_frequency')})"
+                detail_rows.append(("Prox. Mant.", next_info))
+        if maint_type in ["Correctivo", "Reparacion"]:
+            if log.get("problem_diagnosis"):
+                detail_rows.append(("Diagnostico", log.get('problem_diagnosis')))
+            if log.get("solution_applied"):
+                detail_rows.append(("Solucion", log.get('solution_applied')))
+            if log.get("repair_time_hours"):
+                detail_rows.append(("Tiempo", f"{log.get('repair_time_hours')} horas"))
+        if log.get("parts_used"):
+            detail_rows.append(("Materiales", log.get('parts_used')))
+
+        page_width = 190
+        margin_left = 10
+        label_width = 30
+        text_width = page_width - label_width
+
+        for i, (label, value) in enumerate(detail_rows):
+            if not value:
+                continue
+            pdf.set_font("Helvetica", "", 8)
+            safe_value = sanitize_text(str(value))
+            lines = pdf.multi_cell(text_width, 4, safe_value, split_only=True)
+            row_height = max(5, len(lines) * 4)
+
+            if pdf.get_y() + row_height > 280:
+                pdf.add_page()
+
+            start_y = pdf.get_y()
+            pdf.set_font("Helvetica", "B", 8)
+            pdf.cell(label_width, row_height, f"{label}:", "L", 0)
+            pdf.set_font("Helvetica", "", 8)
+            x_val = pdf.get_x()
+            pdf.multi_cell(text_width, 4, safe_value, border=0, align="L")
+            end_y = pdf.get_y()
+            pdf.line(margin_left + page_width, start_y, margin_left + page_width, end_y)
+            pdf.set_y(end_y)
+
+        pdf.cell(0, 2, "", "LRB", 1)
+        pdf.ln(3)
+
+        if pdf.get_y() > 250:
+            pdf.add_page()
+
+    return pdf
+
+
+def render_equipment_status(ctx: dict, rows: Iterable[dict]) -> FPDF:
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.set_font("Helvetica", "B", 16)
+    pdf.cell(0, 10, "Estado de Equipos por Empresa", ln=True, align="C")
+    pdf.set_font("Helvetica", "", 10)
+    pdf.cell(0, 6, f"Empresa: {ctx['company_name']}", ln=True, align="C")
+    pdf.cell(0, 6, f"Generado: {datetime.now().strftime('%d/%m/%Y %H:%M')}", ln=True, align="C")
+    pdf.ln(5)
+
+    pdf.set_font("Helvetica", "B", 11)
+    pdf.cell(0, 8, "Resumen por Estado:", ln=True)
+    pdf.set_font("Helvetica", "", 10)
+    status_counts = ctx["status_counts"]
+    for status, count in sorted(status_counts.items()):
+        pdf.cell(0, 6, f"  - {status}: {count} equipo(s)", ln=True)
+    pdf.cell(0, 6, f"  Total: {sum(status_counts.values())} equipo(s)", ln=True)
+    pdf.ln(8)
+
+    pdf.set_font("Helvetica", "B", 11)
+    pdf.cell(0, 8, "Detalle de Equipos:", ln=True)
+    pdf.set_font("Helvetica", "B", 8)
+    pdf.cell(25, 7, "Codigo", 1)
+    pdf.cell(25, 7, "Tipo", 1)
+    pdf.cell(30, 7, "Marca/Modelo", 1)
+    pdf.cell(25, 7, "Serie", 1)
+    pdf.cell(25, 7, "Estado", 1)
+    pdf.cell(55, 7, "Asignado a", 1)
+    pdf.ln()
+    pdf.set_font("Helvetica", "", 7)
+
+    for eq in rows:
+        assigned_name = eq.get("assigned_name") or "Sin asignar"
+        pdf.cell(25, 6, str(eq.get("inventory_code", ""))[:12], 1)
+        pdf.cell(25, 6, str(eq.get("equipment_type", ""))[:12], 1)
+        pdf.cell(30, 6, f"{eq.get('brand', '')[:10]} {eq.get('model', '')[:10]}"[:18], 1)
+        pdf.cell(25, 6, str(eq.get("serial_number", ""))[:12], 1)
+        pdf.cell(25, 6, str(eq.get("status", ""))[:12], 1)
+        pdf.cell(55, 6, assigned_name[:30], 1)
+        pdf.ln()
+
+    return pdf
+
+
+def render_external_services(ctx: dict, rows: Iterable[dict]) -> FPDF:
+    service_count = 0
+    type_stats = {}
+    total_cost_monthly = 0
+    expiring_soon = []
+    today = datetime.now(timezone.utc).date()
+
+    for svc in rows:
+        service_count += 1
+        svc_type = svc.get("service_type", "Otro")
+        type_stats[svc_type] = type_stats.get(svc_type, 0) + 1
+        cost = svc.get("cost", 0) or 0
+        freq = svc.get("payment_frequency", "")
+        if freq == "Mensual":
+            total_cost_monthly += cost
+        elif freq == "Trimestral":
+            total_cost_monthly += cost / 3
+        elif freq == "Semestral":
+            total_cost_monthly += cost / 6
+        elif freq == "Anual":
+            total_cost_monthly += cost / 12
+
+        # Rows come back from the spool file as text
+        renewal = parse_iso(svc.get("renewal_date"))
+        if renewal:
+            days = days_until(renewal, today)
+            if 0 <= days <= 30:
+                expiring_soon.append({**svc, "days_until": days})
+
+    pdf = ModernPDF(
+        title="Reporte de Servicios Externos",
+        company_name=ctx["company_name"] if ctx["company_id"] else "Todas las Empresas",
+        logo_url=ctx["logo_url"]
+    )
+    pdf.alias_nb_pages()
+    pdf.add_page()
+
+    pdf.section_title("RESUMEN ESTADISTICO")
+    pdf.set_font("Helvetica", "B", 10)
+    pdf.cell(63, 8, f"Total Servicios: {service_count}", 1, 0, "C")
+    pdf.cell(63, 8, f"Costo Mensual Est.: ${total_cost_monthly:,.2f}", 1, 0, "C")
+    pdf.cell(64, 8, f"Por Renovar (30d): {len(expiring_soon)}", 1, 1, "C")
+    pdf.ln(3)
+
+    pdf.set_font("Helvetica", "B", 9)
+    pdf.cell(0, 6, "Por Tipo de Servicio:", ln=True)
+    pdf.set_font("Helvetica", "", 9)
+
+    type_colors = {
+        "Hosting": (52, 152, 219), "Servidor Privado": (155, 89, 182),
+        "VPS": (155, 89, 182), "Dominio": (46, 204, 113),
+        "SSL": (241, 196, 15), "Cloud Storage": (26, 188, 156),
+        "CDN": (230, 126, 34), "Backup": (52, 73, 94), "Otro": (149, 165, 166)
+    }
+
+    col_count = 0
+    for svc_type, count in sorted(type_stats.items()):
+        color = type_colors.get(svc_type, (149, 165, 166))
+        pdf.set_fill_color(*color)
+        pdf.set_text_color(255, 255, 255)
+        pdf.cell(47, 7, f"{svc_type}: {count}", 1, 0, "C", fill=True)
+        col_count += 1
+        if col_count >= 4:
+            pdf.ln()
+            col_count = 0
+    if col_count > 0:
+        pdf.ln()
+    pdf.set_text_color(0, 0, 0)
+    pdf.ln(5)
+
+    if expiring_soon:
+        pdf.section_title(f"SERVICIOS POR RENOVAR ({len(expiring_soon)})")
+        for svc in sorted(expiring_soon, key=lambda x: x.get("days_until", 999)):
+            days = svc.get("days_until", 0)
+            pdf.set_font("Helvetica", "B", 9)
+            if days <= 7:
+                pdf.set_fill_color(248, 215, 218)
+            else:
+                pdf.set_fill_color(255, 243, 205)
+            pdf.cell(0, 7, f"  {svc.get('provider', '')} - {svc.get('service_type', '')} | Vence en {days} dias", "LTR", 1, fill=True)
+            pdf.set_font("Helvetica", "", 8)
+            company_n = svc.get("company_name") or ""
+            pdf.cell(0, 5, f"  Empresa: {company_n} | Renovacion: {svc.get('renewal_date', '')[:10]}", "LBR", 1)
+        pdf.ln(5)
+
+    pdf.section_title(f"DETALLE DE SERVICIOS ({service_count})")
+
+    if not service_count:
+        pdf.set_font("Helvetica", "I", 10)
+        pdf.cell(0, 10, "No hay servicios registrados", ln=True, align="C")
+    else:
+        for idx, svc in enumerate(rows):
+            svc_type = svc.get("service_type", "Otro")
+            color = type_colors.get(svc_type, (149, 165, 166))
+            pdf.set_fill_color(*color)
+            pdf.set_text_color(255, 255, 255)
+            pdf.set_font("Helvetica", "B", 9)
+            pdf.cell(0, 7, f"  {idx + 1}. {svc.get('provider', '')} - {svc_type}", 0, 1, fill=True)
+            pdf.set_text_color(0, 0, 0)
+
+            page_width = 190
+            label_width = 35
+            text_width = page_width - label_width
+
+            detail_rows = []
+            comp_name = svc.get("company_name") or "N/A"
+            detail_rows.append(("Empresa", comp_name))
+            if svc.get("description"):
+                detail_rows.append(("Descripcion", svc.get("description")))
+            dates_info = f"Inicio: {svc.get('start_date', 'N/A')[:10]}"
+            if svc.get("renewal_date"):
+                dates_info += f" | Renovacion: {svc.get('renewal_date')[:10]}"
+            detail_rows.append(("Fechas", dates_info))
+            if svc.get("cost"):
+                cost_info = f"${svc.get('cost', 0):,.2f}"
+                if svc.get("payment_frequency"):
+                    cost_info += f" ({svc.get('payment_frequency')})"
+                detail_rows.append(("Costo", cost_info))
+            if svc.get("credentials_info"):
+                detail_rows.append(("Credenciales", svc.get("credentials_info")))
+
+            for i, (label, value) in enumerate(detail_rows):
+                if not value:
+                    continue
+                pdf.set_font("Helvetica", "", 8)
+                safe_value = sanitize_text(str(value))
+                lines = pdf.multi_cell(text_width, 4, safe_value, split_only=True)
+                row_height = max(5, len(lines) * 4)
+
+                if pdf.get_y() + row_height > 280:
+                    pdf.add_page()
+
+                start_y = pdf.get_y()
+                pdf.set_font("Helvetica", "B", 8)
+                pdf.cell(label_width, row_height, f"{label}:", "L", 0)
+                pdf.set_font("Helvetica", "", 8)
+                pdf.multi_cell(text_width, 4, safe_value, border=0, align="L")
+                end_y = pdf.get_y()
+                pdf.line(10 + page_width, start_y, 10 + page_width, end_y)
+                pdf.set_y(end_y)
+
+            pdf.cell(0, 2, "", "LRB", 1)
+            pdf.ln(3)
+
+            if pdf.get_y() > 250:
+                pdf.add_page()
+
+    return pdf
+
+
+def render_quotation(ctx: dict, rows: Iterable[dict]) -> FPDF:
+    quot, company = ctx["quotation"], ctx["company"]
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.set_font("Helvetica", "B", 18)
+    pdf.cell(0, 10, "COTIZACION", ln=True, align="C")
+    pdf.set_font("Helvetica", "B", 12)
+    pdf.cell(0, 8, quot.get("quotation_number", ""), ln=True, align="C")
+    pdf.ln(5)
+    pdf.set_font("Helvetica", "", 10)
+    if company:
+        pdf.cell(0, 6, company.get("name", ""), ln=True)
+    pdf.ln(5)
+    pdf.set_font("Helvetica", "B", 10)
+    pdf.cell(0, 6, "Cliente:", ln=True)
+    pdf.set_font("Helvetica", "", 10)
+    pdf.cell(0, 6, quot.get("client_name", ""), ln=True)
+    pdf.ln(10)
+    pdf.set_font("Helvetica", "B", 9)
+    pdf.cell(80, 8, "Descripcion", 1)
+    pdf.cell(20, 8, "Cant.", 1, align="C")
+    pdf.cell(30, 8, "P. Unit.", 1, align="C")
+    pdf.cell(35, 8, "Total", 1, align="C")
+    pdf.ln()
+    pdf.set_font("Helvetica", "", 9)
+    for item in quot.get("items", []):
+        pdf.cell(80, 7, item.get("description", "")[:40], 1)
+        pdf.cell(20, 7, str(item.get("quantity", 0)), 1, align="C")
+        pdf.cell(30, 7, f"${item.get('unit_price', 0):.2f}", 1, align="R")
+        pdf.cell(35, 7, f"${item.get('total', 0):.2f}", 1, align="R")
+        pdf.ln()
+    pdf.ln(5)
+    pdf.set_font("Helvetica", "B", 11)
+    pdf.cell(150, 8, "TOTAL:", 0, align="R")
+    pdf.cell(35, 8, f"${quot.get('total', 0):.2f}", 0, align="R")
+    return pdf
+
+
+def render_invoice(ctx: dict, rows: Iterable[dict]) -> FPDF:
+    inv, company = ctx["invoice"], ctx["company"]
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.set_font("Helvetica", "B", 18)
+    pdf.cell(0, 10, "FACTURA", ln=True, align="C")
+    pdf.set_font("Helvetica", "B", 12)
+    pdf.cell(0, 8, inv.get("invoice_number", ""), ln=True, align="C")
+    pdf.ln(5)
+    pdf.set_font("Helvetica", "", 10)
+    if company:
+        pdf.cell(0, 6, company.get("name", ""), ln=True)
+    pdf.ln(5)
+    pdf.set_font("Helvetica", "B", 10)
+    pdf.cell(0, 6, "Cliente:", ln=True)
+    pdf.set_font("Helvetica", "", 10)
+    pdf.cell(0, 6, inv.get("client_name", ""), ln=True)
+    if inv.get("client_tax_id"):
+        pdf.cell(0, 6, f"RUC: {inv.get('client_tax_id', '')}", ln=True)
+    pdf.ln(10)
+    pdf.set_font("Helvetica", "B", 9)
+    pdf.cell(80, 8, "Descripcion", 1)
+    pdf.cell(20, 8, "Cant.", 1, align="C")
+    pdf.cell(30, 8, "P. Unit.", 1, align="C")
+    pdf.cell(35, 8, "Total", 1, align="C")
+    pdf.ln()
+    pdf.set_font("Helvetica", "", 9)
+    for item in inv.get("items", []):
+        pdf.cell(80, 7, item.get("description", "")[:40], 1)
+        pdf.cell(20, 7, str(item.get("quantity", 0)), 1, align="C")
+        pdf.cell(30, 7, f"${item.get('unit_price', 0):.2f}", 1, align="R")
+        pdf.cell(35, 7, f"${item.get('total', 0):.2f}", 1, align="R")
+        pdf.ln()
+    pdf.ln(5)
+    pdf.set_font("Helvetica", "B", 11)
+    pdf.cell(150, 8, "TOTAL:", 0, align="R")
+    pdf.cell(35, 8, f"${inv.get('total', 0):.2f}", 0, align="R")
+    return pdf
+
+
+def render_tickets(ctx: dict, rows: Iterable[dict]) -> FPDF:
+    status, priority, category, period = ctx["status"], ctx["priority"], ctx["category"], ctx["period"]
+    status_counts = ctx["status_counts"]
+    total = sum(status_counts.values())
+    open_count = status_counts.get("Abierto", 0)
+    in_progress = status_counts.get("En Proceso", 0)
+    resolved = status_counts.get("Resuelto", 0)
+    closed = status_counts.get("Cerrado", 0)
+
+    # Generate PDF
+    pdf = ModernPDF()
+    pdf.set_auto_page_break(auto=True, margin=20)
+
+    # Title page info
+    pdf.add_page()
+    pdf.section_title("REPORTE DE TICKETS DE SOPORTE")
+    pdf.ln(3)
+
+    # Filters applied
+    pdf.set_font("Helvetica", "", 8)
+    filters_text = "Filtros: "
+    if status:
+        filters_text += f"Estado={status} "
+    if priority:
+        filters_text += f"Prioridad={priority} "
+    if category:
+        filters_text += f"Categoria={category} "
+    if period:
+        filters_text += f"Periodo={period} "
+    if filters_text == "Filtros: ":
+        filters_text += "Ninguno (todos los tickets)"
+    pdf.cell(0, 5, sanitize_text(filters_text), 0, 1)
+    pdf.cell(0, 5, f"Generado: {datetime.now().strftime('%d/%m/%Y %H:%M')}", 0, 1)
+    pdf.ln(5)
+
+    # Summary stats
+    pdf.set_font("Helvetica", "B", 10)
+    pdf.set_fill_color(240, 240, 240)
+    pdf.cell(0, 7, f"  Resumen: {total} tickets", 0, 1, fill=True)
+    pdf.set_font("Helvetica", "", 9)
+    pdf.cell(47, 6, f"  Abiertos: {open_count}", 0)
+    pdf.cell(47, 6, f"En Proceso: {in_progress}", 0)
+    pdf.cell(47, 6, f"Resueltos: {resolved}", 0)
+    pdf.cell(47, 6, f"Cerrados: {closed}", 0, 1)
+    pdf.ln(5)
+
+    # Table header
+    pdf.set_font("Helvetica", "B", 8)
+    pdf.set_fill_color(41, 128, 185)
+    pdf.set_text_color(255, 255, 255)
+    pdf.cell(16, 6, "No.", 1, fill=True, align="C")
+    pdf.cell(42, 6, "Titulo", 1, fill=True)
+    pdf.cell(22, 6, "Equipo", 1, fill=True, align="C")
+    pdf.cell(20, 6, "Estado", 1, fill=True, align="C")
+    pdf.cell(18, 6, "Prioridad", 1, fill=True, align="C")
+    pdf.cell(20, 6, "Categoria", 1, fill=True, align="C")
+    pdf.cell(24, 6, "Solicitante", 1, fill=True)
+    pdf.cell(28, 6, "Tecnico", 1, fill=True)
+    pdf.ln()
+    pdf.set_text_color(0, 0, 0)
+
+    # Table rows
+    pdf.set_font("Helvetica", "", 7)
+    for i, t in enumerate(rows):
+        if pdf.get_y() > 260:
+            pdf.add_page()
+            # Repeat header
+            pdf.set_font("Helvetica", "B", 8)
+            pdf.set_fill_color(41, 128, 185)
+            pdf.set_text_color(255, 255, 255)
+            pdf.cell(16, 6, "No.", 1, fill=True, align="C")
+            pdf.cell(42, 6, "Titulo", 1, fill=True)
+            pdf.cell(22, 6, "Equipo", 1, fill=True, align="C")
+            pdf.cell(20, 6, "Estado", 1, fill=True, align="C")
+            pdf.cell(18, 6, "Prioridad", 1, fill=True, align="C")
+            pdf.cell(20, 6, "Categoria", 1, fill=True, align="C")
+            pdf.cell(24, 6, "Solicitante", 1, fill=True)
+            pdf.cell(28, 6, "Tecnico", 1, fill=True)
+            pdf.ln()
+            pdf.set_text_color(0, 0, 0)
+            pdf.set_font("Helvetica", "", 7)
+
+        bg = (248, 248, 248) if i % 2 == 0 else (255, 255, 255)
+        pdf.set_fill_color(*bg)
+        pdf.cell(16, 5, sanitize_text(t.get("ticket_number", ""))[:8], 1, fill=True, align="C")
+        pdf.cell(42, 5, sanitize_text(t.get("title", ""))[:24], 1, fill=True)
+        pdf.cell(22, 5, sanitize_text(t.get("equipment_code", "-"))[:12], 1, fill=True, align="C")
+        pdf.cell(20, 5, sanitize_text(t.get("status", ""))[:12], 1, fill=True, align="C")
+        pdf.cell(18, 5, sanitize_text(t.get("priority", ""))[:10], 1, fill=True, align="C")
+        pdf.cell(20, 5, sanitize_text(t.get("category", ""))[:12], 1, fill=True, align="C")
+        pdf.cell(24, 5, sanitize_text(t.get("created_by_name", "-"))[:14], 1, fill=True)
+        pdf.cell(28, 5, sanitize_text(t.get("assigned_to_name", "-"))[:16], 1, fill=True)
+        pdf.ln()
+
+    # Detailed section
+    pdf.add_page()
+    pdf.section_title("DETALLE DE TICKETS")
+    pdf.ln(3)
+
+    for t in rows:
+        if pdf.get_y() > 240:
+            pdf.add_page()
+
+        # Ticket header
+        pdf.set_font("Helvetica", "B", 9)
+        pdf.set_fill_color(240, 240, 240)
+        pdf.cell(0, 6, sanitize_text(f"  {t.get('ticket_number', '')} - {t.get('title', '')}"), "LTR", 1, fill=True)
+
+        pdf.set_font("Helvetica", "", 8)
+        # Row 1
+        pdf.cell(25, 5, "  Estado:", "L")
+        pdf.cell(35, 5, sanitize_text(t.get("status", "")), 0)
+        pdf.cell(25, 5, "Prioridad:", 0)
+        pdf.cell(30, 5, sanitize_text(t.get("priority", "")), 0)
+        pdf.cell(25, 5, "Categoria:", 0)
+        pdf.cell(0, 5, sanitize_text(t.get("category", "")), "R", 1)
+        # Row 2
+        pdf.cell(25, 5, "  Creado:", "L")
+        pdf.cell(35, 5, sanitize_text(t.get("created_by_name", "-")), 0)
+        pdf.cell(25, 5, "Tecnico:", 0)
+        pdf.cell(30, 5, sanitize_text(t.get("assigned_to_name", "-")), 0)
+        pdf.cell(25, 5, "Equipo:", 0)
+        pdf.cell(0, 5, sanitize_text(t.get("equipment_code", "-")), "R", 1)
+        # Row 3
+        pdf.cell(25, 5, "  Fecha:", "LB")
+        created = t.get("created_at", "")[:10]
+        pdf.cell(35, 5, created, "B")
+        closed_at = t.get("closed_at", "")
+        if closed_at:
+            pdf.cell(25, 5, "Cerrado:", "B")
+            pdf.cell(0, 5, closed_at[:10], "BR", 1)
+        else:
+            pdf.cell(0, 5, "", "BR", 1)
+
+        # Description
+        if t.get("description"):
+            pdf.set_font("Helvetica", "I", 7)
+            pdf.cell(5, 4, "", 0)
+            desc = sanitize_text(t.get("description", ""))[:200]
+            pdf.multi_cell(180, 4, desc)
+
+        # Resolution notes
+        if t.get("resolution_notes"):
+            pdf.set_font("Helvetica", "B", 7)
+            pdf.cell(5, 4, "", 0)
+            pdf.cell(25, 4, "Resolucion:", 0)
+            pdf.set_font("Helvetica", "", 7)
+            pdf.multi_cell(160, 4, sanitize_text(t.get("resolution_notes", ""))[:200])
+
+        pdf.ln(3)
+
+    return pdf
+
+
+
+RENDERERS = {
+    "equipment": render_equipment,
+    "equipment_logs": render_equipment_logs,
+    "maintenance_history": render_maintenance_history,
+    "maintenance": render_maintenance,
+    "equipment_status": render_equipment_status,
+    "external_services": render_external_services,
+    "quotation": render_quotation,
+    "invoice": render_invoice,
+    "tickets": render_tickets,
+}
+
+
+def render_report(kind: str, ctx: dict, spool_path: str, out_path: str) -> None:
+    """Worker entry point: lay out report `kind` and write the PDF to `out_path`"""
+    rows = Spool(spool_path) if spool_path else []
+    RENDERERS[kind](ctx, rows).output(out_path)
@@ -0,0 +1,65 @@
+import asyncio
+from typing import Callable, Dict, Iterable, List, Union
+from database import db
+
+
+class Ref:
+    """Describes a foreign key on a document and the fields to copy from the referenced document.
+
+    `fields` maps the output field on the source document to either a field name of the
+    referenced document or a callable that receives the referenced document.
+    """
+
+    def __init__(self, key: str, collection: str, fields: Dict[str, Union[str, Callable[[dict], object]]],
+                 project: Iterable[str] = (), default=None):
+        self.key = key
+        self.collection = collection
+        self.fields = fields
+        self.default = default
+        self.project = {name for name in fields.values() if isinstance(name, str)} | set(project)
+
+
+def full_name(doc: dict) -> str:
+    return f"{doc.get('first_name', '')} {doc.get('last_name', '')}"
+
+
+async def _fetch(collection: str, ids: set, project: set) -> Dict[str, dict]:
+    if not ids:
+        return {}
+    projection = {"_id": 0, "id": 1, **{name: 1 for name in project}}
+    docs = await db[collection].find({"id": {"$in": list(ids)}}, projection).to_list(None)
+    return {d["id"]: d for d in docs}
+
+
+async def resolve_refs(docs: List[dict], *refs: Ref) -> List[dict]:
+    """Fill reference fields on every document with one `$in` query per referenced collection.
+
+    Documents whose foreign key is empty are left untouched; dangling keys get the ref default.
+    """
+    by_collection: Dict[str, List[Ref]] = {}
+    for ref in refs:
+        by_collection.setdefault(ref.collection, []).append(ref)
+
+    collections = list(by_collection)
+    lookups = []
+    for collection in collections:
+        coll_refs = by_collection[collection]
+        ids = {d[ref.key] for ref in coll_refs for d in docs if d.get(ref.key)}
+        project = set().union(*(ref.project for ref in coll_refs))
+        lookups.append(_fetch(collection, ids, project))
+    found = dict(zip(collections, await asyncio.gather(*lookups)))
+
+    for ref in refs:
+        referenced = found[ref.collection]
+        for d in docs:
+            if not d.get(ref.key):
+                continue
+            target = referenced.get(d[ref.key])
+            for out_field, source in ref.fields.items():
+                if target is None:
+                    d[out_field] = ref.default
+                elif callable(source):
+                    d[out_field] = source(target)
+                else:
+                    d[out_field] = target.get(source, ref.default)
+    return docs
@@ -0,0 +1,202 @@
+"""Per company, per month dashboard counters kept in `dashboard_rollups`.
+
+Every tracked document (equipment, maintenance log, ticket) contributes a set of
+counters to the rollup of its company and creation month. Write routes report the
+document before and after the change and only the difference is applied with `$inc`.
+`rebuild_rollups` recomputes the whole collection from the source collections:
+
+    python -m services.rollup_service rebuild
+
+Statuses and maintenance types used as counter names go through `encode_key`, and readers turn them back with `decode_key`.
+"""
+import asyncio
+import logging
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+from urllib.parse import unquote
+from pymongo import ReturnDocument
+from database import db
+from services.index_service import INDEX_SPECS
+
+logger = logging.getLogger(__name__)
+
+RollupKey = Tuple[Optional[str], str]
+
+
+def encode_key(value) -> str:
+    """A stored value usable as a field name: `%`, `.` and a leading `$` are percent-encoded"""
+    key = str(value).replace("%", "%25").replace(".", "%2E")
+    return "%24" + key[1:] if key.startswith("$") else key
+
+
+def decode_key(key: str) -> str:
+    return unquote(key)
+
+
+def _month(doc: dict) -> Optional[str]:
+    created_at = doc.get("created_at")
+    return created_at[:7] if isinstance(created_at, str) and len(created_at) >= 7 else None
+
+
+def _resolution_hours(log: dict) -> Optional[float]:
+    try:
+        created = datetime.fromisoformat(log["created_at"].replace("Z", "+00:00"))
+        completed = datetime.fromisoformat(log["completed_at"].replace("Z", "+00:00"))
+    except Exception:
+        return None
+    hours = (completed - created).total_seconds() / 3600
+    return hours if hours >= 0 else None
+
+
+def _equipment_counters(eq: dict) -> Dict[str, float]:
+    return {"equipment_added": 1, f"equipment_by_status.{encode_key(eq.get('status') or 'Sin estado')}": 1}
+
+
+def _maintenance_counters(log: dict) -> Dict[str, float]:
+    counters = {
+        f"maintenance_by_type.{encode_key(log.get('maintenance_type') or 'Otro')}": 1,
+        f"maintenance_by_status.{encode_key(log.get('status') or 'Sin estado')}": 1,
+    }
+    if log.get("equipment_id"):
+        counters[f"maintenance_by_equipment.{log['equipment_id']}"] = 1
+    if log.get("status") == "Finalizado" and log.get("completed_at"):
+        hours = _resolution_hours(log)
+        if hours is not None:
+            counters["resolution_hours_sum"] = hours
+            counters["resolution_count"] = 1
+    return counters
+
+
+def _ticket_counters(ticket: dict) -> Dict[str, float]:
+    return {"tickets_created": 1, f"tickets_by_status.{encode_key(ticket.get('status') or 'Sin estado')}": 1}
+
+
+COUNTERS = {
+    "equipment": _equipment_counters,
+    "maintenance": _maintenance_counters,
+    "ticket": _ticket_counters,
+}
+
+
+def _contribution(kind: str, doc: Optional[dict]) -> Dict[RollupKey, Dict[str, float]]:
+    if not doc or not _month(doc):
+        return {}
+    return {(doc.get("company_id"), _month(doc)): COUNTERS[kind](doc)}
+
+
+async def record(kind: str, before: Optional[dict], after: Optional[dict]):
+    """Apply the change of one document to the rollups.
+
+    `before` is None for inserts and `after` is None for deletes. Both must carry the
+    `company_id` the document is counted under.
+    """
+    deltas: Dict[RollupKey, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+    for sign, doc in ((-1, before), (1, after)):
+        for key, counters in _contribution(kind, doc).items():
+            for field, value in counters.items():
+                deltas[key][field] += sign * value
+
+    for (company_id, month), counters in deltas.items():
+        inc = {field: value for field, value in counters.items() if value}
+        if inc:
+            await db.dashboard_rollups.update_one(
+                {"company_id": company_id, "month": month}, {"$inc": inc}, upsert=True
+            )
+
+
+async def set_equipment(equipment_id: str, fields: dict) -> Optional[dict]:
+    """Update equipment fields and its rollup; returns the document before the update"""
+    before = await db.equipment.find_one_and_update(
+        {"id": equipment_id}, {"$set": fields},
+        projection={"_id": 0}, return_document=ReturnDocument.BEFORE,
+    )
+    if before:
+        await record("equipment", before, {**before, **fields})
+    return before
+
+
+async def equipment_company(equipment_id: Optional[str]) -> Optional[str]:
+    if not equipment_id:
+        return None
+    eq = await db.equipment.find_one({"id": equipment_id}, {"_id": 0, "company_id": 1})
+    return eq.get("company_id") if eq else None
+
+
+async def ticket_company(ticket: dict) -> Optional[str]:
+    """Tickets belong to the company of their equipment, else to the creator's company"""
+    company_id = await equipment_company(ticket.get("equipment_id"))
+    if company_id or not ticket.get("created_by"):
+        return company_id
+    user = await db.users.find_one({"id": ticket["created_by"]}, {"_id": 0, "company_id": 1})
+    return user.get("company_id") if user else None
+
+
+async def rebuild_rollups() -> int:
+    """Recompute every rollup from the source collections. Returns the number of documents.
+
+    The rollups are built in a staging collection that then replaces `dashboard_rollups` in
+    one rename, so readers never see them empty and concurrent rebuilds cannot collide.
+    Changes recorded while the source collections are being read may be missed, as with any
+    recount; run it again if needed.
+    """
+    totals: Dict[RollupKey, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+
+    def add(kind: str, doc: dict):
+        for key, counters in _contribution(kind, doc).items():
+            for field, value in counters.items():
+                totals[key][field] += value
+
+    async for eq in db.equipment.find({}, {"_id": 0, "id": 1, "company_id": 1, "status": 1, "created_at": 1}):
+        add("equipment", eq)
+
+    # Maintenance logs and tickets carry the company_id they were written under
+    maint_fields = {"_id": 0, "company_id": 1, "equipment_id": 1, "maintenance_type": 1, "status": 1,
+                    "created_at": 1, "completed_at": 1}
+    async for log in db.maintenance_logs.find({}, maint_fields):
+        add("maintenance", log)
+
+    async for ticket in db.tickets.find({}, {"_id": 0, "company_id": 1, "status": 1, "created_at": 1}):
+        add("ticket", ticket)
+
+    docs = []
+    for (company_id, month), counters in totals.items():
+        doc = {"company_id": company_id, "month": month}
+        for field, value in counters.items():
+            if not value:
+                continue
+            target = doc
+            *parents, leaf = field.split(".")
+            for part in parents:
+                target = target.setdefault(part, {})
+            target[leaf] = value
+        docs.append(doc)
+
+    if not docs:
+        await db.dashboard_rollups.delete_many({})
+        logger.info("Rebuilt 0 dashboard rollups")
+        return 0
+    staging = db[f"dashboard_rollups_rebuild_{uuid.uuid4().hex}"]
+    try:
+        await staging.insert_many(docs)
+        await staging.create_indexes(INDEX_SPECS["dashboard_rollups"])
+        await staging.rename("dashboard_rollups", dropTarget=True)
+    except Exception:
+        await staging.drop()
+        raise
+    logger.info(f"Rebuilt {len(docs)} dashboard rollups")
+    return len(docs)
+
+
+async def build_rollups() -> dict:
+    """Migration building the rollups of existing data"""
+    return {"documents": await rebuild_rollups()}
+
+
+if __name__ == "__main__":
+    import sys
+    logging.basicConfig(level=logging.INFO)
+    if sys.argv[1:] != ["rebuild"]:
+        sys.exit("usage: python -m services.rollup_service rebuild")
+    asyncio.run(rebuild_rollups())
@@ -0,0 +1,101 @@
+"""One worker process runs the scheduled jobs.
+
+Every uvicorn worker starts the APScheduler `scheduler` paused, with the same jobs, and competes
+for the lease document in `scheduler_leases`. The holder renews it every
+SCHEDULER_LEASE_RENEW_SECONDS and keeps its scheduler running; the others keep theirs paused and
+try again on the same period. When the holder dies its lease expires after
+SCHEDULER_LEASE_TTL_SECONDS and another worker takes it over; a clean shutdown releases it at
+once. Schedule changes saved by any worker are picked up on the same period.
+"""
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timezone, timedelta
+from typing import Optional
+from apscheduler.schedulers.base import STATE_PAUSED, STATE_RUNNING
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from config import SCHEDULER_LEASE_TTL_SECONDS, SCHEDULER_LEASE_RENEW_SECONDS
+from database import db
+from services.email_service import scheduler, load_scheduler_job
+
+logger = logging.getLogger(__name__)
+
+LEASE_NAME = "scheduler"
+# Host and pid for people reading the lease, plus a suffix in case a pid is reused
+LEASE_OWNER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+_lease_task: Optional[asyncio.Task] = None
+
+
+async def acquire_lease(now: Optional[datetime] = None) -> bool:
+    """Take the lease if it is free or expired, or renew it if this process holds it"""
+    now = now or datetime.now(timezone.utc)
+    try:
+        lease = await db.scheduler_leases.find_one_and_update(
+            {"_id": LEASE_NAME, "$or": [{"owner": LEASE_OWNER}, {"expires_at": {"$lte": now}}]},
+            {"$set": {"owner": LEASE_OWNER, "expires_at": now + timedelta(seconds=SCHEDULER_LEASE_TTL_SECONDS),
+                      "renewed_at": now}},
+            upsert=True, return_document=ReturnDocument.AFTER,
+        )
+    except DuplicateKeyError:
+        # Held by another worker: the upsert tried to insert a second lease
+        return False
+    return lease is not None and lease["owner"] == LEASE_OWNER
+
+
+async def release_lease():
+    await db.scheduler_leases.delete_one({"_id": LEASE_NAME, "owner": LEASE_OWNER})
+
+
+def is_scheduler_leader() -> bool:
+    return scheduler.state == STATE_RUNNING
+
+
+def _run_jobs(leader: bool):
+    if leader and scheduler.state == STATE_PAUSED:
+        scheduler.resume()
+        logger.info(f"Scheduler lease acquired by {LEASE_OWNER}, running scheduled jobs")
+    elif not leader and scheduler.state == STATE_RUNNING:
+        scheduler.pause()
+        logger.info(f"Scheduler lease lost by {LEASE_OWNER}, scheduled jobs paused")
+
+
+async def _lease_worker():
+    while True:
+        try:
+            leader = await acquire_lease()
+            await load_scheduler_job()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Without a renewed lease another worker may take over; stop running jobs here
+            logger.error(f"Error renewing the scheduler lease: {str(e)}")
+            leader = False
+        _run_jobs(leader)
+        await asyncio.sleep(SCHEDULER_LEASE_RENEW_SECONDS)
+
+
+def start_scheduler_lease():
+    """Start `scheduler` paused and let the lease decide whether this process runs its jobs"""
+    global _lease_task
+    if not scheduler.running:
+        scheduler.start(paused=True)
+    if _lease_task is None:
+        _lease_task = asyncio.create_task(_lease_worker())
+
+
+async def stop_scheduler_lease():
+    global _lease_task
+    if _lease_task is not None:
+        _lease_task.cancel()
+        await asyncio.gather(_lease_task, return_exceptions=True)
+        _lease_task = None
+    if scheduler.running:
+        scheduler.shutdown()
+    try:
+        await release_lease()
+    except Exception as e:
+        logger.error(f"Error releasing the scheduler lease: {str(e)}")
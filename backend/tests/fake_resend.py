@@ -0,0 +1,64 @@
+"""Local stand-in for the Resend SDK that records every API call instead of sending."""
+import itertools
+import resend
+from resend.exceptions import ResendError, ValidationError
+
+BATCH_LIMIT = 100
+
+
+class FakeResend:
+    """Replaces `resend.Emails.send` and `resend.Batch.send` while installed.
+
+    `rejected` addresses fail validation (permanently), `flaky` addresses fail with a
+    provider 500 on their first single send, and `rate_limited` makes every call a 429.
+    `calls` keeps one entry per API request: ("emails", 1) or ("batch", messages).
+    """
+
+    def __init__(self, rejected=(), flaky=(), rate_limited=False):
+        self.rejected = set(rejected)
+        self.flaky = set(flaky)
+        self.rate_limited = rate_limited
+        self.calls = []
+        self.delivered = []
+        self._ids = itertools.count(1)
+
+    def install(self, monkeypatch):
+        monkeypatch.setattr(resend.Emails, "send", self.send)
+        monkeypatch.setattr(resend.Batch, "send", self.batch_send)
+        return self
+
+    def _check_limit(self):
+        if self.rate_limited:
+            raise ResendError(code=429, error_type="rate_limit_exceeded", message="Too many requests", suggested_action="")
+
+    def _deliver(self, to: str) -> dict:
+        self.delivered.append(to)
+        return {"id": f"fake-{next(self._ids)}"}
+
+    def send(self, params: dict) -> dict:
+        self.calls.append(("emails", 1))
+        self._check_limit()
+        to = params["to"][0]
+        if to in self.rejected:
+            raise ValidationError(message=f"Invalid `to` field: {to}", error_type="validation_error", code=422)
+        if to in self.flaky:
+            self.flaky.discard(to)
+            raise ResendError(code=500, error_type="internal_server_error", message="Unexpected error", suggested_action="")
+        return self._deliver(to)
+
+    def batch_send(self, params: list, options: dict = None) -> dict:
+        self.calls.append(("batch", len(params)))
+        self._check_limit()
+        if len(params) > BATCH_LIMIT:
+            raise ValidationError(message=f"Batch limit is {BATCH_LIMIT} emails", error_type="validation_error", code=422)
+        data, errors = [], []
+        for index, email in enumerate(params):
+            to = email["to"][0]
+            if to in self.rejected:
+                errors.append({"index": index, "message": f"Invalid `to` field: {to}"})
+            else:
+                data.append(self._deliver(to))
+        return {"data": data, "errors": errors}
+
+    def count(self, kind: str) -> int:
+        return sum(1 for call, _ in self.calls if call == kind)
@@ -0,0 +1,90 @@
+"""Materialized alert feed: /notifications/check reads it, writes refresh it, /notifications/stream pushes it."""
+import json
+import os
+import uuid
+import pytest
+import requests
+
+BASE_URL = os.environ.get("REACT_APP_BACKEND_URL", "https://maintenance-hub-284.preview.emergentagent.com").rstrip("/")
+
+
+@pytest.fixture(scope="module")
+def token():
+    r = requests.post(f"{BASE_URL}/api/auth/login",
+                      json={"email": "admin@example.com", "password": "adminpassword"},
+                      timeout=15)
+    assert r.status_code == 200, f"login failed: {r.status_code} {r.text}"
+    return r.json()["access_token"]
+
+
+@pytest.fixture(scope="module")
+def headers(token):
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture(scope="module")
+def equipment(headers):
+    r = requests.post(f"{BASE_URL}/api/companies", headers=headers, json={"name": "TEST_Alerts Co"}, timeout=15)
+    assert r.status_code == 200, r.text
+    suffix = uuid.uuid4().hex[:6]
+    r = requests.post(f"{BASE_URL}/api/equipment", headers=headers, timeout=15, json={
+        "company_id": r.json()["id"], "equipment_type": "Laptop", "brand": "TEST", "model": "A",
+        "inventory_code": f"TEST-ALERT-{suffix}", "serial_number": f"TEST-ALERT-SN-{suffix}",
+    })
+    assert r.status_code == 200, r.text
+    yield r.json()
+    requests.delete(f"{BASE_URL}/api/equipment/{r.json()['id']}", headers=headers, timeout=15)
+
+
+def test_check_returns_the_feed(headers):
+    r = requests.get(f"{BASE_URL}/api/notifications/check", headers=headers, timeout=15)
+    assert r.status_code == 200, r.text
+    feed = r.json()
+    assert feed["total_alerts"] == len(feed["pending_maintenance"]) + len(feed["expiring_services"])
+    assert all(0 <= svc["days_until"] <= 30 for svc in feed["expiring_services"])
+    assert isinstance(feed["open_tickets"], int)
+
+
+def test_writes_refresh_the_feed(headers, equipment):
+    renewal = requests.get(f"{BASE_URL}/api/notifications/check", headers=headers, timeout=15).json()["date"]
+    r = requests.post(f"{BASE_URL}/api/external-services", headers=headers, timeout=15, json={
+        "company_id": equipment["company_id"], "service_type": "Hosting", "provider": "TEST_Alert Provider",
+        "start_date": renewal,
+        "renewal_date": renewal,
+    })
+    assert r.status_code == 200, r.text
+    service_id = r.json()["id"]
+    r = requests.post(f"{BASE_URL}/api/maintenance", headers=headers, timeout=15, json={
+        "equipment_id": equipment["id"], "maintenance_type": "Preventivo", "description": "TEST alert feed",
+    })
+    assert r.status_code == 200, r.text
+    log_id = r.json()["id"]
+
+    feed = requests.get(f"{BASE_URL}/api/notifications/check", headers=headers, timeout=15).json()
+    pending = {m["id"]: m for m in feed["pending_maintenance"]}
+    assert pending[log_id]["equipment_code"] == equipment["inventory_code"]
+    expiring = {svc["id"]: svc for svc in feed["expiring_services"]}
+    assert expiring[service_id]["days_until"] == 0
+    assert expiring[service_id]["company_name"] == "TEST_Alerts Co"
+
+    requests.put(f"{BASE_URL}/api/maintenance/{log_id}/complete", headers=headers, timeout=15)
+    requests.delete(f"{BASE_URL}/api/external-services/{service_id}", headers=headers, timeout=15)
+    feed = requests.get(f"{BASE_URL}/api/notifications/check", headers=headers, timeout=15).json()
+    assert log_id not in {m["id"] for m in feed["pending_maintenance"]}
+    assert service_id not in {svc["id"] for svc in feed["expiring_services"]}
+
+
+def test_stream_sends_the_feed_first(headers, token):
+    feed = requests.get(f"{BASE_URL}/api/notifications/check", headers=headers, timeout=15).json()
+    with requests.get(f"{BASE_URL}/api/notifications/stream", params={"token": token}, stream=True, timeout=15) as r:
+        assert r.status_code == 200
+        assert r.headers["Content-Type"].startswith("text/event-stream")
+        lines = r.iter_lines(decode_unicode=True)
+        assert next(lines) == "event: alerts"
+        data = json.loads(next(lines).removeprefix("data: "))
+    assert data["total_alerts"] == feed["total_alerts"]
+
+
+def test_stream_requires_a_valid_token():
+    r = requests.get(f"{BASE_URL}/api/notifications/stream", params={"token": "invalid"}, timeout=15)
+    assert r.status_code == 401
@@ -0,0 +1,50 @@
+"""Tests for the in-process user/role cache used by authentication."""
+import os
+import pytest
+import requests
+
+BASE_URL = os.environ.get("REACT_APP_BACKEND_URL", "https://maintenance-hub-284.preview.emergentagent.com").rstrip("/")
+
+
+@pytest.fixture(scope="module")
+def headers():
+    r = requests.post(f"{BASE_URL}/api/auth/login",
+                      json={"email": "admin@example.com", "password": "adminpassword"},
+                      timeout=15)
+    assert r.status_code == 200, f"login failed: {r.status_code} {r.text}"
+    return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+
+def _user_cache(headers):
+    r = requests.get(f"{BASE_URL}/api/diagnostics/cache", headers=headers, timeout=15)
+    assert r.status_code == 200, r.text
+    return next(c for c in r.json()["caches"] if c["name"] == "users")
+
+
+def test_repeated_requests_hit_cache(headers):
+    before = _user_cache(headers)
+    for _ in range(3):
+        assert requests.get(f"{BASE_URL}/api/auth/me", headers=headers, timeout=15).status_code == 200
+    after = _user_cache(headers)
+    assert after["hits"] > before["hits"]
+    assert after["size"] <= after["max_entries"]
+
+
+def test_deleted_user_is_not_served_from_cache(headers):
+    roles = requests.get(f"{BASE_URL}/api/roles", headers=headers, timeout=15).json()
+    consulta = next(r for r in roles if r["name"] == "Consulta")
+    r = requests.post(f"{BASE_URL}/api/users", headers=headers, timeout=15, json={
+        "email": "test_cache_user@example.com", "password": "secret123", "name": "TEST Cache", "role_id": consulta["id"]})
+    assert r.status_code in (200, 400), r.text
+    user_id = r.json().get("id") or next(
+        u["id"] for u in requests.get(f"{BASE_URL}/api/users", headers=headers, timeout=15).json()
+        if u["email"] == "test_cache_user@example.com")
+
+    login = requests.post(f"{BASE_URL}/api/auth/login", timeout=15,
+                          json={"email": "test_cache_user@example.com", "password": "secret123"})
+    assert login.status_code == 200
+    user_headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+    assert requests.get(f"{BASE_URL}/api/auth/me", headers=user_headers, timeout=15).status_code == 200
+
+    requests.delete(f"{BASE_URL}/api/users/{user_id}/permanent", headers=headers, timeout=15)
+    assert requests.get(f"{BASE_URL}/api/auth/me", headers=user_headers, timeout=15).status_code == 401
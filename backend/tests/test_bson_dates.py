@@ -0,0 +1,66 @@
+"""renewal_date is stored as a BSON date, queried by range and returned as ISO 8601 text."""
+import os
+import sys
+from datetime import date, datetime, timezone
+import pytest
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "inventario_ti_test")
+
+from helpers import parse_iso, iso, days_window, days_until  # noqa: E402
+from models import ExternalServiceCreate  # noqa: E402
+
+BASE_URL = os.environ.get("REACT_APP_BACKEND_URL", "https://maintenance-hub-284.preview.emergentagent.com").rstrip("/")
+
+
+def test_dates_parse_to_utc_and_print_as_iso():
+    assert parse_iso("2026-11-01") == datetime(2026, 11, 1, tzinfo=timezone.utc)
+    assert parse_iso("2026-11-01T03:00:00-05:00") == datetime(2026, 11, 1, 8, tzinfo=timezone.utc)
+    assert parse_iso("") is None and parse_iso("31/12/2026") is None
+    assert iso(datetime(2026, 11, 1)) == "2026-11-01T00:00:00+00:00"
+    assert iso("2026-11-01") == "2026-11-01"
+
+
+def test_window_covers_whole_days():
+    window = days_window(date(2026, 10, 17), 30)
+    assert window["$gte"] == datetime(2026, 10, 17, tzinfo=timezone.utc)
+    assert window["$lt"] == datetime(2026, 11, 17, tzinfo=timezone.utc)
+    assert days_until(datetime(2026, 11, 16, 23, 59), date(2026, 10, 17)) == 30
+
+
+def test_service_input_accepts_blank_and_rejects_garbage():
+    base = {"company_id": "c", "service_type": "Hosting", "provider": "P", "start_date": "2026-01-01"}
+    assert ExternalServiceCreate(**base, renewal_date="").renewal_date is None
+    assert ExternalServiceCreate(**base, renewal_date="2026-11-01").model_dump()["renewal_date"].tzinfo == timezone.utc
+    with pytest.raises(ValueError):
+        ExternalServiceCreate(**base, renewal_date="pronto")
+
+
+@pytest.fixture(scope="module")
+def headers():
+    r = requests.post(f"{BASE_URL}/api/auth/login",
+                      json={"email": "admin@example.com", "password": "adminpassword"},
+                      timeout=15)
+    assert r.status_code == 200, f"login failed: {r.status_code} {r.text}"
+    return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+
+def test_service_renewal_date_round_trips_as_iso(headers):
+    r = requests.post(f"{BASE_URL}/api/companies", headers=headers, json={"name": "TEST_Dates Co"}, timeout=15)
+    assert r.status_code == 200, r.text
+    company_id = r.json()["id"]
+    r = requests.post(f"{BASE_URL}/api/external-services", headers=headers, timeout=15, json={
+        "company_id": company_id, "service_type": "Dominio", "provider": "TEST_Dates",
+        "start_date": "2026-01-01", "renewal_date": "2099-03-15",
+    })
+    assert r.status_code == 200, r.text
+    service = r.json()
+    try:
+        assert service["renewal_date"] == "2099-03-15T00:00:00+00:00"
+        r = requests.get(f"{BASE_URL}/api/external-services", headers=headers,
+                         params={"company_id": company_id}, timeout=15)
+        assert [svc["renewal_date"] for svc in r.json()] == ["2099-03-15T00:00:00+00:00"]
+    finally:
+        requests.delete(f"{BASE_URL}/api/external-services/{service['id']}", headers=headers, timeout=15)
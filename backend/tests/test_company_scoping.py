@@ -0,0 +1,90 @@
+"""Maintenance logs and tickets carry the company of their equipment; company reports filter on it."""
+import os
+import re
+import uuid
+import zlib
+import pytest
+import requests
+
+BASE_URL = os.environ.get("REACT_APP_BACKEND_URL", "https://maintenance-hub-284.preview.emergentagent.com").rstrip("/")
+
+
+@pytest.fixture(scope="module")
+def headers():
+    r = requests.post(f"{BASE_URL}/api/auth/login",
+                      json={"email": "admin@example.com", "password": "adminpassword"},
+                      timeout=15)
+    assert r.status_code == 200, f"login failed: {r.status_code} {r.text}"
+    return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+
+@pytest.fixture(scope="module")
+def companies(headers):
+    created = []
+    for name in ("TEST_Scope A", "TEST_Scope B"):
+        r = requests.post(f"{BASE_URL}/api/companies", headers=headers, json={"name": name}, timeout=15)
+        assert r.status_code == 200, r.text
+        created.append(r.json())
+    suffix = uuid.uuid4().hex[:6]
+    r = requests.post(f"{BASE_URL}/api/equipment", headers=headers, timeout=15, json={
+        "company_id": created[0]["id"], "equipment_type": "Laptop", "brand": "TEST", "model": "S",
+        "inventory_code": f"TEST-SCOPE-{suffix}", "serial_number": f"TEST-SCOPE-SN-{suffix}",
+    })
+    assert r.status_code == 200, r.text
+    equipment = r.json()
+    r = requests.post(f"{BASE_URL}/api/maintenance", headers=headers, timeout=15, json={
+        "equipment_id": equipment["id"], "maintenance_type": "Preventivo", "description": "TEST scoping",
+    })
+    assert r.status_code == 200, r.text
+    yield created
+    requests.delete(f"{BASE_URL}/api/equipment/{equipment['id']}", headers=headers, timeout=15)
+
+
+def _pdf_text(content: bytes) -> bytes:
+    text = b""
+    for stream in re.findall(rb"stream\r?\n(.*?)\r?\nendstream", content, re.S):
+        try:
+            text += zlib.decompress(stream)
+        except zlib.error:
+            pass
+    return text
+
+
+def test_maintenance_report_is_scoped_to_company(headers, companies):
+    own, other = companies
+    r = requests.get(f"{BASE_URL}/api/reports/maintenance/pdf", headers=headers,
+                     params={"company_id": own["id"], "period": "day"}, timeout=60)
+    assert r.status_code == 200, r.text
+    assert b"Total de Registros: 1" in _pdf_text(r.content)
+
+    r = requests.get(f"{BASE_URL}/api/reports/maintenance/pdf", headers=headers,
+                     params={"company_id": other["id"], "period": "day"}, timeout=60)
+    assert r.status_code == 200, r.text
+    assert b"Total de Registros: 0" in _pdf_text(r.content)
+
+
+def test_open_maintenance_moves_with_its_equipment(headers, companies):
+    own, other = companies
+    suffix = uuid.uuid4().hex[:6]
+    r = requests.post(f"{BASE_URL}/api/equipment", headers=headers, timeout=15, json={
+        "company_id": own["id"], "equipment_type": "Laptop", "brand": "TEST", "model": "M",
+        "inventory_code": f"TEST-MOVE-{suffix}", "serial_number": f"TEST-MOVE-SN-{suffix}",
+    })
+    assert r.status_code == 200, r.text
+    equipment = r.json()
+    try:
+        r = requests.post(f"{BASE_URL}/api/maintenance", headers=headers, timeout=15, json={
+            "equipment_id": equipment["id"], "maintenance_type": "Correctivo", "description": "TEST move",
+        })
+        assert r.status_code == 200, r.text
+        moved = {key: equipment[key] for key in ("inventory_code", "equipment_type", "brand", "model", "serial_number")}
+        r = requests.put(f"{BASE_URL}/api/equipment/{equipment['id']}", headers=headers, timeout=15,
+                         json={**moved, "company_id": other["id"]})
+        assert r.status_code == 200, r.text
+
+        r = requests.get(f"{BASE_URL}/api/reports/maintenance/pdf", headers=headers,
+                         params={"company_id": other["id"], "period": "day"}, timeout=60)
+        assert r.status_code == 200, r.text
+        assert b"Total de Registros: 1" in _pdf_text(r.content)
+    finally:
+        requests.delete(f"{BASE_URL}/api/equipment/{equipment['id']}", headers=headers, timeout=15)
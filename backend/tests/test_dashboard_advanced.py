@@ -90,3 +90,20 @@ def test_advanced_stats_top_equipment_entries(auth_headers):
 def test_advanced_stats_unauthorized():
     r = requests.get(f"{BASE_URL}/api/dashboard/advanced-stats", timeout=10)
     assert r.status_code in (401, 403)
+
+
+# --- Rollups: served stats match a fresh recomputation ---
+def _by_status(rows):
+    return sorted((r["status"], r["count"]) for r in rows)
+
+
+def test_advanced_stats_rollups_match_fresh(auth_headers):
+    r = requests.post(f"{BASE_URL}/api/dashboard/rollups/rebuild", headers=auth_headers, timeout=60)
+    assert r.status_code == 200, r.text
+    rollup = requests.get(f"{BASE_URL}/api/dashboard/advanced-stats", headers=auth_headers, timeout=30).json()
+    fresh = requests.get(f"{BASE_URL}/api/dashboard/advanced-stats", headers=auth_headers,
+                         params={"fresh": "true"}, timeout=30).json()
+    assert _by_status(rollup["equipment_by_status"]) == _by_status(fresh["equipment_by_status"])
+    assert _by_status(rollup["maintenance_by_status"]) == _by_status(fresh["maintenance_by_status"])
+    assert _by_status(rollup["tickets_by_status"]) == _by_status(fresh["tickets_by_status"])
+    assert rollup["expiring_services_30d"] == fresh["expiring_services_30d"]
@@ -0,0 +1,71 @@
+"""Tests for batch email sending against a local Resend stand-in (no server needed)."""
+import asyncio
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "inventario_ti_test")
+
+from services import email_service  # noqa: E402
+from fake_resend import FakeResend  # noqa: E402
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setattr(email_service, "RESEND_API_KEY", "re_test")
+    monkeypatch.setattr(email_service, "send_bucket", email_service.TokenBucket(1000, 1000))
+    return email_service
+
+
+def _recipients(n):
+    return [f"user{i}@example.com" for i in range(n)]
+
+
+def test_batch_chunks_at_provider_limit(service, monkeypatch):
+    fake = FakeResend().install(monkeypatch)
+    results = asyncio.run(service.send_batch(_recipients(250), "Asunto", "<p>digest</p>"))
+    assert fake.calls == [("batch", 100), ("batch", 100), ("batch", 50)]
+    assert [r["recipient"] for r in results] == _recipients(250)
+    assert all(r["status"] == "success" and r["email_id"] for r in results)
+
+
+def test_only_rejected_recipients_fall_back(service, monkeypatch):
+    recipients = _recipients(10)
+    fake = FakeResend(rejected={recipients[3], recipients[7]}).install(monkeypatch)
+    results = asyncio.run(service.send_batch(recipients, "Asunto", "<p>digest</p>"))
+    assert fake.count("batch") == 1
+    assert fake.count("emails") == 2
+    failed = [r["recipient"] for r in results if r["status"] != "success"]
+    assert failed == [recipients[3], recipients[7]]
+    assert not any(r.get("transient") for r in results)
+
+
+def test_rate_limited_batch_is_not_split(service, monkeypatch):
+    fake = FakeResend(rate_limited=True).install(monkeypatch)
+    results = asyncio.run(service.send_batch(_recipients(120), "Asunto", "<p>digest</p>"))
+    assert fake.calls == [("batch", 100), ("batch", 20)]
+    assert all(r["status"] == "error" and r["transient"] for r in results)
+
+
+def test_single_recipient_uses_single_send(service, monkeypatch):
+    fake = FakeResend(flaky={"user0@example.com"}).install(monkeypatch)
+    results = asyncio.run(service.send_batch(_recipients(1), "Asunto", "<p>digest</p>"))
+    assert fake.calls == [("emails", 1)]
+    assert results[0]["status"] == "error" and results[0]["transient"]
+
+
+def test_send_quota_is_shared_by_worker_processes(monkeypatch):
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    monkeypatch.setattr(email_service, "db", mongomock_motor.AsyncMongoMockClient()["bucket_test"])
+    # One bucket per process, both drawing on the same stored tokens
+    workers = [email_service.SharedTokenBucket("resend", 0.001, 2) for _ in range(2)]
+
+    async def run():
+        await workers[0].acquire()
+        await workers[1].acquire()
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(workers[1].acquire(), 0.2)
+
+    asyncio.run(run())
@@ -0,0 +1,40 @@
+"""Tests for the persistent email outbox: events enqueue instead of sending inline."""
+import os
+import pytest
+import requests
+
+BASE_URL = os.environ.get("REACT_APP_BACKEND_URL", "https://maintenance-hub-284.preview.emergentagent.com").rstrip("/")
+
+
+@pytest.fixture(scope="module")
+def headers():
+    r = requests.post(f"{BASE_URL}/api/auth/login",
+                      json={"email": "admin@example.com", "password": "adminpassword"},
+                      timeout=15)
+    assert r.status_code == 200, f"login failed: {r.status_code} {r.text}"
+    return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+
+def test_outbox_lists_messages_without_html(headers):
+    r = requests.get(f"{BASE_URL}/api/notifications/outbox", headers=headers, params={"limit": 20}, timeout=15)
+    assert r.status_code == 200, r.text
+    body = r.json()
+    assert isinstance(body["summary"], dict)
+    assert len(body["messages"]) <= 20
+    for message in body["messages"]:
+        assert "html" not in message
+        assert message["status"] in ("pending", "sending", "sent", "failed")
+
+
+def test_ticket_creation_queues_email(headers):
+    r = requests.post(f"{BASE_URL}/api/tickets", headers=headers, timeout=15,
+                      json={"title": "TEST_Outbox ticket", "description": "outbox"})
+    assert r.status_code == 200, r.text
+    ticket_id = r.json()["id"]
+
+    r = requests.get(f"{BASE_URL}/api/notifications/outbox", headers=headers, params={"limit": 500}, timeout=15)
+    assert r.status_code == 200, r.text
+    queued = [m for m in r.json()["messages"] if m["context"].get("ticket_id") == ticket_id]
+    assert queued, "ticket creation did not enqueue a notification"
+    assert queued[0]["context"]["type"] == "ticket_created"
+    requests.delete(f"{BASE_URL}/api/tickets/{ticket_id}", headers=headers, timeout=15)
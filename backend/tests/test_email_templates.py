@@ -0,0 +1,60 @@
+"""Email template rendering: compiled-template cache and a 1000-item digest benchmark (no server needed)."""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "inventario_ti_test")
+
+from services import email_service  # noqa: E402
+
+DIGEST_SIZE = 1000
+BRANDING = {"company_name": "TEST_Bench Co", "logo_url": "", "primary_color": "#0f766e"}
+
+
+def _completed(n):
+    return [{
+        "equipment_code": f"INV-{i:04d}", "maintenance_type": "Correctivo", "description": f"Cambio de disco {i}",
+        "technician": "Tecnico", "problem_diagnosis": "Disco con sectores danados", "solution_applied": "Reemplazo",
+        "repair_time_hours": 2, "parts_used": "SSD 512GB", "completed_at": "2026-10-01T10:00:00",
+    } for i in range(n)]
+
+
+def _tickets(n):
+    return [{"ticket_number": f"TK-{i:05d}", "title": f"Ticket {i}", "priority": "Alta", "status": "Abierto",
+             "created_at": "2026-10-01T10:00:00"} for i in range(n)]
+
+
+def test_compiled_template_is_reused_per_branding():
+    compile_template = email_service._compile_template
+    email_service.get_email_template("tickets_open", {**BRANDING, "tickets": _tickets(1)})
+    hits = compile_template.cache_info().hits
+    subject, html = email_service.get_email_template("tickets_open", {**BRANDING, "tickets": _tickets(2)})
+    assert compile_template.cache_info().hits == hits + 1
+    assert subject == "TEST_Bench Co: Tickets de soporte abiertos"
+    assert "<strong>2</strong> ticket(s)" in html
+
+    _, other = email_service.get_email_template("tickets_open", {**BRANDING, "primary_color": "#ff0000", "tickets": []})
+    assert "#ff0000" in other and "#0f766e" not in other
+
+
+def test_branding_with_dollar_signs_is_literal():
+    subject, html = email_service.get_email_template("test", {"company_name": "$items Co", "message": "hola $count"})
+    assert subject == "$items Co: Notificacion"
+    assert "<p>hola $count</p>" in html
+
+
+def test_benchmark_1000_item_digest():
+    digests = {
+        "maintenance_completed": {**BRANDING, "maintenances": _completed(DIGEST_SIZE)},
+        "tickets_open": {**BRANDING, "tickets": _tickets(DIGEST_SIZE)},
+    }
+    for notification_type, data in digests.items():
+        started = time.perf_counter()
+        _, html = email_service.get_email_template(notification_type, data)
+        elapsed = time.perf_counter() - started
+        print(f"{notification_type}: {DIGEST_SIZE} items in {elapsed * 1000:.1f} ms, {len(html)} bytes")
+        assert f"<strong>{DIGEST_SIZE}</strong>" in html
+        assert elapsed < 0.5
+    assert html.count("<tr><td>TK-") == DIGEST_SIZE
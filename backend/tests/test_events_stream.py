@@ -0,0 +1,84 @@
+"""Push channel: topics, their transports and the /events/stream server-sent events."""
+import asyncio
+import json
+import os
+import sys
+import pytest
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "inventario_ti_test")
+
+import services.events_service as events  # noqa: E402
+from services.events_service import (  # noqa: E402
+    subscribe, publish, publish_to_company, subscriber_count, topic, ALL_COMPANIES, SUBSCRIBER_QUEUE_SIZE,
+)
+
+BASE_URL = os.environ.get("REACT_APP_BACKEND_URL", "https://maintenance-hub-284.preview.emergentagent.com").rstrip("/")
+
+
+@pytest.fixture
+def local_transport(monkeypatch):
+    monkeypatch.setattr(events, "transport", events.LocalTransport())
+
+
+def test_company_events_reach_company_and_global_subscribers(local_transport):
+    with subscribe(topic("tickets", "c1")) as company, subscribe(topic("tickets", ALL_COMPANIES)) as everyone, \
+            subscribe(topic("tickets", "c2")) as other:
+        asyncio.run(publish_to_company("tickets", "c1", {"ticket_id": "t1"}))
+        assert company.get_nowait() == ("tickets:c1", {"ticket_id": "t1"})
+        assert everyone.get_nowait() == ("tickets:*", {"ticket_id": "t1"})
+        assert other.empty()
+    assert subscriber_count() == 0
+
+
+def test_slow_subscriber_keeps_the_latest_events_and_resyncs(local_transport):
+    async def flood():
+        for n in range(SUBSCRIBER_QUEUE_SIZE + 2):
+            await publish("a" if n % 2 else "b", n)
+
+    with subscribe("a", "b") as queue:
+        asyncio.run(flood())
+        assert queue.qsize() == SUBSCRIBER_QUEUE_SIZE
+        assert queue.get_nowait() == ("b", 2)
+        assert queue.lagged
+
+
+def test_failed_send_does_not_raise(monkeypatch):
+    class Broken:
+        async def send(self, name, event):
+            raise RuntimeError("down")
+
+    monkeypatch.setattr(events, "transport", Broken())
+    asyncio.run(publish("a", 1))
+
+
+@pytest.fixture(scope="module")
+def token():
+    r = requests.post(f"{BASE_URL}/api/auth/login",
+                      json={"email": "admin@example.com", "password": "adminpassword"},
+                      timeout=15)
+    assert r.status_code == 200, f"login failed: {r.status_code} {r.text}"
+    return r.json()["access_token"]
+
+
+def test_stream_pushes_ticket_changes(token):
+    headers = {"Authorization": f"Bearer {token}"}
+    with requests.get(f"{BASE_URL}/api/events/stream", params={"token": token}, stream=True, timeout=30) as r:
+        assert r.status_code == 200
+        lines = r.iter_lines(decode_unicode=True)
+        assert next(lines).startswith("retry: ")
+        created = requests.post(f"{BASE_URL}/api/tickets", headers=headers, timeout=15, json={
+            "title": "TEST_events stream", "description": "push", "priority": "Baja", "category": "General",
+        })
+        assert created.status_code == 200, created.text
+        try:
+            for line in lines:
+                if line == "event: tickets":
+                    event = json.loads(next(lines).removeprefix("data: "))
+                    break
+            assert event["action"] == "created"
+            assert event["ticket_id"] == created.json()["id"]
+        finally:
+            requests.delete(f"{BASE_URL}/api/tickets/{created.json()['id']}", headers=headers, timeout=15)
@@ -0,0 +1,67 @@
+"""ETag / If-None-Match on polled endpoints: 304 without queries, new tag after a write."""
+import os
+import pytest
+import requests
+
+BASE_URL = os.environ.get("REACT_APP_BACKEND_URL", "https://maintenance-hub-284.preview.emergentagent.com").rstrip("/")
+
+
+@pytest.fixture(scope="module")
+def headers():
+    r = requests.post(f"{BASE_URL}/api/auth/login",
+                      json={"email": "admin@example.com", "password": "adminpassword"},
+                      timeout=15)
+    assert r.status_code == 200, f"login failed: {r.status_code} {r.text}"
+    return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+
+@pytest.mark.parametrize("path", ["/api/notifications/check", "/api/dashboard/stats",
+                                  "/api/tickets/options/constants", "/api/custom-fields"])
+def test_unchanged_response_is_304_without_queries(headers, path):
+    r = requests.get(f"{BASE_URL}{path}", headers=headers, timeout=30)
+    assert r.status_code == 200, r.text
+    etag = r.headers["ETag"]
+    assert r.headers["Cache-Control"].startswith("private")
+
+    r = requests.get(f"{BASE_URL}{path}", headers={**headers, "If-None-Match": etag}, timeout=30)
+    assert r.status_code == 304
+    assert r.headers["ETag"] == etag
+    assert r.headers["X-Query-Count"] == "0"
+    assert not r.content
+
+
+def test_public_settings_are_publicly_cacheable():
+    r = requests.get(f"{BASE_URL}/api/settings/public", timeout=15)
+    assert r.status_code == 200
+    assert r.headers["Cache-Control"].startswith("public")
+    r = requests.get(f"{BASE_URL}/api/settings/public", headers={"If-None-Match": r.headers["ETag"]}, timeout=15)
+    assert r.status_code == 304
+
+
+def test_write_changes_the_etag(headers):
+    r = requests.get(f"{BASE_URL}/api/custom-fields", headers=headers, params={"entity_type": "equipment"}, timeout=15)
+    assert r.status_code == 200
+    etag = r.headers["ETag"]
+
+    r = requests.post(f"{BASE_URL}/api/custom-fields", headers=headers, timeout=15, json={
+        "entity_type": "equipment", "name": "TEST_etag_field", "field_type": "text",
+    })
+    assert r.status_code == 200, r.text
+    field_id = r.json()["id"]
+    try:
+        r = requests.get(f"{BASE_URL}/api/custom-fields", params={"entity_type": "equipment"},
+                         headers={**headers, "If-None-Match": etag}, timeout=15)
+        assert r.status_code == 200
+        assert r.headers["ETag"] != etag
+        assert any(f["id"] == field_id for f in r.json())
+    finally:
+        requests.delete(f"{BASE_URL}/api/custom-fields/{field_id}", headers=headers, timeout=15)
+
+
+def test_etag_depends_on_query_and_requires_auth(headers):
+    r1 = requests.get(f"{BASE_URL}/api/custom-fields", headers=headers, params={"entity_type": "equipment"}, timeout=15)
+    r2 = requests.get(f"{BASE_URL}/api/custom-fields", headers=headers, params={"entity_type": "maintenance"}, timeout=15)
+    assert r1.headers["ETag"] != r2.headers["ETag"]
+
+    r = requests.get(f"{BASE_URL}/api/custom-fields", headers={"If-None-Match": "*"}, timeout=15)
+    assert r.status_code in (401, 403)
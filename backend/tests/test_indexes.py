@@ -0,0 +1,93 @@
+"""Tests for startup indexes: duplicate rejection through unique keys and the index report."""
+import asyncio
+import os
+import sys
+from datetime import datetime
+import pytest
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "inventario_ti_test")
+
+import services.index_service as index_service  # noqa: E402
+
+BASE_URL = os.environ.get("REACT_APP_BACKEND_URL", "https://maintenance-hub-284.preview.emergentagent.com").rstrip("/")
+
+
+@pytest.fixture(scope="module")
+def headers():
+    r = requests.post(f"{BASE_URL}/api/auth/login",
+                      json={"email": "admin@example.com", "password": "adminpassword"},
+                      timeout=15)
+    assert r.status_code == 200, f"login failed: {r.status_code} {r.text}"
+    return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+
+@pytest.fixture(scope="module")
+def company(headers):
+    r = requests.post(f"{BASE_URL}/api/companies", headers=headers, json={"name": "TEST_Indexes Co"}, timeout=15)
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+def test_duplicate_equipment_rejected(headers, company):
+    timestamp = datetime.now().strftime("%Y%m%d%H%M%S%f")
+    data = {
+        "company_id": company["id"], "inventory_code": f"TEST-IDX-{timestamp}",
+        "equipment_type": "Laptop", "brand": "Dell", "model": "Latitude",
+        "serial_number": f"SN-IDX-{timestamp}",
+    }
+    r = requests.post(f"{BASE_URL}/api/equipment", headers=headers, json=data, timeout=15)
+    assert r.status_code == 200, r.text
+    created = r.json()
+    try:
+        dup_serial = requests.post(f"{BASE_URL}/api/equipment", headers=headers,
+                                   json={**data, "inventory_code": f"{data['inventory_code']}-2"}, timeout=15)
+        assert dup_serial.status_code == 400
+        assert "número de serie" in dup_serial.json()["detail"]
+
+        dup_code = requests.post(f"{BASE_URL}/api/equipment", headers=headers,
+                                 json={**data, "serial_number": f"{data['serial_number']}-2"}, timeout=15)
+        assert dup_code.status_code == 400
+        assert "código de inventario" in dup_code.json()["detail"]
+    finally:
+        requests.delete(f"{BASE_URL}/api/equipment/{created['id']}", headers=headers, timeout=15)
+
+
+def test_index_report(headers):
+    r = requests.get(f"{BASE_URL}/api/diagnostics/indexes", headers=headers, timeout=30)
+    assert r.status_code == 200, r.text
+    report = r.json()
+    assert set(report) == {"missing", "unused", "undeclared"}
+    missing = {(m["collection"], m["index"]) for m in report["missing"]}
+    assert ("equipment", "serial_number_1") not in missing
+    assert ("users", "email_1") not in missing
+
+
+def test_startup_fails_when_a_unique_index_cannot_be_built(monkeypatch):
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    db = mongomock_motor.AsyncMongoMockClient()["indexes_test"]
+    monkeypatch.setattr(index_service, "db", db)
+
+    async def run():
+        await db.users.insert_many([{"id": "u1", "email": "dup@example.com"},
+                                    {"id": "u2", "email": "dup@example.com"}])
+        assert "users.email_1" in await index_service.ensure_indexes()
+        with pytest.raises(RuntimeError, match="users.email_1"):
+            await index_service.ensure_indexes(require_unique=True)
+
+    asyncio.run(run())
+
+
+def test_duplicate_document_numbers_do_not_stop_startup(monkeypatch):
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    db = mongomock_motor.AsyncMongoMockClient()["indexes_test"]
+    monkeypatch.setattr(index_service, "db", db)
+
+    async def run():
+        await db.tickets.insert_many([{"id": "t1", "ticket_number": "TK-000001"},
+                                      {"id": "t2", "ticket_number": "TK-000001"}])
+        assert "tickets.ticket_number_1" in await index_service.ensure_indexes(require_unique=True)
+
+    asyncio.run(run())
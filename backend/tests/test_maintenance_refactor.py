@@ -1,6 +1,7 @@
 """Backend tests for Maintenance CRUD after MaintenancePage.js refactor."""
 import os
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 import pytest
 import requests
 
@@ -155,6 +156,23 @@ def test_complete_maintenance_changes_status(headers, equipment_id):
     assert match[0].get("repair_time_hours") == 2.5
 
 
+def test_concurrent_transitions_apply_once(headers, equipment_id):
+    payload = {
+        "equipment_id": equipment_id,
+        "maintenance_type": "Correctivo",
+        "description": f"TEST_REFACTOR_RACE_{uuid.uuid4().hex[:6]}",
+    }
+    r = requests.post(f"{API}/maintenance", json=payload, headers=headers, timeout=20)
+    log_id = r.json()["id"]
+
+    for action in ("start", "complete"):
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            codes = sorted(pool.map(
+                lambda _: requests.put(f"{API}/maintenance/{log_id}/{action}", headers=headers, timeout=20).status_code,
+                range(4)))
+        assert codes == [200, 400, 400, 400], f"{action}: {codes}"
+
+
 # ---------- Reports PDF endpoints ----------
 def test_maintenance_period_report_pdf(headers):
     for period in ["day", "week", "month"]:
@@ -0,0 +1,77 @@
+"""Motor client settings from config.py and the per-server pool counters behind /diagnostics/pool."""
+import importlib.util
+import os
+import sys
+from types import SimpleNamespace
+import pytest
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "inventario_ti_test")
+
+import database  # noqa: E402
+from config import (  # noqa: E402
+    MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE, MONGO_APP_NAME,
+    MONGO_REPORT_READ_PREFERENCE, MONGO_REPORT_MAX_STALENESS_SECONDS,
+)
+
+BASE_URL = os.environ.get("REACT_APP_BACKEND_URL", "https://maintenance-hub-284.preview.emergentagent.com").rstrip("/")
+
+
+def test_client_options_come_from_config():
+    options = database.client_options()
+    assert options["maxPoolSize"] == MONGO_MAX_POOL_SIZE
+    assert options["minPoolSize"] == MONGO_MIN_POOL_SIZE
+    assert options["appname"] == MONGO_APP_NAME
+
+
+def test_missing_compressor_packages_are_skipped():
+    expected = [name for name, module in (("zstd", "zstandard"), ("snappy", "snappy"))
+                if importlib.util.find_spec(module) is not None]
+    assert database.available_compressors(["zstd", "snappy", "zlib"]) == expected + ["zlib"]
+
+
+def test_reporting_db_reads_from_configured_members():
+    preference = database.reporting_db.read_preference
+    assert preference.mongos_mode == MONGO_REPORT_READ_PREFERENCE
+    if MONGO_REPORT_READ_PREFERENCE != "primary":
+        assert preference.max_staleness == MONGO_REPORT_MAX_STALENESS_SECONDS
+    assert database.db.read_preference.mongos_mode == "primary"
+
+
+def test_primary_reporting_ignores_max_staleness(monkeypatch):
+    monkeypatch.setattr(database, "MONGO_REPORT_READ_PREFERENCE", "primary")
+    assert database.reporting_read_preference().document == {"mode": "primary"}
+
+
+def test_pool_listener_counts_connections_and_checkouts():
+    listener = database._PoolListener()
+    event = SimpleNamespace(address=("db1", 27017))
+    listener.connection_created(event)
+    listener.connection_created(event)
+    listener.connection_check_out_started(event)
+    listener.connection_checked_out(event)
+    [server] = listener.stats()
+    assert server["address"] == "db1:27017"
+    assert (server["open"], server["in_use"], server["idle"], server["checkouts"]) == (2, 1, 1, 1)
+    listener.connection_checked_in(event)
+    listener.connection_closed(event)
+    assert listener.stats()[0]["in_use"] == 0 and listener.stats()[0]["open"] == 1
+
+
+@pytest.fixture(scope="module")
+def headers():
+    r = requests.post(f"{BASE_URL}/api/auth/login",
+                      json={"email": "admin@example.com", "password": "adminpassword"},
+                      timeout=15)
+    assert r.status_code == 200, f"login failed: {r.status_code} {r.text}"
+    return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+
+def test_pool_diagnostics(headers):
+    r = requests.get(f"{BASE_URL}/api/diagnostics/pool", headers=headers, timeout=15)
+    assert r.status_code == 200, r.text
+    stats = r.json()
+    assert stats["max_pool_size"] >= stats["min_pool_size"]
+    assert all(server["open"] >= server["in_use"] for server in stats["servers"])
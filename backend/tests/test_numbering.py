@@ -0,0 +1,96 @@
+"""Tests for atomic invoice/quotation/ticket numbering and folio reservation."""
+import os
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import requests
+
+BASE_URL = os.environ.get("REACT_APP_BACKEND_URL", "https://maintenance-hub-284.preview.emergentagent.com").rstrip("/")
+
+
+@pytest.fixture(scope="module")
+def headers():
+    r = requests.post(f"{BASE_URL}/api/auth/login",
+                      json={"email": "admin@example.com", "password": "adminpassword"},
+                      timeout=15)
+    assert r.status_code == 200, f"login failed: {r.status_code} {r.text}"
+    return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+
+@pytest.fixture(scope="module")
+def company(headers):
+    r = requests.post(f"{BASE_URL}/api/companies", headers=headers, json={"name": "TEST_Numbering Co"}, timeout=15)
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+def _invoice(company_id, **extra):
+    return {"company_id": company_id, "client_name": "TEST Cliente", "client_rfc": "XAXX010101000",
+            "items": [{"description": "Servicio", "unit_price": 100}], **extra}
+
+
+def test_parallel_tickets_get_distinct_numbers(headers):
+    def create(i):
+        r = requests.post(f"{BASE_URL}/api/tickets", headers=headers, timeout=30,
+                          json={"title": f"TEST_numbering {i}", "description": "paralelo"})
+        assert r.status_code == 200, r.text
+        return r.json()["ticket_number"]
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        numbers = list(pool.map(create, range(8)))
+    assert len(set(numbers)) == len(numbers)
+
+
+def test_parallel_invoices_get_distinct_folios(headers, company):
+    def create(_):
+        r = requests.post(f"{BASE_URL}/api/invoices", headers=headers, json=_invoice(company["id"], serie="T"), timeout=30)
+        assert r.status_code == 200, r.text
+        return r.json()["invoice_number"]
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        numbers = list(pool.map(create, range(8)))
+    assert len(set(numbers)) == len(numbers)
+    assert all(n.startswith("T-") for n in numbers)
+
+
+def test_reserved_folios(headers, company):
+    r = requests.post(f"{BASE_URL}/api/invoices/reserve-folios", headers=headers, timeout=15,
+                      json={"company_id": company["id"], "serie": "R", "count": 3})
+    assert r.status_code == 200, r.text
+    folios = r.json()["numbers"]
+    assert len(folios) == 3 and int(folios[2]) - int(folios[0]) == 2
+
+    used = requests.post(f"{BASE_URL}/api/invoices", headers=headers, timeout=15,
+                         json=_invoice(company["id"], serie="R", folio=folios[1]))
+    assert used.status_code == 200, used.text
+    assert used.json()["invoice_number"] == f"R-{folios[1]}"
+
+    again = requests.post(f"{BASE_URL}/api/invoices", headers=headers, timeout=15,
+                          json=_invoice(company["id"], serie="R", folio=folios[1]))
+    assert again.status_code == 400
+
+    unreserved = requests.post(f"{BASE_URL}/api/invoices", headers=headers, timeout=15,
+                               json=_invoice(company["id"], serie="R", folio="999999"))
+    assert unreserved.status_code == 400
+
+
+def test_reserved_folio_is_stored_canonically(headers, company):
+    r = requests.post(f"{BASE_URL}/api/invoices/reserve-folios", headers=headers, timeout=15,
+                      json={"company_id": company["id"], "serie": "N", "count": 1})
+    assert r.status_code == 200, r.text
+    folio = r.json()["numbers"][0]
+    used = requests.post(f"{BASE_URL}/api/invoices", headers=headers, timeout=15,
+                         json=_invoice(company["id"], serie="N", folio=str(int(folio))))
+    assert used.status_code == 200, used.text
+    assert used.json()["folio"] == folio
+    for variant in (f" {int(folio)}", f"0{folio}"):
+        again = requests.post(f"{BASE_URL}/api/invoices", headers=headers, timeout=15,
+                              json=_invoice(company["id"], serie="N", folio=variant))
+        assert again.status_code == 400, variant
+
+
+def test_auto_assigned_folio_is_not_reserved(headers, company):
+    auto = requests.post(f"{BASE_URL}/api/invoices", headers=headers, json=_invoice(company["id"], serie="M"), timeout=15)
+    assert auto.status_code == 200, auto.text
+    r = requests.post(f"{BASE_URL}/api/invoices", headers=headers, timeout=15,
+                      json=_invoice(company["id"], serie="M", folio=auto.json()["folio"]))
+    assert r.status_code == 400
@@ -0,0 +1,64 @@
+"""Tests for keyset pagination and NDJSON streaming on list endpoints."""
+import json
+import os
+import pytest
+import requests
+
+BASE_URL = os.environ.get("REACT_APP_BACKEND_URL", "https://maintenance-hub-284.preview.emergentagent.com").rstrip("/")
+
+PAGINATED_ENDPOINTS = [
+    "/api/equipment",
+    "/api/maintenance",
+    "/api/assignments",
+    "/api/tickets",
+    "/api/invoices",
+    "/api/quotations",
+    "/api/external-services",
+]
+
+
+@pytest.fixture(scope="module")
+def headers():
+    r = requests.post(f"{BASE_URL}/api/auth/login",
+                      json={"email": "admin@example.com", "password": "adminpassword"},
+                      timeout=15)
+    assert r.status_code == 200, f"login failed: {r.status_code} {r.text}"
+    return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+
+@pytest.mark.parametrize("path", PAGINATED_ENDPOINTS)
+def test_pages_cover_full_list(headers, path):
+    full = requests.get(f"{BASE_URL}{path}", headers=headers, timeout=30)
+    assert full.status_code == 200, full.text
+    assert isinstance(full.json(), list)
+
+    ids, cursor = [], None
+    while True:
+        params = {"limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        r = requests.get(f"{BASE_URL}{path}", headers=headers, params=params, timeout=30)
+        assert r.status_code == 200, r.text
+        page = r.json()
+        assert len(page["items"]) <= 2
+        ids += [item["id"] for item in page["items"]]
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+
+    assert len(ids) == len(set(ids)), "pages overlap"
+    assert set(ids) == {item["id"] for item in full.json()}
+
+
+@pytest.mark.parametrize("path", PAGINATED_ENDPOINTS)
+def test_ndjson_stream(headers, path):
+    r = requests.get(f"{BASE_URL}{path}", headers=headers, params={"stream": "true"}, timeout=30)
+    assert r.status_code == 200, r.text
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in r.text.splitlines() if line]
+    assert all("id" in row for row in rows)
+
+
+def test_invalid_cursor_rejected(headers):
+    r = requests.get(f"{BASE_URL}/api/equipment", headers=headers, params={"cursor": "no-es-un-cursor"}, timeout=15)
+    assert r.status_code == 400
@@ -0,0 +1,37 @@
+"""bcrypt runs on the hashing threads, with admission control and a configurable work factor."""
+import asyncio
+import os
+import sys
+import bcrypt
+import pytest
+from fastapi import HTTPException
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "inventario_ti_test")
+
+import auth  # noqa: E402
+from config import BCRYPT_ROUNDS, PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE_DEPTH  # noqa: E402
+
+
+def test_hash_uses_configured_rounds_and_verifies():
+    hashed = asyncio.run(auth.hash_password("s3cret"))
+    assert hashed.startswith(f"$2b${BCRYPT_ROUNDS:02d}$")
+    assert asyncio.run(auth.verify_password("s3cret", hashed))
+    assert not asyncio.run(auth.verify_password("other", hashed))
+    assert not auth.needs_rehash(hashed)
+
+
+def test_other_work_factors_need_rehash():
+    rounds = 4 if BCRYPT_ROUNDS != 4 else 5
+    old = bcrypt.hashpw(b"s3cret", bcrypt.gensalt(rounds=rounds)).decode("utf-8")
+    assert auth.needs_rehash(old)
+    assert auth.needs_rehash("not-a-bcrypt-hash")
+
+
+def test_full_queue_is_rejected_with_retry_after(monkeypatch):
+    monkeypatch.setattr(auth, "_hash_in_flight", PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE_DEPTH)
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(auth.verify_password("s3cret", "$2b$12$x"))
+    assert exc.value.status_code == 503
+    assert "Retry-After" in exc.value.headers
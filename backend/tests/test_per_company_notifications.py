@@ -140,6 +140,21 @@ def test_send_now_global(headers):
     assert "message" in r.json()
 
 
+def test_send_now_global_records_company_timings(headers):
+    r = requests.post(f"{BASE_URL}/api/notifications/send-now", headers=headers, timeout=60)
+    assert r.status_code == 200
+    r = requests.get(f"{BASE_URL}/api/notifications/history", headers=headers, timeout=15)
+    assert r.status_code == 200
+    automatic = [h for h in r.json() if h.get("type") == "automatic" and "companies" in h]
+    if not automatic:
+        pytest.skip("no company has automatic notifications to send")
+    latest = automatic[0]
+    assert latest["duration_ms"] >= 0
+    for timing in latest["companies"]:
+        assert {"company_id", "sent", "duration_ms", "error"} <= set(timing)
+    assert sum(t["sent"] for t in latest["companies"]) == latest["total_sent"]
+
+
 # ============ email/send ============
 
 def test_send_manual_email_for_company(headers):
@@ -0,0 +1,70 @@
+"""Queries read only the fields their response model returns; responses are unchanged."""
+import os
+import sys
+import uuid
+import pytest
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "inventario_ti_test")
+
+from helpers import projection  # noqa: E402
+from models import EquipmentResponse, MaintenanceLogResponse  # noqa: E402
+
+BASE_URL = os.environ.get("REACT_APP_BACKEND_URL", "https://maintenance-hub-284.preview.emergentagent.com").rstrip("/")
+
+
+def test_projection_follows_response_model():
+    fields = projection(MaintenanceLogResponse, "company_id")
+    assert fields["_id"] == 0
+    assert set(fields) - {"_id"} == set(MaintenanceLogResponse.model_fields) | {"company_id"}
+    assert "windows_password" in projection(EquipmentResponse)
+
+
+@pytest.fixture(scope="module")
+def headers():
+    r = requests.post(f"{BASE_URL}/api/auth/login",
+                      json={"email": "admin@example.com", "password": "adminpassword"},
+                      timeout=15)
+    assert r.status_code == 200, f"login failed: {r.status_code} {r.text}"
+    return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+
+@pytest.fixture(scope="module")
+def equipment(headers):
+    r = requests.post(f"{BASE_URL}/api/companies", headers=headers, json={"name": "TEST_Projection Co"}, timeout=15)
+    assert r.status_code == 200, r.text
+    suffix = uuid.uuid4().hex[:6]
+    r = requests.post(f"{BASE_URL}/api/equipment", headers=headers, timeout=15, json={
+        "company_id": r.json()["id"], "equipment_type": "Laptop", "brand": "TEST", "model": "P",
+        "inventory_code": f"TEST-PROJ-{suffix}", "serial_number": f"TEST-PROJ-SN-{suffix}",
+        "windows_user": "tester", "custom_fields": {"piso": 3},
+    })
+    assert r.status_code == 200, r.text
+    yield r.json()
+    requests.delete(f"{BASE_URL}/api/equipment/{r.json()['id']}", headers=headers, timeout=15)
+
+
+def test_list_and_detail_return_the_same_equipment(headers, equipment):
+    r = requests.get(f"{BASE_URL}/api/equipment", headers=headers,
+                     params={"company_id": equipment["company_id"], "limit": 1}, timeout=15)
+    assert r.status_code == 200, r.text
+    page = r.json()
+    assert [item["id"] for item in page["items"]] == [equipment["id"]]
+    r = requests.get(f"{BASE_URL}/api/equipment/{equipment['id']}", headers=headers, timeout=15)
+    assert r.status_code == 200, r.text
+    assert page["items"][0] == r.json() == equipment
+    assert equipment["company_name"] == "TEST_Projection Co"
+
+
+def test_maintenance_history_keeps_joined_fields(headers, equipment):
+    r = requests.post(f"{BASE_URL}/api/maintenance", headers=headers, timeout=15, json={
+        "equipment_id": equipment["id"], "maintenance_type": "Preventivo", "description": "TEST projection",
+    })
+    assert r.status_code == 200, r.text
+    created = r.json()
+    r = requests.get(f"{BASE_URL}/api/maintenance/history/{equipment['id']}", headers=headers, timeout=15)
+    assert r.status_code == 200, r.text
+    assert r.json() == [created]
+    assert created["equipment_code"] == equipment["inventory_code"]
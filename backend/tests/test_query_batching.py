@@ -0,0 +1,60 @@
+"""Tests for batched reference resolution on list endpoints (X-Query-Count header)."""
+import os
+import pytest
+import requests
+
+BASE_URL = os.environ.get("REACT_APP_BACKEND_URL", "https://maintenance-hub-284.preview.emergentagent.com").rstrip("/")
+
+# auth lookup + main query + one $in per referenced collection
+LIST_ENDPOINTS = {
+    "/api/equipment": 5,
+    "/api/employees": 4,
+    "/api/branches": 3,
+    "/api/assignments": 4,
+    "/api/decommissions": 4,
+    "/api/maintenance": 4,
+    "/api/users": 5,
+    "/api/tickets": 5,
+    "/api/external-services": 3,
+    "/api/quotations": 3,
+    "/api/invoices": 3,
+}
+
+
+@pytest.fixture(scope="module")
+def headers():
+    r = requests.post(f"{BASE_URL}/api/auth/login",
+                      json={"email": "admin@example.com", "password": "adminpassword"},
+                      timeout=15)
+    assert r.status_code == 200, f"login failed: {r.status_code} {r.text}"
+    return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+
+@pytest.mark.parametrize("path,max_queries", LIST_ENDPOINTS.items())
+def test_list_query_count_is_bounded(headers, path, max_queries):
+    r = requests.get(f"{BASE_URL}{path}", headers=headers, timeout=30)
+    assert r.status_code == 200, r.text
+    assert "X-Query-Count" in r.headers, "missing X-Query-Count header"
+    count = int(r.headers["X-Query-Count"])
+    # role check for permission-gated lists adds one more lookup
+    assert count <= max_queries + 1, f"{path} issued {count} queries for {len(r.json())} rows"
+
+
+def test_equipment_enrichment_still_present(headers):
+    r = requests.get(f"{BASE_URL}/api/equipment", headers=headers, timeout=30)
+    assert r.status_code == 200
+    for eq in r.json():
+        assert "company_name" in eq
+        if eq.get("assigned_to"):
+            assert "assigned_employee_name" in eq
+
+
+def test_dashboard_stats_round_trips(headers):
+    r = requests.get(f"{BASE_URL}/api/dashboard/stats", headers=headers, timeout=30)
+    assert r.status_code == 200, r.text
+    # user lookup + equipment $facet + $unionWith counts + recent activity $lookup
+    assert int(r.headers["X-Query-Count"]) <= 4
+    data = r.json()
+    assert set(data["equipment"]) == {"total", "available", "assigned", "in_maintenance", "decommissioned"}
+    for log in data["recent_activity"]:
+        assert "equipment_code" in log
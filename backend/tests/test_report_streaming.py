@@ -0,0 +1,86 @@
+"""Tests for the streamed PDF reports: no 500-row cap, summary from aggregation, file download."""
+import os
+import re
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import requests
+
+BASE_URL = os.environ.get("REACT_APP_BACKEND_URL", "https://maintenance-hub-284.preview.emergentagent.com").rstrip("/")
+EQUIPMENT_COUNT = 505
+
+
+@pytest.fixture(scope="module")
+def headers():
+    r = requests.post(f"{BASE_URL}/api/auth/login",
+                      json={"email": "admin@example.com", "password": "adminpassword"},
+                      timeout=15)
+    assert r.status_code == 200, f"login failed: {r.status_code} {r.text}"
+    return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+
+@pytest.fixture(scope="module")
+def company(headers):
+    r = requests.post(f"{BASE_URL}/api/companies", headers=headers, json={"name": "TEST_Reports Co"}, timeout=15)
+    assert r.status_code == 200, r.text
+    company = r.json()
+    suffix = uuid.uuid4().hex[:6]
+
+    def create(i):
+        r = requests.post(f"{BASE_URL}/api/equipment", headers=headers, timeout=30, json={
+            "company_id": company["id"], "equipment_type": "Laptop", "brand": "TEST", "model": "R",
+            "inventory_code": f"TEST-RPT-{suffix}-{i}", "serial_number": f"TEST-RPT-SN-{suffix}-{i}",
+        })
+        assert r.status_code == 200, r.text
+        return r.json()["id"]
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        company["equipment_ids"] = list(pool.map(create, range(EQUIPMENT_COUNT)))
+    yield company
+    for equipment_id in company["equipment_ids"]:
+        requests.delete(f"{BASE_URL}/api/equipment/{equipment_id}", headers=headers, timeout=15)
+
+
+def _pdf_text(content: bytes) -> bytes:
+    text = b""
+    for stream in re.findall(rb"stream\r?\n(.*?)\r?\nendstream", content, re.S):
+        try:
+            text += zlib.decompress(stream)
+        except zlib.error:
+            pass
+    return text
+
+
+def test_equipment_report_is_not_capped(headers, company):
+    r = requests.get(f"{BASE_URL}/api/reports/equipment/pdf", headers=headers,
+                     params={"company_id": company["id"]}, timeout=300)
+    assert r.status_code == 200, r.text
+    assert r.headers["content-type"] == "application/pdf"
+    assert int(r.headers["content-length"]) == len(r.content)
+    assert r.content.startswith(b"%PDF")
+    text = _pdf_text(r.content)
+    assert f"{EQUIPMENT_COUNT} equipos".encode() in text
+    assert f"-{EQUIPMENT_COUNT - 1} ".encode() in text
+
+
+def test_maintenance_report_streams_empty_period(headers, company):
+    r = requests.get(f"{BASE_URL}/api/reports/maintenance/pdf", headers=headers,
+                     params={"company_id": company["id"], "period": "day"}, timeout=60)
+    assert r.status_code == 200, r.text
+    assert r.content.startswith(b"%PDF")
+    assert b"Total de Registros: 0" in _pdf_text(r.content)
+
+
+def test_concurrent_reports_render_or_ask_to_retry(headers):
+    def fetch(_):
+        return requests.get(f"{BASE_URL}/api/reports/equipment/pdf", headers=headers, timeout=300)
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        responses = list(pool.map(fetch, range(16)))
+    for r in responses:
+        assert r.status_code in (200, 503), r.text
+        if r.status_code == 503:
+            assert int(r.headers["retry-after"]) > 0
+        else:
+            assert r.content.startswith(b"%PDF")
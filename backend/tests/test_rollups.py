@@ -0,0 +1,60 @@
+"""Dashboard rollups: counter names built from stored values and the swap-in rebuild."""
+import asyncio
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "inventario_ti_test")
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+import services.rollup_service as rollup_service  # noqa: E402
+
+MAINTENANCE = {"company_id": "c1", "equipment_id": "e1", "maintenance_type": "Rev. 2", "status": "$pendiente",
+               "created_at": "2026-10-01T10:00:00+00:00"}
+
+
+@pytest.fixture
+def mock_db(monkeypatch):
+    db = mongomock_motor.AsyncMongoMockClient()["rollups_test"]
+    monkeypatch.setattr(rollup_service, "db", db)
+    return db
+
+
+def test_counter_names_round_trip():
+    for value in ("Preventivo", "Rev. 2", "$pendiente", "100%", "a.$b%2E"):
+        key = rollup_service.encode_key(value)
+        assert "." not in key and not key.startswith("$")
+        assert rollup_service.decode_key(key) == value
+
+
+def test_record_and_rebuild_agree_on_unusual_values(mock_db):
+    async def run():
+        await rollup_service.record("maintenance", None, MAINTENANCE)
+        recorded = await mock_db.dashboard_rollups.find_one({"company_id": "c1"}, {"_id": 0})
+        await mock_db.maintenance_logs.insert_one(dict(MAINTENANCE))
+        assert await rollup_service.rebuild_rollups() == 1
+        rebuilt = await mock_db.dashboard_rollups.find_one({"company_id": "c1"}, {"_id": 0})
+        return recorded, rebuilt
+
+    recorded, rebuilt = asyncio.run(run())
+    assert recorded == rebuilt
+    assert {rollup_service.decode_key(k) for k in rebuilt["maintenance_by_type"]} == {"Rev. 2"}
+
+
+def test_rebuild_replaces_the_collection_with_its_indexes(mock_db):
+    async def run():
+        await mock_db.dashboard_rollups.insert_one({"company_id": "stale", "month": "2020-01"})
+        await mock_db.maintenance_logs.insert_one(dict(MAINTENANCE))
+        await asyncio.gather(rollup_service.rebuild_rollups(), rollup_service.rebuild_rollups())
+        rollups = await mock_db.dashboard_rollups.find({}, {"_id": 0, "company_id": 1}).to_list(None)
+        indexes = await mock_db.dashboard_rollups.index_information()
+        names = await mock_db.list_collection_names()
+        return rollups, indexes, names
+
+    rollups, indexes, names = asyncio.run(run())
+    assert rollups == [{"company_id": "c1"}]
+    assert any(spec.get("unique") for spec in indexes.values())
+    assert not [name for name in names if name.startswith("dashboard_rollups_rebuild_")]
@@ -0,0 +1,90 @@
+"""Scheduled jobs run in the one worker holding the lease in `scheduler_leases`."""
+import asyncio
+import os
+import sys
+from datetime import datetime, timezone, timedelta
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "inventario_ti_test")
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+import services.email_service as email_service  # noqa: E402
+import services.scheduler_lease_service as lease  # noqa: E402
+from config import SCHEDULER_LEASE_TTL_SECONDS, SCHEDULER_LEASE_RENEW_SECONDS  # noqa: E402
+
+NOW = datetime(2026, 10, 17, 8, 0, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def mock_db(monkeypatch):
+    db = mongomock_motor.AsyncMongoMockClient()["lease_test"]
+    monkeypatch.setattr(lease, "db", db)
+    monkeypatch.setattr(email_service, "db", db)
+    return db
+
+
+def _as(monkeypatch, owner):
+    monkeypatch.setattr(lease, "LEASE_OWNER", owner)
+
+
+def test_holder_renews_and_others_wait(mock_db, monkeypatch):
+    async def run():
+        _as(monkeypatch, "worker-a")
+        assert await lease.acquire_lease(NOW)
+        assert await lease.acquire_lease(NOW + timedelta(seconds=SCHEDULER_LEASE_RENEW_SECONDS))
+        _as(monkeypatch, "worker-b")
+        assert not await lease.acquire_lease(NOW + timedelta(seconds=SCHEDULER_LEASE_TTL_SECONDS))
+        stored = await mock_db.scheduler_leases.find_one({"_id": lease.LEASE_NAME})
+        assert stored["owner"] == "worker-a"
+
+    asyncio.run(run())
+
+
+def test_expired_lease_is_taken_over(mock_db, monkeypatch):
+    async def run():
+        _as(monkeypatch, "worker-a")
+        assert await lease.acquire_lease(NOW)
+        _as(monkeypatch, "worker-b")
+        assert await lease.acquire_lease(NOW + timedelta(seconds=SCHEDULER_LEASE_TTL_SECONDS + 1))
+        _as(monkeypatch, "worker-a")
+        assert not await lease.acquire_lease(NOW + timedelta(seconds=SCHEDULER_LEASE_TTL_SECONDS + 2))
+
+    asyncio.run(run())
+
+
+def test_release_frees_the_lease_for_others_only(mock_db, monkeypatch):
+    async def run():
+        _as(monkeypatch, "worker-a")
+        assert await lease.acquire_lease(NOW)
+        _as(monkeypatch, "worker-b")
+        await lease.release_lease()
+        assert not await lease.acquire_lease(NOW)
+        _as(monkeypatch, "worker-a")
+        await lease.release_lease()
+        _as(monkeypatch, "worker-b")
+        assert await lease.acquire_lease(NOW)
+
+    asyncio.run(run())
+
+
+def test_jobs_due_during_failover_still_run():
+    assert email_service.scheduler._job_defaults["misfire_grace_time"] >= \
+        SCHEDULER_LEASE_TTL_SECONDS + SCHEDULER_LEASE_RENEW_SECONDS
+    assert email_service.scheduler._job_defaults["coalesce"]
+
+
+def test_daily_run_happens_once(mock_db):
+    runs = []
+
+    async def job():
+        runs.append(1)
+
+    async def run():
+        await email_service.run_daily_once("test_job", 0, 0, job)
+        await email_service.run_daily_once("test_job", 0, 0, job)
+
+    asyncio.run(run())
+    assert runs == [1]
@@ -0,0 +1,65 @@
+"""Tokens carry the role's permissions; a role update makes older tokens fall back to the role document."""
+import os
+import sys
+import uuid
+import jwt
+import pytest
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "inventario_ti_test")
+
+from auth import create_token  # noqa: E402
+
+BASE_URL = os.environ.get("REACT_APP_BACKEND_URL", "https://maintenance-hub-284.preview.emergentagent.com").rstrip("/")
+
+
+def test_token_embeds_role_claims():
+    token = create_token("u1", "u1@example.com", "r1", None,
+                         role={"id": "r1", "name": "Técnico", "permissions": ["equipment.read"], "version": 3})
+    claims = jwt.decode(token, options={"verify_signature": False})
+    assert claims["permissions"] == ["equipment.read"]
+    assert claims["role_name"] == "Técnico" and claims["role_version"] == 3
+    assert "permissions" not in jwt.decode(create_token("u1", "u1@example.com"), options={"verify_signature": False})
+
+
+@pytest.fixture(scope="module")
+def headers():
+    r = requests.post(f"{BASE_URL}/api/auth/login",
+                      json={"email": "admin@example.com", "password": "adminpassword"},
+                      timeout=15)
+    assert r.status_code == 200, f"login failed: {r.status_code} {r.text}"
+    return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+
+def test_role_update_reaches_issued_tokens(headers):
+    r = requests.post(f"{BASE_URL}/api/roles", headers=headers, timeout=15,
+                      json={"name": "TEST_Claims", "permissions": ["equipment.read"]})
+    assert r.status_code == 200, r.text
+    role_id = r.json()["id"]
+    email = f"test_claims_{uuid.uuid4().hex[:6]}@example.com"
+    r = requests.post(f"{BASE_URL}/api/users", headers=headers, timeout=15,
+                      json={"email": email, "password": "claims-pass", "name": "TEST Claims", "role_id": role_id})
+    assert r.status_code == 200, r.text
+    user_id = r.json()["id"]
+    try:
+        r = requests.post(f"{BASE_URL}/api/auth/login", json={"email": email, "password": "claims-pass"}, timeout=15)
+        assert r.status_code == 200, r.text
+        token = r.json()["access_token"]
+        assert jwt.decode(token, options={"verify_signature": False})["permissions"] == ["equipment.read"]
+        user_headers = {"Authorization": f"Bearer {token}"}
+
+        def allowed(permission):
+            r = requests.get(f"{BASE_URL}/api/permissions/check", headers=user_headers,
+                             params={"permission": permission}, timeout=15)
+            assert r.status_code == 200, r.text
+            return r.json()["has_permission"]
+
+        assert allowed("equipment.read") and not allowed("companies.write")
+        r = requests.put(f"{BASE_URL}/api/roles/{role_id}", headers=headers, timeout=15,
+                         json={"name": "TEST_Claims", "permissions": ["equipment.read", "companies.write"]})
+        assert r.status_code == 200, r.text
+        assert allowed("companies.write")
+    finally:
+        requests.delete(f"{BASE_URL}/api/users/{user_id}/permanent", headers=headers, timeout=15)
@@ -22,7 +22,7 @@ import {
   AlertCircle, CheckCircle, Info, Clock, Mail, Ticket
 } from 'lucide-react';
 import { cn } from '../lib/utils';
-import api from '../lib/api';
+import api, { notificationsAPI, subscribeEvents } from '../lib/api';
 
 const navItems = [
   { icon: LayoutDashboard, label: 'Dashboard', path: '/', roles: null },
@@ -72,53 +72,35 @@ export const MainLayout = () => {
       }
     }).catch(() => {});
 
-    // Load notifications
+    // Load notifications, then follow the alert feed pushed by the server
     loadNotifications();
+    return subscribeEvents('alerts', (feed) => setNotifications(toNotifications(feed)));
   }, []);
 
-  const loadNotifications = async () => {
-    try {
-      // Get services expiring soon
-      const servicesRes = await api.get('/external-services');
-      const services = servicesRes.data || [];
-      
-      const today = new Date();
-      const notifs = [];
-
-      // Check for services expiring in 30 days
-      services.forEach(svc => {
-        if (svc.renewal_date) {
-          const renewalDate = new Date(svc.renewal_date);
-          const daysUntil = Math.ceil((renewalDate - today) / (1000 * 60 * 60 * 24));
-          
-          if (daysUntil <= 30 && daysUntil >= 0) {
-            notifs.push({
-              id: svc.id,
-              type: daysUntil <= 7 ? 'warning' : 'info',
-              title: `Servicio por renovar`,
-              message: `${svc.provider} (${svc.service_type}) vence en ${daysUntil} días`,
-              date: svc.renewal_date
-            });
-          }
-        }
+  const toNotifications = (feed) => {
+    const notifs = feed.expiring_services.map(svc => ({
+      id: svc.id,
+      type: svc.days_until <= 7 ? 'warning' : 'info',
+      title: `Servicio por renovar`,
+      message: `${svc.provider} (${svc.service_type}) vence en ${svc.days_until} días`,
+      date: svc.renewal_date
+    }));
+    if (feed.pending_maintenance.length > 0) {
+      notifs.push({
+        id: 'maint-pending',
+        type: 'info',
+        title: 'Mantenimientos pendientes',
+        message: `Tienes ${feed.pending_maintenance.length} mantenimiento(s) sin finalizar`,
+        date: feed.updated_at
       });
+    }
+    return notifs;
+  };
 
-      // Get maintenance logs pending
-      const maintRes = await api.get('/maintenance-logs');
-      const maintenances = maintRes.data || [];
-      
-      const pendingMaint = maintenances.filter(m => m.status === 'Pendiente' || m.status === 'En Proceso');
-      if (pendingMaint.length > 0) {
-        notifs.push({
-          id: 'maint-pending',
-          type: 'info',
-          title: 'Mantenimientos pendientes',
-          message: `Tienes ${pendingMaint.length} mantenimiento(s) sin finalizar`,
-          date: new Date().toISOString()
-        });
-      }
-
-      setNotifications(notifs);
+  const loadNotifications = async () => {
+    try {
+      const res = await notificationsAPI.check();
+      setNotifications(toNotifications(res.data));
     } catch (error) {
       console.error('Error loading notifications:', error);
     }
@@ -24,6 +24,32 @@ api.interceptors.response.use(
   }
 );
 
+// One server-sent events connection per tab, shared by every subscriber.
+// Kinds: tickets, maintenance, alerts. A tickets/maintenance event with action 'resync' means some
+// events were missed and the data should be refetched; alerts events always carry the whole feed.
+// EventSource cannot send headers, so the token goes in the URL.
+let eventSource = null;
+let eventListeners = 0;
+
+export const subscribeEvents = (kind, handler) => {
+  if (!eventSource) {
+    const token = encodeURIComponent(localStorage.getItem('token') || '');
+    eventSource = new EventSource(`${API_URL}/events/stream?token=${token}`);
+  }
+  const source = eventSource;
+  const listener = (e) => handler(JSON.parse(e.data));
+  source.addEventListener(kind, listener);
+  eventListeners += 1;
+  return () => {
+    source.removeEventListener(kind, listener);
+    eventListeners -= 1;
+    if (eventListeners === 0) {
+      source.close();
+      eventSource = null;
+    }
+  };
+};
+
 export const authAPI = {
   login: (data) => api.post('/auth/login', data),
   getMe: () => api.get('/auth/me'),
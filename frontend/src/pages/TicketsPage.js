@@ -1,5 +1,5 @@
-import { useState, useEffect } from 'react';
-import { ticketsAPI, equipmentAPI, usersAPI } from '../lib/api';
+import { useState, useEffect, useRef } from 'react';
+import { ticketsAPI, equipmentAPI, usersAPI, subscribeEvents } from '../lib/api';
 import api from '../lib/api';
 import { useAuth } from '../context/AuthContext';
 import { Button } from '../components/ui/button';
@@ -406,6 +406,20 @@ export default function TicketsPage() {
 
   useEffect(() => { fetchData(); }, [filterStatus, filterPriority]);
 
+  // Pushed ticket changes reload the list and stats with the current filters
+  const refreshTicketsRef = useRef(null);
+  refreshTicketsRef.current = async () => {
+    const params = {};
+    if (filterStatus) params.status = filterStatus;
+    if (filterPriority) params.priority = filterPriority;
+    try {
+      const [ticketsRes, statsRes] = await Promise.all([ticketsAPI.getAll(params), ticketsAPI.getStats()]);
+      setTickets(ticketsRes.data);
+      setStats(statsRes.data);
+    } catch {}
+  };
+  useEffect(() => subscribeEvents('tickets', () => refreshTicketsRef.current()), []);
+
   const fetchData = async () => {
     try {
       const params = {};